@@ -103,6 +103,7 @@ def download():
 @click.option('--upscaler', '-U', default='x4')
 @click.option('--binary_data', '-b', default='')
 @click.option('--strength', '-Z', default=None)
+@click.option('--images', '-n', default=1, help='images per request, one pipeline pass')
 def enqueue(
     reward: str,
     jobs: int,
@@ -110,6 +111,7 @@ def enqueue(
 ):
     import trio
     from leap.cleos import CLEOS
+    from skynet.frontend import diffuse_request_body
 
     config = load_skynet_toml()
 
@@ -130,15 +132,15 @@ def enqueue(
     else:
         kwargs['strength'] = float(kwargs['strength'])
 
+    # same bounds as the frontends, workers reject requests past them
+    kwargs['images'] = max(min(int(kwargs['images']), MAX_IMAGES), 1)
+
     async def enqueue_n_jobs():
         for i in range(jobs):
             if not kwargs['seed']:
                 kwargs['seed'] = random.randint(0, 10e9)
 
-            req = json.dumps({
-                'method': 'diffuse',
-                'params': kwargs
-            })
+            req = json.dumps(diffuse_request_body(kwargs))
 
             res = await cleos.a_push_action(
                 'telos.gpu',
@@ -62,6 +62,7 @@ config is individual to each user!
 /config upscaler [off/x4] - enable/disable x4 size upscaler
 /config guidance NUMBER - prompt text importance
 /config strength NUMBER - importance of the input image for img2img
+/config images NUMBER - variations per request, 1 to 4
 '''
 
 UNKNOWN_CMD_TEXT = 'Unknown command! Try sending \"/help\"'
@@ -152,6 +153,7 @@ MAX_STEP = 100
 MAX_WIDTH = 1024
 MAX_HEIGHT = 1024
 MAX_GUIDANCE = 20
+MAX_IMAGES = 4
 
 DEFAULT_SEED = None
 DEFAULT_WIDTH = 1024
@@ -163,6 +165,7 @@ DEFAULT_CREDITS = 10
 DEFAULT_MODEL = list(MODELS.keys())[-1]
 DEFAULT_ROLE = 'pleb'
 DEFAULT_UPSCALER = None
+DEFAULT_IMAGES = 1
 
 DEFAULT_CONFIG_PATH = 'skynet.toml'
 
@@ -180,7 +183,8 @@ CONFIG_ATTRS = [
     'seed',
     'guidance',
     'strength',
-    'upscaler'
+    'upscaler',
+    'images'
 ]
 
 DEFAULT_EXPLORER_DOMAIN = 'explorer.skygpu.net'
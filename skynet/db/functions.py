@@ -44,6 +44,7 @@ CREATE TABLE IF NOT EXISTS skynet.user_config(
     strength DECIMAL NOT NULL,
     upscaler VARCHAR(128),
     autoconf BOOLEAN DEFAULT TRUE,
+    images INT NOT NULL DEFAULT 1,
     CONSTRAINT fk_config
       FOREIGN KEY(id)
         REFERENCES skynet.user(id)
@@ -175,6 +176,9 @@ async def open_database_connection(
         if not col_check:
             await conn.execute('alter table skynet.user_config add column autoconf boolean default true;')
 
+        await conn.execute(
+            'alter table skynet.user_config add column if not exists images int not null default 1;')
+
     async def _db_call(method: str, *args, **kwargs):
         method = getattr(db, method)
 
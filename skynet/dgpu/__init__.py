@@ -2,18 +2,43 @@
 
 import trio
 
-from hypercorn.config import Config
-from hypercorn.trio import serve
+from skynet.constants import DEFAULT_SINGLE_CARD_MAP
 
-from skynet.dgpu.compute import SkynetMM
-from skynet.dgpu.daemon import SkynetDGPUDaemon
-from skynet.dgpu.network import SkynetGPUConnector
 
+async def open_dgpu_node(config: dict, conn = None):
+    # heavy imports here so the dgpu submodules with pure scheduling logic
+    # can be used without the cuda stack
+    from hypercorn.config import Config
+    from hypercorn.trio import serve
 
-async def open_dgpu_node(config: dict):
-    conn = SkynetGPUConnector(config)
-    mm = SkynetMM(config)
-    daemon = SkynetDGPUDaemon(mm, conn, config)
+    from skynet.dgpu.daemon import SkynetDGPUDaemon
+    from skynet.dgpu.network import SkynetGPUConnector
+
+    devices = [DEFAULT_SINGLE_CARD_MAP]
+    if 'devices' in config:
+        devices = config['devices']
+
+    backend = 'sync-on-thread'
+    if 'backend' in config:
+        backend = config['backend']
+
+    if not conn:
+        conn = SkynetGPUConnector(config)
+    match backend:
+        case 'process':
+            from skynet.dgpu.backend import SkynetProcessBackend
+            mms = [
+                SkynetProcessBackend(config, device=device)
+                for device in devices
+            ]
+            for mm in mms:
+                mm.start()
+
+        case _:
+            from skynet.dgpu.compute import SkynetMM
+            mms = [SkynetMM(config, device=device) for device in devices]
+
+    daemon = SkynetDGPUDaemon(mms, conn, config)
 
     api = None
     if 'api_bind' in config:
@@ -21,10 +46,24 @@ async def open_dgpu_node(config: dict):
         api_conf.bind = [config['api_bind']]
         api = await daemon.generate_api()
 
-    async with trio.open_nursery() as n:
-        n.start_soon(daemon.snap_updater_task)
+    try:
+        async with trio.open_nursery() as n:
+            n.start_soon(daemon.warmup_task)
+            n.start_soon(daemon.snap_updater_task)
+            n.start_soon(daemon.prefetch_task)
+            n.start_soon(daemon.preload_task)
+            n.start_soon(daemon.publish_task)
+            n.start_soon(daemon.outbox_task)
+
+            if api:
+                n.start_soon(serve, api, api_conf)
+
+            await daemon.serve_forever()
 
-        if api:
-            n.start_soon(serve, api, api_conf)
+    finally:
+        # cost model writes are throttled, keep the last observations
+        daemon.scheduler.save()
 
-        await daemon.serve_forever()
+        if backend == 'process':
+            for mm in mms:
+                mm.close()
@@ -0,0 +1,326 @@
+#!/usr/bin/python
+
+import logging
+import multiprocessing as mp
+
+from array import array
+from multiprocessing.shared_memory import SharedMemory
+
+from skynet.constants import MODELS, DEFAULT_SINGLE_CARD_MAP
+from skynet.dgpu.model_cache import fits_spare
+from skynet.dgpu.errors import DGPUComputeError, DGPUInferenceCancelled
+
+
+def _loaded_models(mm) -> list[tuple[str, bool]]:
+    return [
+        (model, image)
+        for model in MODELS
+        for image in (False, True)
+        if mm.is_model_loaded(model, image)
+    ]
+
+
+def _job_stats(mm) -> dict:
+    return {
+        'last_timings': getattr(mm, 'last_timings', array('d')),
+        'last_encode_time': getattr(mm, 'last_encode_time', 0),
+        'vram_used': mm.vram_used() if hasattr(mm, 'vram_used') else 0,
+        'model_cache': mm.cache_stats() if hasattr(mm, 'cache_stats') else {}
+    }
+
+
+def _share(output: bytes) -> str:
+    # the parent copies the output out & unlinks the segment
+    shm = SharedMemory(create=True, size=max(len(output), 1))
+    shm.buf[:len(output)] = output
+    shm.close()
+    return shm.name
+
+
+def _unshare(shm_name: str, size: int) -> bytes:
+    shm = SharedMemory(name=shm_name)
+    try:
+        return bytes(shm.buf[:size])
+
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _worker_main(conn, cancel_event, mm_factory, config: dict, device: str):
+    if not mm_factory:
+        from skynet.dgpu.compute import SkynetMM
+        mm_factory = SkynetMM
+
+    mm = mm_factory(config, device=device)
+    conn.send(('ready', _loaded_models(mm)))
+
+    while True:
+        try:
+            cmd, *args = conn.recv()
+
+        except EOFError:
+            return
+
+        # a bad message fails that call only, never the worker
+        try:
+            match cmd:
+                case 'warmup':
+                    if hasattr(mm, 'warmup'):
+                        mm.warmup()
+
+                    conn.send(('done', _loaded_models(mm)))
+
+                case 'load':
+                    model, image = args
+                    mm.load_model(model, image)
+                    conn.send((
+                        'loaded',
+                        _job_stats(mm)['model_cache'],
+                        _loaded_models(mm)
+                    ))
+
+                case 'verify':
+                    model, max_size = args
+                    sizes = mm.verify_batching(model, max_size)
+                    conn.send(('ok', sizes, _loaded_models(mm)))
+
+                case 'batch':
+                    jobs, = args
+                    outputs = mm.compute_batch(jobs, cancel_event=cancel_event)
+                    conn.send((
+                        'ok',
+                        [
+                            (output_hash, _share(output), len(output))
+                            for output_hash, output in outputs
+                        ],
+                        _job_stats(mm),
+                        _loaded_models(mm)
+                    ))
+
+                case 'compute':
+                    request_id, method, params, input_type, binary = args
+                    output_hash, output = mm.compute_one(
+                        request_id, method, params,
+                        input_type=input_type,
+                        binary=binary,
+                        cancel_event=cancel_event
+                    )
+
+                    # hand the output back through shared memory
+                    conn.send((
+                        'ok', output_hash, _share(output), len(output),
+                        _job_stats(mm),
+                        _loaded_models(mm)
+                    ))
+
+                case _:
+                    conn.send((
+                        'error', f'Unknown command {cmd}', _loaded_models(mm)))
+
+        except DGPUInferenceCancelled as e:
+            conn.send(('cancelled', str(e), _loaded_models(mm)))
+
+        except BaseException as e:
+            conn.send(('error', str(e), _loaded_models(mm)))
+
+
+# runs a model manager in a dedicated worker process, exposes the same
+# `device`, `is_model_loaded`, `warmup`, `load_model` & blocking
+# `compute_one` / `compute_batch` surface as SkynetMM so the daemon can dispatch to it from a
+# thread, a crashed worker fails the job it was on and gets restarted on the
+# next one
+class SkynetProcessBackend:
+
+    def __init__(
+        self,
+        config: dict,
+        device: str = DEFAULT_SINGLE_CARD_MAP,
+        mm_factory = None
+    ):
+        self.config = config
+        self.device = device
+        self.mm_factory = mm_factory
+
+        self._ctx = mp.get_context('spawn')
+        self._proc = None
+        self._conn = None
+        self._ready = False
+        self._cancel = self._ctx.Event()
+        self._loaded = set()
+
+        self.last_timings = array('d')
+        self.last_encode_time = 0
+        self._vram_used = 0
+        self._cache_stats = {}
+
+        # as verified on the worker, it runs unbatched again after a restart
+        self.batch_sizes = {}
+
+        self.restarts = 0
+
+    def start(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        self._proc = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                child_conn, self._cancel,
+                self.mm_factory, self.config, self.device
+            ),
+            daemon=True
+        )
+        self._proc.start()
+        child_conn.close()
+
+        self._conn = parent_conn
+        self._ready = False
+        logging.info(f'started compute worker {self._proc.pid} for {self.device}')
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+        if self._proc:
+            self._proc.kill()
+            self._proc.join()
+            self._proc = None
+
+    def restart(self):
+        logging.warning(f'restarting compute worker for {self.device}')
+        self.close()
+        self.restarts += 1
+        self.batch_sizes = {}
+        self.start()
+
+    @property
+    def is_alive(self) -> bool:
+        return bool(self._proc and self._proc.is_alive())
+
+    def is_model_loaded(self, model: str, image: bool) -> bool:
+        return (model, image) in self._loaded
+
+    def loaded_models(self) -> list[tuple[str, bool]]:
+        return list(self._loaded)
+
+    def vram_used(self) -> int:
+        # as last reported by the worker
+        return self._vram_used
+
+    def cache_stats(self) -> dict:
+        return self._cache_stats
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _recv(self):
+        try:
+            return self._conn.recv()
+
+        except (EOFError, OSError):
+            self.restart()
+            raise DGPUComputeError(f'compute worker for {self.device} crashed')
+
+    def _send(self, msg: tuple):
+        if not self.is_alive:
+            self.restart()
+
+        if not self._ready:
+            _, loaded = self._recv()
+            self._loaded = set(loaded)
+            self._ready = True
+
+        try:
+            self._conn.send(msg)
+
+        except (BrokenPipeError, OSError):
+            self.restart()
+            raise DGPUComputeError(f'compute worker for {self.device} crashed')
+
+        status, *result = self._recv()
+        self._loaded = set(result[-1])
+        return status, result
+
+    def _call(self, *msg):
+        status, result = self._send(msg)
+        if status == 'error':
+            raise DGPUComputeError(result[0])
+
+    def warmup(self):
+        self._call('warmup')
+
+    def load_model(self, model_name: str, image: bool):
+        status, result = self._send(('load', model_name, image))
+        if status == 'error':
+            raise DGPUComputeError(result[0])
+
+        self._cache_stats = result[0]
+
+    def verify_batching(self, model_name: str, max_size: int) -> list[int]:
+        status, result = self._send(('verify', model_name, max_size))
+        if status == 'error':
+            raise DGPUComputeError(result[0])
+
+        self.batch_sizes[model_name] = result[0]
+        return result[0]
+
+    def can_preload(self, model_name: str, image: bool) -> bool:
+        # as of the last cache figures the worker reported
+        return fits_spare(self._cache_stats, model_name, image)
+
+    def _update_stats(self, stats: dict):
+        self.last_timings = stats['last_timings']
+        self.last_encode_time = stats['last_encode_time']
+        self._vram_used = stats['vram_used']
+        self._cache_stats = stats['model_cache']
+
+    def compute_one(
+        self,
+        request_id: int,
+        method: str,
+        params: dict,
+        input_type: str = 'png',
+        binary = None
+    ):
+        try:
+            status, result = self._send(
+                ('compute', request_id, method, params, input_type, binary))
+
+        finally:
+            # a cancel only lives as long as the job it was meant for,
+            # clearing it on start would drop one sent right before
+            self._cancel.clear()
+
+        match status:
+            case 'ok':
+                output_hash, shm_name, size, stats, _ = result
+                self._update_stats(stats)
+                return output_hash, _unshare(shm_name, size)
+
+            case 'cancelled':
+                raise DGPUInferenceCancelled(result[0])
+
+            case _:
+                raise DGPUComputeError(result[0])
+
+    def compute_batch(self, jobs: list[tuple[int, dict]]) -> list[tuple[str, bytes]]:
+        try:
+            status, result = self._send(('batch', jobs))
+
+        finally:
+            self._cancel.clear()
+
+        match status:
+            case 'ok':
+                outputs, stats, _ = result
+                self._update_stats(stats)
+                return [
+                    (output_hash, _unshare(shm_name, size))
+                    for output_hash, shm_name, size in outputs
+                ]
+
+            case 'cancelled':
+                raise DGPUInferenceCancelled(result[0])
+
+            case _:
+                raise DGPUComputeError(result[0])
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+
+import io
+import logging
+import zipfile
+
+from skynet.dgpu.errors import DGPUComputeError
+
+
+# claim one request at a time
+DEFAULT_BATCH_SIZE = 1
+
+
+def batch_key(entry: dict) -> tuple | None:
+    '''
+    Requests with the same key can run on one pipeline call, only prompt &
+    seed may differ, None for requests that always run alone (img2img)
+    '''
+    body = entry['body']
+    params = body['params']
+    if body['method'] != 'diffuse' or entry['req']['binary_data']:
+        return None
+
+    try:
+        return (
+            entry['model'],
+            int(params['width']),
+            int(params['height']),
+            int(params['step']),
+            float(params['guidance']),
+            params['upscaler'] if 'upscaler' in params else None,
+            params['output_type'] if 'output_type' in params else 'png'
+        )
+
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# a small txt2img job, run batched & one by one for every model on every
+# device on warmup
+BATCH_CHECK_PARAMS = {
+    'prompt': 'skynet',
+    'width': 512,
+    'height': 512,
+    'step': 4,
+    'guidance': 7.5,
+    'upscaler': None
+}
+
+
+def verify_batch_sizes(mm, model: str, max_size: int) -> list[int]:
+    '''
+    Batch sizes from 2 to `max_size` that are safe for `model` on `mm`, a
+    size is safe if a pipeline call of that many samples gives the same
+    output hashes as running them one by one, sizes that fail to run (out
+    of memory) aren't
+    '''
+    jobs = [
+        (i, {**BATCH_CHECK_PARAMS, 'model': model, 'seed': i})
+        for i in range(max_size)
+    ]
+    single = [
+        mm.compute_one(rid, 'diffuse', params, input_type='none', binary=b'')[0]
+        for rid, params in jobs
+    ]
+
+    sizes = []
+    for size in range(2, max_size + 1):
+        try:
+            batched = [
+                output_hash
+                for output_hash, _ in mm.compute_batch(jobs[:size], sizes=[size])
+            ]
+
+        except (Exception, DGPUComputeError) as e:
+            logging.warning(f'batch of {size} failed for {model}: {e}')
+            continue
+
+        if batched == single[:size]:
+            sizes.append(size)
+
+    return sizes
+
+
+def batch_chunks(count: int, sizes, limit: int) -> list[int]:
+    '''
+    Split `count` samples in pipeline calls, only batch `sizes` verified to
+    match the unbatched outputs no bigger than `limit` are used, biggest
+    first, the rest run one sample per call
+
+    outputs don't depend on the split, a worker with less free vram still
+    gets the same hashes as everyone else
+    '''
+    usable = sorted((size for size in sizes if 1 < size <= limit), reverse=True)
+
+    chunks = []
+    while count > 0:
+        size = next((size for size in usable if size <= count), 1)
+        chunks.append(size)
+        count -= size
+
+    return chunks
+
+
+def pick_batch(first: dict, candidates, size: int, claimable) -> list[dict]:
+    '''
+    Up to `size - 1` entries from `candidates` (best first) that can share
+    a batch with `first` & pass `claimable(entry)`
+    '''
+    key = batch_key(first)
+    if key is None:
+        return []
+
+    picked = []
+    for entry in candidates:
+        if len(picked) >= size - 1:
+            break
+
+        if (entry['id'] != first['id'] and
+            batch_key(entry) == key and
+            claimable(entry)):
+            picked.append(entry)
+
+    return picked
+
+
+# 'diffuse_batch' outputs, every image of the request on a stored zip with
+# fixed names & timestamps so equal images always hash the same
+
+def batch_seeds(params: dict) -> list[int]:
+    if 'seeds' in params:
+        return [int(seed) for seed in params['seeds']]
+
+    return [int(params['seed']) + i for i in range(int(params['num_images']))]
+
+
+def image_name(index: int) -> str:
+    return f'image-{index}.png'
+
+
+def pack_images(images: list[bytes]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as archive:
+        for i, image in enumerate(images):
+            archive.writestr(
+                zipfile.ZipInfo(image_name(i), date_time=(1980, 1, 1, 0, 0, 0)),
+                image
+            )
+
+    return buf.getvalue()
+
+
+def unpack_images(raw: bytes) -> dict[str, bytes]:
+    with zipfile.ZipFile(io.BytesIO(raw)) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def output_type_for(method: str, params: dict) -> str:
+    if method == 'diffuse_batch':
+        return 'zip'
+
+    return params['output_type'] if 'output_type' in params else 'png'
@@ -3,22 +3,37 @@
 # Skynet Memory Manager
 
 import gc
+import time
 import logging
 
+from array import array
+
 from hashlib import sha256
-import zipfile
 from PIL import Image
-from diffusers import DiffusionPipeline
+from diffusers import DiffusionPipeline, AutoPipelineForImage2Image
 
-import trio
 import torch
 
-from skynet.constants import DEFAULT_INITAL_MODELS, MODELS
+from skynet.constants import DEFAULT_SINGLE_CARD_MAP, MODELS
 from skynet.dgpu.errors import DGPUComputeError, DGPUInferenceCancelled
+from skynet.dgpu.model_cache import SkynetModelCache
+from skynet.dgpu.batch import (
+    batch_chunks,
+    batch_seeds,
+    pack_images,
+    verify_batch_sizes
+)
 
 from skynet.utils import crop_image, convert_from_cv2_to_image, convert_from_image_to_cv2, convert_from_img_to_bytes, init_upscaler, pipeline_for
 
 
+DEFAULT_VRAM_RESERVE = 2
+
+# GB of activations a 512x512 sample takes on top of the weights while
+# batching, guidance doubles the batch on the unet so this covers both
+BATCH_SAMPLE_MEM = 0.75
+
+
 def prepare_params_for_diffuse(
     params: dict,
     input_type: str,
@@ -35,6 +50,9 @@ def prepare_params_for_diffuse(
                 _params['strength'] = float(params['strength'])
 
             case 'none':
+                # daemon txt2img jobs (binary=b'') run at the pipeline's
+                # default size, passing width & height here would change
+                # outputs & hashes vs every other worker
                 ...
 
             case _:
@@ -48,7 +66,8 @@ def prepare_params_for_diffuse(
         params['prompt'],
         float(params['guidance']),
         int(params['step']),
-        torch.manual_seed(int(params['seed'])),
+        # own generator per job, the global one is shared between devices
+        torch.Generator().manual_seed(int(params['seed'])),
         params['upscaler'] if 'upscaler' in params else None,
         _params
     )
@@ -56,88 +75,192 @@ def prepare_params_for_diffuse(
 
 class SkynetMM:
 
-    def __init__(self, config: dict):
-        self.upscaler = init_upscaler()
-        self.initial_models = (
-            config['initial_models']
-            if 'initial_models' in config else DEFAULT_INITAL_MODELS
-        )
+    def __init__(self, config: dict, device: str = DEFAULT_SINGLE_CARD_MAP):
+        # nothing is loaded here, see `warmup` & `load_model`
+        self.device = device
+        self.upscaler = None
 
         self.cache_dir = None
         if 'hf_home' in config:
             self.cache_dir = config['hf_home']
 
-        self._models = {}
-        for model in self.initial_models:
-            self.load_model(model, False, force=True)
+        self.last_timings = array('d')
+        self.last_encode_time = 0
+
+        # model -> batch sizes whose outputs were checked against unbatched
+        # runs on this device, anything else runs one sample per call
+        self.batch_sizes = {}
+
+        # GB kept free for activations, vae decode & the upscaler
+        vram_reserve = DEFAULT_VRAM_RESERVE
+        if 'vram_reserve' in config:
+            vram_reserve = config['vram_reserve']
+
+        # GB of device memory pipelines may take, defaults to the whole card
+        # minus the reserve
+        self.vram_budget = None
+        if 'vram_budget' in config:
+            self.vram_budget = config['vram_budget']
+
+        else:
+            total = torch.cuda.mem_get_info(device)[1] / (10 ** 9)
+            self.vram_budget = max(total - vram_reserve, 0)
+
+        # GB of host memory evicted pipelines can be parked on, 0 disables
+        ram_budget = 0
+        if 'ram_budget' in config:
+            ram_budget = config['ram_budget']
+
+        # weights are cached once per model, the img2img pipeline of a model
+        # is derived from its txt2img one & shares every component with it,
+        # model name -> (txt2img pipe it was derived from, img2img pipe)
+        self._img2img = {}
+
+        # models whose pipeline runs over its memory requirement, those get
+        # vae slicing & tiling, which `pipeline_for` never applied to img2img
+        # pipelines, the derived pipe shares the vae so it is set per call
+        self._tiled_vae = set()
+
+        self.cache = SkynetModelCache(
+            self.vram_budget,
+            load=self._load_pipe,
+            unload=self._release_memory,
+            ram_budget=ram_budget,
+            offload=self._offload_pipe,
+            promote=self._promote_pipe
+        )
+
+    def warmup(self):
+        if not self.upscaler:
+            self.upscaler = init_upscaler(device=self.device)
 
     def log_debug_info(self):
         logging.info('memory summary:')
-        logging.info('\n' + torch.cuda.memory_summary())
+        logging.info('\n' + torch.cuda.memory_summary(self.device))
+
+    def loaded_models(self) -> list[tuple[str, bool]]:
+        return self.cache.keys()
+
+    def vram_used(self) -> int:
+        return torch.cuda.memory_allocated(self.device)
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats()
 
     def is_model_loaded(self, model_name: str, image: bool):
-        for model_key, model_data in self._models.items():
-            if (model_key == model_name and
-                model_data['image'] == image):
-                return True
+        # both variants run on the same weights
+        return (model_name, False) in self.cache
+
+    def _load_pipe(self, model_name: str, image: bool):
+        logging.info(f'loading model {model_name} on {self.device}...')
+        before = torch.cuda.memory_allocated(self.device)
+        pipe = pipeline_for(
+            model_name, image=image, cache_dir=self.cache_dir,
+            device=self.device)
+
+        # cpu offloaded pipelines barely allocate anything up front, keep
+        # the configured size for those
+        size = (torch.cuda.memory_allocated(self.device) - before) / (10 ** 9)
+        logging.info(f'loaded model {model_name}, {size:.2f} GB')
+
+        if getattr(pipe.vae, 'use_tiling', False):
+            self._tiled_vae.add(model_name)
+
+        return pipe, size if size >= MODELS[model_name]['mem'] / 2 else None
+
+    def _release_memory(self, evicted: list[tuple[str, bool]]):
+        logging.info(f'swapped out {evicted} on {self.device}')
+        # cheap to derive again, holding on to them would pin the weights
+        for model_name, _ in evicted:
+            self._img2img.pop(model_name, None)
+            self._tiled_vae.discard(model_name)
+
+        gc.collect()
+        with torch.cuda.device(self.device):
+            torch.cuda.empty_cache()
 
-        return False
+    def _offload_pipe(self, pipe: DiffusionPipeline) -> DiffusionPipeline | None:
+        # pipelines running with cpu offload hooks can't be moved around
+        if pipe.device.type != 'cuda':
+            return None
 
-    def load_model(
-        self,
-        model_name: str,
-        image: bool,
-        force=False
-    ):
-        logging.info(f'loading model {model_name}...')
-        if force or len(self._models.keys()) == 0:
-            pipe = pipeline_for(
-                model_name, image=image, cache_dir=self.cache_dir)
+        pipe = pipe.to('cpu')
 
-            self._models[model_name] = {
-                'pipe': pipe,
-                'generated': 0,
-                'image': image
-            }
+        # pinned pages make the copy back to the card a plain dma transfer
+        for component in pipe.components.values():
+            if isinstance(component, torch.nn.Module):
+                for param in component.parameters():
+                    param.data = param.data.pin_memory()
 
-        else:
-            least_used = list(self._models.keys())[0]
+        return pipe
 
-            for model in self._models:
-                if self._models[
-                    least_used]['generated'] > self._models[model]['generated']:
-                    least_used = model
+    def _promote_pipe(self, pipe: DiffusionPipeline) -> DiffusionPipeline:
+        logging.info(f'promoting pipeline back to {self.device}')
+        return pipe.to(self.device)
 
-            del self._models[least_used]
+    def _pipe_for(self, model_name: str, image: bool) -> DiffusionPipeline:
+        pipe = self.cache.get(model_name, False)
+        if model_name in self._tiled_vae:
+            if image:
+                pipe.vae.disable_slicing()
+                pipe.vae.disable_tiling()
 
-            logging.info(f'swapping model {least_used} for {model_name}...')
+            else:
+                pipe.vae.enable_slicing()
+                pipe.vae.enable_tiling()
 
-            gc.collect()
-            torch.cuda.empty_cache()
+        if not image:
+            return pipe
 
-            pipe = pipeline_for(
-                model_name, image=image, cache_dir=self.cache_dir)
+        derived = self._img2img.get(model_name)
+        if not derived or derived[0] is not pipe:
+            logging.info(f'deriving img2img pipeline for {model_name}')
+            derived = (pipe, AutoPipelineForImage2Image.from_pipe(pipe))
+            self._img2img[model_name] = derived
 
-            self._models[model_name] = {
-                'pipe': pipe,
-                'generated': 0,
-                'image': image
-            }
+        return derived[1]
 
-        logging.info(f'loaded model {model_name}')
-        return pipe
+    def load_model(self, model_name: str, image: bool):
+        return self._pipe_for(model_name, image)
+
+    def can_preload(self, model_name: str, image: bool) -> bool:
+        # only into spare vram, never evicts something in use for a guess
+        return self.cache.fits_spare(model_name, False)
 
     def get_model(self, model_name: str, image: bool) -> DiffusionPipeline:
         if model_name not in MODELS:
             raise DGPUComputeError(f'Unknown model {model_name}')
 
-        if not self.is_model_loaded(model_name, image):
-            pipe = self.load_model(model_name, image=image)
+        return self._pipe_for(model_name, image)
 
-        else:
-            pipe = self._models[model_name]['pipe']
+    def verify_batching(self, model_name: str, max_size: int) -> list[int]:
+        sizes = verify_batch_sizes(self, model_name, max_size)
+        self.batch_sizes[model_name] = sizes
+        return sizes
 
-        return pipe
+    def max_batch_size(self, width: int, height: int) -> int:
+        free = torch.cuda.mem_get_info(self.device)[0] / (10 ** 9)
+        per_sample = BATCH_SAMPLE_MEM * (width * height) / (512 * 512)
+        return max(int(free // per_sample), 1)
+
+    def _encode(self, output: Image, output_type: str, upscaler: str | None) -> bytes:
+        match output_type:
+            case 'png':
+                if upscaler == 'x4':
+                    self.warmup()
+                    input_img = output.convert('RGB')
+                    up_img, _ = self.upscaler.enhance(
+                        convert_from_image_to_cv2(input_img), outscale=4)
+
+                    output = convert_from_cv2_to_image(up_img)
+
+                encode_start = time.time()
+                output_binary = convert_from_img_to_bytes(output)
+                self.last_encode_time = time.time() - encode_start
+                return output_binary
+
+            case _:
+                raise DGPUComputeError(f'Unsupported output type: {output_type}')
 
     def compute_one(
         self,
@@ -145,14 +268,20 @@ class SkynetMM:
         method: str,
         params: dict,
         input_type: str = 'png',
-        binary: bytes | None = None
+        binary: bytes | None = None,
+        cancel_event = None
     ):
+        # per step timestamps, preallocated once the step count is known so
+        # the step callback only does an index store & a flag read
+        timings = None
+
         def maybe_cancel_work(step, *args, **kwargs):
-            if self._should_cancel:
-                should_raise = trio.from_thread.run(self._should_cancel, request_id)
-                if should_raise:
-                    logging.warn(f'cancelling work at step {step}')
-                    raise DGPUInferenceCancelled()
+            if timings is not None:
+                timings[step + 1] = time.monotonic()
+
+            if cancel_event and cancel_event.is_set():
+                logging.warn(f'cancelling work at step {step}')
+                raise DGPUInferenceCancelled()
 
         maybe_cancel_work(0)
 
@@ -162,6 +291,7 @@ class SkynetMM:
 
         output = None
         output_hash = None
+        output_binary = None
         try:
             match method:
                 case 'diffuse':
@@ -170,6 +300,8 @@ class SkynetMM:
                     prompt, guidance, step, seed, upscaler, extra_params = arguments
                     model = self.get_model(params['model'], 'image' in extra_params)
 
+                    timings = array('d', bytes(8 * (step + 1)))
+                    timings[0] = time.monotonic()
                     output = model(
                         prompt,
                         guidance_scale=guidance,
@@ -180,31 +312,135 @@ class SkynetMM:
                         **extra_params
                     ).images[0]
 
-                    output_binary = b''
-                    match output_type:
-                        case 'png':
-                            if upscaler == 'x4':
-                                input_img = output.convert('RGB')
-                                up_img, _ = self.upscaler.enhance(
-                                    convert_from_image_to_cv2(input_img), outscale=4)
-
-                                output = convert_from_cv2_to_image(up_img)
-
-                            output_binary = convert_from_img_to_bytes(output)
+                    self.last_timings = array(
+                        'd', [ts for ts in timings if ts > 0])
 
-                        case _:
-                            raise DGPUComputeError(f'Unsupported output type: {output_type}')
+                    output_binary = self._encode(output, output_type, upscaler)
+                    output_hash = sha256(output_binary).hexdigest()
 
+                case 'diffuse_batch':
+                    # one sample per seed, batched only as far as verified
+                    # so the packed output matches any other worker's
+                    outputs = self.compute_batch(
+                        [
+                            (request_id, {**params, 'seed': seed})
+                            for seed in batch_seeds(params)
+                        ],
+                        cancel_event=cancel_event,
+                        input_type=input_type,
+                        binary=binary
+                    )
+                    output_binary = pack_images(
+                        [output for _, output in outputs])
                     output_hash = sha256(output_binary).hexdigest()
 
                 case _:
                     raise DGPUComputeError('Unsupported compute method')
 
+        except DGPUInferenceCancelled:
+            raise
+
         except BaseException as e:
             logging.error(e)
             raise DGPUComputeError(str(e))
 
         finally:
-            torch.cuda.empty_cache()
+            with torch.cuda.device(self.device):
+                torch.cuda.empty_cache()
+
+        return output_hash, output_binary
+
+    def compute_batch(
+        self,
+        jobs: list[tuple[int, dict]],
+        cancel_event = None,
+        input_type: str = 'none',
+        binary: bytes | None = b'',
+        sizes: list[int] | None = None
+    ) -> list[tuple[str, bytes]]:
+        '''
+        Run `(request_id, params)` jobs that only differ on prompt & seed in
+        as few pipeline calls as the batch sizes verified for the model &
+        vram allow, every sample gets its own generator so its latents &
+        noise match the unbatched run, `sizes` overrides the verified sizes
+        & the vram limit
+        '''
+        timings = None
+
+        def maybe_cancel_work(step, *args, **kwargs):
+            if timings is not None:
+                timings[step + 1] = time.monotonic()
+
+            if cancel_event and cancel_event.is_set():
+                logging.warn(f'cancelling batch at step {step}')
+                raise DGPUInferenceCancelled()
+
+        maybe_cancel_work(0)
+
+        first = jobs[0][1]
+        output_type = 'png'
+        if 'output_type' in first:
+            output_type = first['output_type']
+
+        results = []
+        try:
+            arguments = [
+                prepare_params_for_diffuse(params, input_type, binary=binary)
+                for _, params in jobs
+            ]
+            _, guidance, step, _, upscaler, extra_params = arguments[0]
+            model = self.get_model(first['model'], 'image' in extra_params)
+
+            limit = len(jobs)
+            if sizes is None:
+                sizes = self.batch_sizes.get(first['model'], [])
+                limit = self.max_batch_size(
+                    int(first['width']), int(first['height']))
+
+            chunks = batch_chunks(len(arguments), sizes, limit)
+            logging.info(f'batch of {len(jobs)}, as {chunks}')
+
+            i = 0
+            for size in chunks:
+                chunk = arguments[i:i + size]
+                i += size
+
+                # a single sample gets the exact unbatched call
+                prompts = [args[0] for args in chunk]
+                generators = [args[3] for args in chunk]
+                if size == 1:
+                    prompts = prompts[0]
+                    generators = generators[0]
+
+                timings = array('d', bytes(8 * (step + 1)))
+                timings[0] = time.monotonic()
+                outputs = model(
+                    prompts,
+                    guidance_scale=guidance,
+                    num_inference_steps=step,
+                    generator=generators,
+                    callback=maybe_cancel_work,
+                    callback_steps=1,
+                    **extra_params
+                ).images
+
+                self.last_timings = array(
+                    'd', [ts for ts in timings if ts > 0])
+
+                for output in outputs:
+                    output_binary = self._encode(output, output_type, upscaler)
+                    results.append(
+                        (sha256(output_binary).hexdigest(), output_binary))
+
+        except DGPUInferenceCancelled:
+            raise
+
+        except BaseException as e:
+            logging.error(e)
+            raise DGPUComputeError(str(e))
+
+        finally:
+            with torch.cuda.device(self.device):
+                torch.cuda.empty_cache()
 
-        return output_hash, output
+        return results
@@ -1,9 +1,8 @@
 #!/usr/bin/python
 
-import json
-import random
 import logging
 import time
+import threading
 import traceback
 
 from hashlib import sha256
@@ -15,30 +14,82 @@ import trio
 from quart import jsonify
 from quart_trio import QuartTrio as Quart
 
-from skynet.constants import MODELS, VERSION
+from skynet.ipfs import IPFSClientException
+from skynet.constants import VERSION, DEFAULT_INITAL_MODELS
 
 from skynet.dgpu.errors import *
+from skynet.dgpu.index import SkynetRequestIndex
 from skynet.dgpu.compute import SkynetMM
+from skynet.dgpu.devices import SkynetDevicePool
+from skynet.dgpu.ingest import SkynetQueueIngester, DEFAULT_RESYNC_INTERVAL
 from skynet.dgpu.network import SkynetGPUConnector
+from skynet.dgpu.metrics import (
+    REGISTRY,
+    SNAPSHOT_SECONDS,
+    COMPUTE_SECONDS,
+    ENCODE_SECONDS,
+    PUBLISH_SECONDS,
+    SUBMIT_SECONDS,
+    CLAIMS,
+    CANCELLATIONS,
+    FAILURES,
+    RESULT_CACHE,
+    PRELOADS,
+    PRELOAD_HITS,
+    QUEUE_DEPTH,
+    LOADED_MODELS,
+    VRAM_USED
+)
+from skynet.dgpu.outbox import SkynetOutbox, DEFAULT_OUTBOX_PATH
+from skynet.dgpu.result_cache import (
+    SkynetResultCache,
+    result_key,
+    DEFAULT_RESULT_CACHE_PATH,
+    DEFAULT_RESULT_CACHE_SIZE
+)
+from skynet.dgpu.prefetch import SkynetInputPrefetcher, DEFAULT_PREFETCH_SIZE
+from skynet.dgpu.batch import (
+    pick_batch,
+    output_type_for,
+    DEFAULT_BATCH_SIZE
+)
+from skynet.dgpu.preload import (
+    SkynetModelPreloader,
+    entry_key,
+    DEFAULT_RATE_DECAY
+)
+from skynet.dgpu.throughput import (
+    SkynetThroughputEstimator,
+    DEFAULT_THROUGHPUT_WINDOW
+)
+from skynet.dgpu.scheduler import (
+    QUEUE_WINDOW,
+    SkynetCostModel,
+    SkynetProfitScheduler,
+    SkynetRewardScheduler
+)
 
 
-def convert_reward_to_int(reward_str):
-    int_part, decimal_part = (
-        reward_str.split('.')[0],
-        reward_str.split('.')[1].split(' ')[0]
-    )
-    return int(int_part + decimal_part)
+DEFAULT_PUBLISH_QUEUE_SIZE = 4
+DEFAULT_PUBLISH_WORKERS = 2
+DEFAULT_PUBLISH_RETRIES = 3
+
+DEFAULT_OUTBOX_INTERVAL = 5
+
+DEFAULT_POLL_MIN_INTERVAL = 1
+DEFAULT_POLL_MAX_INTERVAL = 16
 
 
 class SkynetDGPUDaemon:
 
     def __init__(
         self,
-        mm: SkynetMM,
+        mms: list[SkynetMM],
         conn: SkynetGPUConnector,
         config: dict
     ):
-        self.mm = mm
+        # one model manager per device
+        self.devices = SkynetDevicePool(mms)
         self.conn = conn
         self.auto_withdraw = (
             config['auto_withdraw']
@@ -63,45 +114,306 @@ class SkynetDGPUDaemon:
         if 'backend' in config:
             self.backend = config['backend']
 
+        # loaded on every device by `warmup_task`, until all of them are in
+        # only requests for already loaded models are claimed
+        self.initial_models = DEFAULT_INITAL_MODELS
+        if 'initial_models' in config:
+            self.initial_models = config['initial_models']
+
+        self.warming_up = True
+        self._model_states = {
+            mm.device: {model: 'pending' for model in self.initial_models}
+            for mm in mms
+        }
+
+        # how the queue snapshot is kept up to date:
+        #   'snapshot': full table reads every update
+        #   'actions': follow queue actions on hyperion & resync periodically
+        self.ingest = 'snapshot'
+        if 'ingest' in config:
+            self.ingest = config['ingest']
+
+        self.resync_interval = DEFAULT_RESYNC_INTERVAL
+        if 'resync_interval' in config:
+            self.resync_interval = config['resync_interval']
+
+        # snapshot poll interval, backs off while there is nothing to do
+        self.poll_min_interval = DEFAULT_POLL_MIN_INTERVAL
+        if 'poll_min_interval' in config:
+            self.poll_min_interval = config['poll_min_interval']
+
+        self.poll_max_interval = DEFAULT_POLL_MAX_INTERVAL
+        if 'poll_max_interval' in config:
+            self.poll_max_interval = config['poll_max_interval']
+
+        self.poll_interval = self.poll_min_interval
+
         self._snap = {
             'queue': [],
             'requests': {},
             'my_results': []
         }
 
-        self._benchmark = []
-        self._last_benchmark = None
-        self._last_generation_ts = None
+        self._index = SkynetRequestIndex(
+            model_whitelist=self.model_whitelist,
+            model_blacklist=self.model_blacklist
+        )
+
+        self._snap_changed = trio.Event()
+
+        # how candidates are ordered:
+        #   'reward': highest reward first
+        #   'profit': reward per estimated gpu second
+        scheduler = 'reward'
+        if 'scheduler' in config:
+            scheduler = config['scheduler']
+
+        match scheduler:
+            case 'reward':
+                self.scheduler = SkynetRewardScheduler()
+
+            case 'profit':
+                cost_model_path = None
+                if 'cost_model_path' in config:
+                    cost_model_path = config['cost_model_path']
+
+                self.scheduler = SkynetProfitScheduler(
+                    SkynetCostModel(path=cost_model_path),
+                    self.devices.is_model_loaded
+                )
+
+            case _:
+                raise DGPUComputeError(f'Unsupported scheduler {scheduler}')
+
+        # finished outputs waiting to be published & submitted
+        publish_queue_size = DEFAULT_PUBLISH_QUEUE_SIZE
+        if 'publish_queue_size' in config:
+            publish_queue_size = config['publish_queue_size']
+
+        self.publish_workers = DEFAULT_PUBLISH_WORKERS
+        if 'publish_workers' in config:
+            self.publish_workers = config['publish_workers']
+
+        self.publish_retries = DEFAULT_PUBLISH_RETRIES
+        if 'publish_retries' in config:
+            self.publish_retries = config['publish_retries']
+
+        self._publish_send, self._publish_recv = trio.open_memory_channel(
+            publish_queue_size)
+        self._publish_stats = {
+            'submitted': 0,
+            'failed': 0,
+            'retries': 0
+        }
 
-    def _get_benchmark_speed(self) -> float:
-        if not self._last_benchmark:
-            return 0
+        # pending submits & cancels, replayed on restart
+        outbox_path = DEFAULT_OUTBOX_PATH
+        if 'outbox_path' in config:
+            outbox_path = config['outbox_path']
 
-        start = self._last_benchmark[0]
-        end = self._last_benchmark[-1]
+        self.outbox = SkynetOutbox(outbox_path)
 
-        elapsed = end - start
-        its = len(self._last_benchmark)
-        speed = its / elapsed
+        # outputs of previous jobs, same params & input same output
+        result_cache_path = DEFAULT_RESULT_CACHE_PATH
+        if 'result_cache_path' in config:
+            result_cache_path = config['result_cache_path']
 
-        logging.info(f'{elapsed} s total its: {its}, at {speed} it/s ')
+        result_cache_size = DEFAULT_RESULT_CACHE_SIZE
+        if 'result_cache_size' in config:
+            result_cache_size = config['result_cache_size']
 
-        return speed
+        self.result_cache = SkynetResultCache(
+            result_cache_path, max_bytes=result_cache_size)
 
-    async def should_cancel_work(self, request_id: int):
-        self._benchmark.append(time.time())
+        prefetch_size = DEFAULT_PREFETCH_SIZE
+        if 'prefetch_size' in config:
+            prefetch_size = config['prefetch_size']
+
+        self._prefetcher = SkynetInputPrefetcher(conn, size=prefetch_size)
+
+        # requests we are currently working on, their status is always
+        # re-read on snapshot updates so cancellation is not delayed
+        self._in_progress = set()
+
+        # cancel callbacks for the jobs being computed, set from the snapshot
+        # updater, the compute side only ever reads a flag
+        self._cancel_tokens = {}
+
+        # step & job time figures of completed jobs, per model & shape
+        throughput_window = DEFAULT_THROUGHPUT_WINDOW
+        if 'throughput_window' in config:
+            throughput_window = config['throughput_window']
+
+        self.throughput = SkynetThroughputEstimator(window=throughput_window)
+
+        # load the model the queue is most likely to ask for next into spare
+        # vram of an idle device, ahead of claiming anything for it
+        self.preload = True
+        if 'preload' in config:
+            self.preload = config['preload']
+
+        preload_rate_decay = DEFAULT_RATE_DECAY
+        if 'preload_rate_decay' in config:
+            preload_rate_decay = config['preload_rate_decay']
+
+        self.preloader = SkynetModelPreloader(rate_decay=preload_rate_decay)
+
+        # txt2img requests differing only on prompt & seed claimed together
+        # & run as one pipeline call, 1 disables batching, the sizes are
+        # verified per model & device on warmup, models without verified
+        # sizes (or loaded later) run unbatched
+        self.batch_size = DEFAULT_BATCH_SIZE
+        if 'batch_size' in config:
+            self.batch_size = config['batch_size']
+
+        self._last_generation_ts = None
+
+    def _non_compete_on(self, request_id: int) -> bool:
         competitors = set([
             status['worker']
-            for status in self._snap['requests'][request_id]
+            for status in self._snap['requests'].get(request_id, [])
             if status['worker'] != self.account
         ])
         return bool(self.non_compete & competitors)
 
+    def _signal_cancellations(self):
+        for request_id, cancel in list(self._cancel_tokens.items()):
+            if self._non_compete_on(request_id):
+                logging.warning(f'cancelling work on request {request_id}')
+                cancel()
+                del self._cancel_tokens[request_id]
+                CANCELLATIONS.inc()
+
+    def _update_snap(self, snap: dict):
+        self._snap = snap
+        self._index.update(snap)
+        self._signal_cancellations()
+
+        # wake up anyone waiting for work & arm a new event
+        self._snap_changed.set()
+        self._snap_changed = trio.Event()
+
+    def _next_poll_interval(self, snap: dict, known: set[int]) -> float:
+        # new enqueues, poll fast while they are being claimed
+        if any(req['id'] not in known for req in snap['queue']):
+            return self.poll_min_interval
+
+        # jobs in flight we might have to cancel, keep watching them closely
+        if self.non_compete and self._cancel_tokens:
+            return self.poll_min_interval
+
+        # empty queue or no device to run anything on, back off
+        if not snap['queue'] or self.devices.free_count == 0:
+            return min(self.poll_interval * 2, self.poll_max_interval)
+
+        return self.poll_min_interval
+
+    async def _poll_wait(self):
+        # a device freeing up means we want a fresh view of the queue now
+        with trio.move_on_after(self.poll_interval):
+            await self.devices.wait_release()
+            self.poll_interval = self.poll_min_interval
+
+    async def _warmup_device(self, mm):
+        states = self._model_states[mm.device]
+
+        await self.devices.acquire_device(mm)
+        try:
+            await trio.to_thread.run_sync(mm.warmup)
+
+        except (Exception, DGPUComputeError) as e:
+            # not fatal, gets retried when a job needs it
+            logging.error(f'warmup failed on {mm.device}: {e}')
+
+        finally:
+            self.devices.release(mm)
+
+        for model in self.initial_models:
+            # give the device back between loads, it can take jobs for
+            # whatever is ready already
+            states[model] = 'loading'
+            await self.devices.acquire_device(mm)
+            try:
+                await trio.to_thread.run_sync(
+                    partial(mm.load_model, model, False))
+                states[model] = 'ready'
+                logging.info(f'{model} ready on {mm.device}')
+
+            except (Exception, DGPUComputeError) as e:
+                states[model] = 'failed'
+                logging.error(f'failed to load {model} on {mm.device}: {e}')
+
+            finally:
+                self.devices.release(mm)
+
+            # new models can be claimed
+            self._snap_changed.set()
+            self._snap_changed = trio.Event()
+
+        if self.batch_size > 1:
+            for model in self.initial_models:
+                if states[model] == 'ready':
+                    await self._check_batching(mm, model)
+
+    async def _check_batching(self, mm, model: str):
+        # some kernels aren't batch invariant, a batched output that differs
+        # from the unbatched one would fail verification against other
+        # workers, only sizes that match are ever batched for the model
+        await self.devices.acquire_device(mm)
+        try:
+            sizes = await trio.to_thread.run_sync(
+                mm.verify_batching, model, self.batch_size)
+
+        except (Exception, DGPUComputeError) as e:
+            logging.error(f'batching check for {model} failed on {mm.device}: {e}')
+            sizes = []
+
+        finally:
+            self.devices.release(mm)
+
+        if len(sizes) < self.batch_size - 1:
+            logging.warning(
+                f'batched outputs of {model} differ on {mm.device}, '
+                f'batching it only in sizes {sizes}')
+
+    async def warmup_task(self):
+        # one loader per device, each card loads its models in parallel with
+        # the others while the rest of the node is already up
+        async with trio.open_nursery() as n:
+            for mm in self.devices.mms:
+                n.start_soon(self._warmup_device, mm)
+
+        self.warming_up = False
+        logging.info('warmup done')
+
+        self._snap_changed.set()
+        self._snap_changed = trio.Event()
 
     async def snap_updater_task(self):
+        match self.ingest:
+            case 'snapshot':
+                update = lambda: self.conn.get_full_queue_snapshot(
+                    refresh=set(self._in_progress))
+
+            case 'actions':
+                ingester = SkynetQueueIngester(
+                    self.conn, resync_interval=self.resync_interval)
+                update = ingester.update
+
+            case _:
+                raise DGPUComputeError(f'Unsupported ingest mode {self.ingest}')
+
         while True:
-            self._snap = await self.conn.get_full_queue_snapshot()
-            await trio.sleep(1)
+            known = set(req['id'] for req in self._snap['queue'])
+
+            start = time.time()
+            snap = await update()
+            SNAPSHOT_SECONDS.observe(time.time() - start)
+
+            self._update_snap(snap)
+
+            self.poll_interval = self._next_poll_interval(snap, known)
+            await self._poll_wait()
 
     async def generate_api(self):
         app = Quart(__name__)
@@ -112,115 +424,654 @@ class SkynetDGPUDaemon:
                 account=self.account,
                 version=VERSION,
                 last_generation_ts=self._last_generation_ts,
-                last_generation_speed=self._get_benchmark_speed()
+                last_generation_speed=self.throughput.last_speed,
+                devices=[mm.device for mm in self.devices.mms],
+                busy_devices=self.devices.busy_count,
+                publish_queue=self._publish_send.statistics().current_buffer_used,
+                publish_stats=self._publish_stats,
+                poll_interval=self.poll_interval,
+                warming_up=self.warming_up,
+                models=self._model_states,
+                model_cache={
+                    mm.device: mm.cache_stats() for mm in self.devices.mms},
+                result_cache={
+                    'entries': len(self.result_cache),
+                    'bytes': self.result_cache.size,
+                    'hits': self.result_cache.hits,
+                    'misses': self.result_cache.misses
+                },
+                throughput=self.throughput.summary(),
+                preload=self.preloader.stats()
+            )
+
+        @app.route('/metrics')
+        async def metrics():
+            QUEUE_DEPTH.set(len(self._snap['queue']))
+            for mm in self.devices.mms:
+                LOADED_MODELS.set(len(mm.loaded_models()), device=mm.device)
+                VRAM_USED.set(mm.vram_used(), device=mm.device)
+
+            return (
+                REGISTRY.render(),
+                200,
+                {'Content-Type': 'text/plain; version=0.0.4'}
             )
 
         return app
 
+    def is_claimable(self, entry: dict) -> bool:
+        rid = entry['id']
+        return (
+            rid not in self._index.my_results and
+            rid not in self._in_progress and
+            rid not in self.outbox and
+            (not self.warming_up or self.devices.is_model_free(
+                entry['model'], entry['req']['binary_data'] != '')) and
+            rid in self._snap['requests'] and
+            len(self._snap['requests'][rid]) == 0
+        )
+
+    async def prefetch_task(self):
+        if self._prefetcher.size == 0:
+            return
+
+        while True:
+            await self._snap_changed.wait()
+
+            inputs = []
+            for entry in self._index.candidates():
+                if len(inputs) >= self._prefetcher.size:
+                    break
+
+                if (entry['req']['binary_data'] and
+                    self.is_claimable(entry)):
+                    inputs.append(
+                        (entry['req']['binary_data'], entry['body']['params']))
+
+            await self._prefetcher.prefetch(inputs)
+
+    def _can_preload(self, key: tuple[str, bool]) -> bool:
+        return (
+            not self.devices.is_model_loaded(*key) and
+            self.devices.preload_target(*key) is not None
+        )
+
+    async def preload_task(self):
+        if not self.preload:
+            return
+
+        while True:
+            await self._snap_changed.wait()
+            if self.warming_up:
+                continue
+
+            candidates = [
+                entry for entry in self._index.candidates()
+                if self.is_claimable(entry)
+            ]
+            self.preloader.update(candidates)
+
+            # claimable work for an already loaded model, a free device is
+            # better spent on that than on a guess
+            if any(
+                self.devices.is_model_loaded(*entry_key(entry))
+                for entry in candidates
+            ):
+                continue
+
+            key = self.preloader.choose(lambda key: not self._can_preload(key))
+            if not key:
+                continue
+
+            model, image = key
+            mm = await self.devices.acquire_device(
+                self.devices.preload_target(model, image))
+            logging.info(f'preloading {model} (image: {image}) on {mm.device}')
+            try:
+                await trio.to_thread.run_sync(
+                    partial(mm.load_model, model, image))
+                self.preloader.preloaded(key)
+                PRELOADS.inc(result='loaded')
+
+            except (Exception, DGPUComputeError) as e:
+                PRELOADS.inc(result='failed')
+                logging.error(f'failed to preload {model} on {mm.device}: {e}')
+
+            finally:
+                self.devices.release(mm)
+
+    async def _claim(self, entry: dict) -> tuple[str, bytes, str] | None:
+        '''
+        Begin work on `entry` & get its input, returns the request hash,
+        input & input type or None if we didn't get it
+        '''
+        rid = entry['id']
+        req = entry['req']
+        body = entry['body']
+
+        if not self.is_claimable(entry):
+            logging.info(f'request {rid} already beign worked on, skip...')
+            return None
+
+        hash_str = (
+            str(req['nonce'])
+            +
+            req['body']
+            +
+            req['binary_data']
+        )
+        logging.info(f'hashing: {hash_str}')
+        request_hash = sha256(hash_str.encode('utf-8')).hexdigest()
+
+        # the snapshot status may come from the connector's cache, make
+        # sure nobody started on it since before pushing our workbegin
+        self.conn.invalidate_status(rid)
+        if len(await self.conn.get_status_by_request_id(rid)) > 0:
+            logging.info(f'request {rid} taken since last snapshot, skip...')
+            CLAIMS.inc(result='lost')
+            return None
+
+        # perform work
+        logging.info(f'working on {body}')
+
+        resp = await self.conn.begin_work(rid)
+        if not resp or 'code' in resp:
+            logging.info(f'probably being worked on already... skip.')
+            CLAIMS.inc(result='lost')
+            return None
+
+        CLAIMS.inc(result='won')
+
+        # usually already prefetched, a bad or unreachable input gives the
+        # request back like any other failed job
+        try:
+            binary, input_type = await self._prefetcher.get(
+                req['binary_data'], body['params'])
+
+        except (Exception, DGPUComputeError) as e:
+            logging.warning(f'couldn\'t get input for request {rid}: {e}')
+            FAILURES.inc(stage='input')
+            await self.cancel_work(rid, str(e))
+            return None
+
+        return request_hash, binary, input_type
+
+    async def _serve_cached(
+        self,
+        entry: dict,
+        request_hash: str,
+        nursery: trio.Nursery
+    ) -> bool:
+        if not self.result_cache.enabled:
+            return False
+
+        cached = await trio.to_thread.run_sync(
+            self.result_cache.get, self._result_key(entry))
+        RESULT_CACHE.inc(result='hit' if cached else 'miss')
+        if not cached:
+            return False
+
+        logging.info(f'request {entry["id"]} found on result cache')
+        self._in_progress.add(entry['id'])
+        nursery.start_soon(self.submit_cached, entry, request_hash, cached)
+        return True
+
+    async def _claim_batch(
+        self,
+        first: dict,
+        size: int,
+        nursery: trio.Nursery
+    ) -> list[tuple]:
+        # more requests that can ride along on the same pipeline call
+        entries = pick_batch(
+            first,
+            self.scheduler.rank(self._index.candidates()),
+            size,
+            self.is_claimable
+        )
+        claims = [None] * len(entries)
+
+        async def _claim_one(i: int):
+            claims[i] = await self._claim(entries[i])
+
+        # each claim is a workbegin round trip, push them all at once
+        async with trio.open_nursery() as n:
+            for i in range(len(entries)):
+                n.start_soon(_claim_one, i)
+
+        jobs = []
+        for entry, claim in zip(entries, claims):
+            if not claim or await self._serve_cached(entry, claim[0], nursery):
+                continue
+
+            self._in_progress.add(entry['id'])
+            jobs.append((entry, *claim))
+
+        return jobs
+
+    async def maybe_serve_one(
+        self,
+        entry: dict,
+        nursery: trio.Nursery
+    ) -> bool:
+        # reserve the device before pushing workbegin, a preload or warmup
+        # load can't take it while the claimed request waits
+        mm = await self.devices.wait_acquire(
+            entry['model'],
+            entry['req']['binary_data'] != '',
+            loaded_only=self.warming_up
+        )
+
+        # the compute task releases the device once it gets it, until then
+        # nothing on the claim path may leak it
+        dispatched = False
+        try:
+            claim = await self._claim(entry)
+            if not claim:
+                return False
+
+            request_hash, binary, input_type = claim
+            if await self._serve_cached(entry, request_hash, nursery):
+                return True
+
+            self._in_progress.add(entry['id'])
+
+            # only as far as verified for the model on this device, the
+            # model manager splits the batch on those sizes
+            batch = []
+            sizes = mm.batch_sizes.get(entry['model'], [])
+            if sizes:
+                batch = await self._claim_batch(entry, max(sizes), nursery)
+
+            if batch:
+                nursery.start_soon(
+                    self.compute_batch, mm, [(entry, *claim), *batch])
+
+            else:
+                nursery.start_soon(
+                    self.compute_one, mm, entry, request_hash, binary, input_type)
+
+            dispatched = True
+            return True
+
+        finally:
+            if not dispatched:
+                self.devices.release(mm)
+
+    def _result_key(self, entry: dict) -> str:
+        return result_key(
+            entry['body']['method'],
+            entry['body']['params'],
+            entry['req']['binary_data']
+        )
+
+    async def submit_cached(self, entry: dict, request_hash: str, cached: dict):
+        rid = entry['id']
+        await trio.to_thread.run_sync(
+            self.outbox.add_submit,
+            rid, request_hash,
+            cached['output_hash'], cached['output_type'], cached['output'])
+
+        await self._publish_send.send({
+            'rid': rid,
+            'request_hash': request_hash,
+            'output_hash': cached['output_hash'],
+            'output': cached['output'],
+            'output_type': cached['output_type'],
+            'ipfs_hash': cached['ipfs_hash'],
+            'cache_key': self._result_key(entry)
+        })
+
+    async def compute_one(
+        self,
+        mm: SkynetMM,
+        entry: dict,
+        request_hash: str,
+        binary,
+        input_type: str
+    ):
+        rid = entry['id']
+        body = entry['body']
+        logging.info(f'computing request {rid} on {mm.device}')
+        loaded = mm.is_model_loaded(entry['model'], input_type != 'none')
+        if loaded and self.preloader.claimed(entry_key(entry)):
+            logging.info(f'request {rid} runs on a preloaded model')
+            PRELOAD_HITS.inc()
+
+        start = time.time()
+        try:
+            output_type = output_type_for(body['method'], body['params'])
+
+            output = None
+            output_hash = None
+            match self.backend:
+                case 'sync-on-thread':
+                    token = threading.Event()
+                    self._cancel_tokens[rid] = token.set
+                    output_hash, output = await trio.to_thread.run_sync(
+                        partial(
+                            mm.compute_one,
+                            rid,
+                            body['method'], body['params'],
+                            input_type=input_type,
+                            binary=binary,
+                            cancel_event=token
+                        )
+                    )
+
+                case 'process':
+                    self._cancel_tokens[rid] = mm.cancel
+                    output_hash, output = await trio.to_thread.run_sync(
+                        partial(
+                            mm.compute_one,
+                            rid,
+                            body['method'], body['params'],
+                            input_type=input_type,
+                            binary=binary
+                        )
+                    )
+
+                case _:
+                    raise DGPUComputeError(f'Unsupported backend {self.backend}')
+            elapsed = time.time() - start
+            COMPUTE_SECONDS.observe(elapsed, model=entry['model'])
+            ENCODE_SECONDS.observe(mm.last_encode_time, model=entry['model'])
+            self.scheduler.observe(entry, elapsed, loaded)
+            self.throughput.observe(
+                entry['model'], body['params'], mm.last_timings, elapsed)
+            self._last_generation_ts = datetime.now().isoformat()
+
+        except BaseException as e:
+            traceback.print_exc()
+            FAILURES.inc(stage='compute')
+            await self.cancel_work(rid, str(e))
+            self._in_progress.discard(rid)
+            return
+
+        finally:
+            self._cancel_tokens.pop(rid, None)
+            self.devices.release(mm)
+
+        await self._queue_output(
+            entry, request_hash, output_hash, output_type, output)
+
+    async def _queue_output(
+        self,
+        entry: dict,
+        request_hash: str,
+        output_hash: str,
+        output_type: str,
+        output: bytes
+    ):
+        rid = entry['id']
+
+        # journal the output before anything else can go wrong with it, the
+        # write is a multi MB blob, keep it off the event loop
+        await trio.to_thread.run_sync(
+            self.outbox.add_submit,
+            rid, request_hash, output_hash, output_type, output)
+
+        cache_key = self._result_key(entry)
+        await trio.to_thread.run_sync(
+            self.result_cache.put, cache_key, output, output_hash, output_type)
+
+        # hand off to the publish stage, blocks if it is backed up
+        await self._publish_send.send({
+            'rid': rid,
+            'request_hash': request_hash,
+            'output_hash': output_hash,
+            'output': output,
+            'output_type': output_type,
+            'ipfs_hash': None,
+            'cache_key': cache_key
+        })
+
+    async def compute_batch(self, mm: SkynetMM, jobs: list[tuple]):
+        '''
+        Run `(entry, request_hash, binary, input_type)` jobs sharing a
+        `batch_key` as one batch, outputs are submitted one by one
+        '''
+        rids = [entry['id'] for entry, *_ in jobs]
+        first = jobs[0][0]
+        logging.info(f'computing batch {rids} on {mm.device}')
+        loaded = mm.is_model_loaded(first['model'], False)
+        if loaded and self.preloader.claimed(entry_key(first)):
+            PRELOAD_HITS.inc()
+
+        # a competitor showing up only drops its own request from the
+        # batch, the batch stops once every request on it is gone
+        cancelled = set()
+        batch = [(entry['id'], entry['body']['params']) for entry, *_ in jobs]
+        start = time.time()
+        try:
+            match self.backend:
+                case 'sync-on-thread':
+                    token = threading.Event()
+                    stop = token.set
+                    run = partial(mm.compute_batch, batch, cancel_event=token)
+
+                case 'process':
+                    stop = mm.cancel
+                    run = partial(mm.compute_batch, batch)
+
+                case _:
+                    raise DGPUComputeError(f'Unsupported backend {self.backend}')
+
+            def _cancel(rid: int):
+                cancelled.add(rid)
+                if len(cancelled) == len(rids):
+                    stop()
+
+            for rid in rids:
+                self._cancel_tokens[rid] = partial(_cancel, rid)
+
+            outputs = await trio.to_thread.run_sync(run)
+
+            elapsed = time.time() - start
+            for entry, *_ in jobs:
+                COMPUTE_SECONDS.observe(elapsed / len(jobs), model=entry['model'])
+                self.scheduler.observe(entry, elapsed / len(jobs), loaded)
+                self.throughput.observe(
+                    entry['model'], entry['body']['params'],
+                    mm.last_timings, elapsed / len(jobs))
+
+            ENCODE_SECONDS.observe(mm.last_encode_time, model=first['model'])
+            self._last_generation_ts = datetime.now().isoformat()
+
+        except BaseException as e:
+            traceback.print_exc()
+            FAILURES.inc(stage='compute')
+            for rid in rids:
+                await self.cancel_work(rid, str(e))
+                self._in_progress.discard(rid)
+
+            return
+
+        finally:
+            for rid in rids:
+                self._cancel_tokens.pop(rid, None)
+
+            self.devices.release(mm)
+
+        for (entry, request_hash, _, _), (output_hash, output) in zip(jobs, outputs):
+            if entry['id'] in cancelled:
+                await self.cancel_work(entry['id'], 'non compete worker started')
+                self._in_progress.discard(entry['id'])
+                continue
+
+            output_type = output_type_for(
+                entry['body']['method'], entry['body']['params'])
+
+            await self._queue_output(
+                entry, request_hash, output_hash, output_type, output)
+
+    async def cancel_work(self, request_id: int, reason: str):
+        await trio.to_thread.run_sync(
+            self.outbox.add_cancel, request_id, reason)
+        resp = await self.conn.cancel_work(request_id, reason)
+        if not resp:
+            # couldn't reach the node, the outbox task retries it
+            await trio.to_thread.run_sync(self.outbox.retry_later, request_id)
+            return
+
+        if 'code' in resp:
+            logging.warning(f'cancel for request {request_id} refused: {resp}')
+
+        await trio.to_thread.run_sync(self.outbox.remove, request_id)
+
+    async def publish_and_submit(
+        self,
+        job: dict,
+        retries: int | None = None
+    ) -> str:
+        '''
+        Returns 'submitted', 'rejected' if the chain refused the submit or
+        'failed' if we couldn't get through to ipfs or the node
+        '''
+        rid = job['rid']
+        retries = self.publish_retries if retries is None else retries
+        status = 'failed'
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                self._publish_stats['retries'] += 1
+                await trio.sleep(2 ** attempt)
+
+            try:
+                if not job['ipfs_hash']:
+                    start = time.time()
+                    job['ipfs_hash'] = await self.conn.publish_on_ipfs(
+                        job['output'], typ=job['output_type'])
+                    PUBLISH_SECONDS.observe(time.time() - start)
+                    await trio.to_thread.run_sync(
+                        self.outbox.set_ipfs_hash, rid, job['ipfs_hash'])
+                    if 'cache_key' in job:
+                        await trio.to_thread.run_sync(
+                            self.result_cache.set_ipfs_hash,
+                            job['cache_key'], job['ipfs_hash'])
+
+                start = time.time()
+                resp = await self.conn.submit_work(
+                    rid, job['request_hash'], job['output_hash'], job['ipfs_hash'])
+                SUBMIT_SECONDS.observe(time.time() - start)
+
+                if resp and 'code' in resp:
+                    # the chain answered, retrying won't change its mind
+                    logging.warning(f'submit for request {rid} refused: {resp}')
+                    return 'rejected'
+
+                if resp:
+                    return 'submitted'
+
+                status = 'failed'
+                logging.warning(f'submit for request {rid} failed')
+
+            except (Exception, IPFSClientException) as e:
+                status = 'failed'
+                logging.warning(f'publish for request {rid} failed: {e}')
+
+        return status
+
+    async def _finish_submit(self, rid: int, status: str):
+        match status:
+            case 'submitted':
+                await trio.to_thread.run_sync(self.outbox.remove, rid)
+                self._publish_stats['submitted'] += 1
+                self._index.my_results.add(rid)
+                logging.info(f'submitted request {rid}')
+
+            case 'rejected':
+                self._publish_stats['failed'] += 1
+                FAILURES.inc(stage='submit')
+                logging.error(f'gave up submitting request {rid}')
+                await self.cancel_work(rid, 'failed to submit')
+
+            case _:
+                # transient, the outbox task keeps retrying it
+                await trio.to_thread.run_sync(self.outbox.retry_later, rid)
+                logging.warning(f'submit for request {rid} deferred')
+
+    async def publish_task(self):
+        async def _publisher():
+            async for job in self._publish_recv:
+                rid = job['rid']
+                try:
+                    await self._finish_submit(
+                        rid, await self.publish_and_submit(job))
+
+                finally:
+                    self._in_progress.discard(rid)
+
+        async with trio.open_nursery() as n:
+            for _ in range(self.publish_workers):
+                n.start_soon(_publisher)
+
+    def _outbox_expired(self, row: dict) -> bool:
+        rid = row['rid']
+        queue = self._snap['queue']
+
+        # an empty queue may be a failed read, fall back to the request age
+        return (
+            (len(queue) > 0 and not any(req['id'] == rid for req in queue)) or
+            row['created'] + QUEUE_WINDOW < time.time()
+        )
+
+    async def outbox_task(self):
+        # need a view of the queue to tell which requests are gone
+        await self._snap_changed.wait()
+
+        while True:
+            now = time.time()
+            for row in await trio.to_thread.run_sync(self.outbox.pending):
+                rid = row['rid']
+                if rid in self._in_progress or row['next_attempt'] > now:
+                    continue
+
+                if row['action'] == 'submit' and rid in self._index.my_results:
+                    await trio.to_thread.run_sync(self.outbox.remove, rid)
+                    continue
+
+                if self._outbox_expired(row):
+                    logging.warning(
+                        f'request {rid} left the queue, dropping pending {row["action"]}')
+                    await trio.to_thread.run_sync(self.outbox.remove, rid)
+                    continue
+
+                match row['action']:
+                    case 'submit':
+                        await self._finish_submit(
+                            rid, await self.publish_and_submit(row, retries=0))
+
+                    case 'cancel':
+                        await self.cancel_work(rid, row['reason'])
+
+            await trio.sleep(DEFAULT_OUTBOX_INTERVAL)
+
     async def serve_forever(self):
         try:
-            while True:
-                if self.auto_withdraw:
-                    await self.conn.maybe_withdraw_all()
+            async with trio.open_nursery() as n:
+                while True:
+                    if self.auto_withdraw:
+                        await self.conn.maybe_withdraw_all()
 
-                queue = self._snap['queue']
+                    # only claim when there is a device to dispatch to
+                    await self.devices.wait_free()
 
-                random.shuffle(queue)
-                queue = sorted(
-                    queue,
-                    key=lambda req: convert_reward_to_int(req['reward']),
-                    reverse=True
-                )
+                    # grab the event before scanning so a snapshot that lands
+                    # mid scan still wakes us up
+                    snap_changed = self._snap_changed
+
+                    # index is sorted by reward, unknown, whitelisted &
+                    # blacklisted models are already filtered out, after a
+                    # claim go straight to the next candidate
+                    claimed = False
+                    for entry in self.scheduler.rank(self._index.candidates()):
+                        if await self.maybe_serve_one(entry, n):
+                            claimed = True
+                            break
 
-                for req in queue:
-                    rid = req['id']
-
-                    # parse request
-                    body = json.loads(req['body'])
-                    model = body['params']['model']
-
-                    # if model not known
-                    if model not in MODELS:
-                        logging.warning(f'Unknown model {model}')
-                        continue
-
-                    # if whitelist enabled and model not in it continue
-                    if (len(self.model_whitelist) > 0 and
-                        not model in self.model_whitelist):
-                        continue
-
-                    # if blacklist contains model skip
-                    if model in self.model_blacklist:
-                        continue
-
-                    my_results = [res['id'] for res in self._snap['my_results']]
-                    if rid not in my_results and rid in self._snap['requests']:
-                        statuses = self._snap['requests'][rid]
-
-                        if len(statuses) == 0:
-                            binary, input_type = await self.conn.get_input_data(req['binary_data'])
-
-                            hash_str = (
-                                str(req['nonce'])
-                                +
-                                req['body']
-                                +
-                                req['binary_data']
-                            )
-                            logging.info(f'hashing: {hash_str}')
-                            request_hash = sha256(hash_str.encode('utf-8')).hexdigest()
-
-                            # TODO: validate request
-
-                            # perform work
-                            logging.info(f'working on {body}')
-
-                            resp = await self.conn.begin_work(rid)
-                            if 'code' in resp:
-                                logging.info(f'probably being worked on already... skip.')
-
-                            else:
-                                try:
-                                    output_type = 'png'
-                                    if 'output_type' in body['params']:
-                                        output_type = body['params']['output_type']
-
-                                    output = None
-                                    output_hash = None
-                                    match self.backend:
-                                        case 'sync-on-thread':
-                                            self.mm._should_cancel = self.should_cancel_work
-                                            output_hash, output = await trio.to_thread.run_sync(
-                                                partial(
-                                                    self.mm.compute_one,
-                                                    rid,
-                                                    body['method'], body['params'],
-                                                    input_type=input_type,
-                                                    binary=binary
-                                                )
-                                            )
-
-                                        case _:
-                                            raise DGPUComputeError(f'Unsupported backend {self.backend}')
-                                    self._last_generation_ts = datetime.now().isoformat()
-                                    self._last_benchmark = self._benchmark
-                                    self._benchmark = []
-
-                                    ipfs_hash = await self.conn.publish_on_ipfs(output, typ=output_type)
-
-                                    await self.conn.submit_work(rid, request_hash, output_hash, ipfs_hash)
-
-                                except BaseException as e:
-                                    traceback.print_exc()
-                                    await self.conn.cancel_work(rid, str(e))
-
-                                finally:
-                                    break
-
-                    else:
-                        logging.info(f'request {rid} already beign worked on, skip...')
-
-                await trio.sleep(1)
+                    if not claimed:
+                        # nothing claimable, block until the queue changes
+                        await snap_changed.wait()
 
         except KeyboardInterrupt:
             ...
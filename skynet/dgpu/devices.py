@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+import trio
+
+
+# hands out idle model managers (one per device) to claimed requests, only
+# needs `device` & `is_model_loaded` from the managers so scheduling can be
+# exercised with fake devices
+class SkynetDevicePool:
+
+    def __init__(self, mms: list):
+        self.mms = mms
+        self._free = list(mms)
+        self._released = trio.Event()
+
+    def __len__(self):
+        return len(self.mms)
+
+    @property
+    def free_count(self) -> int:
+        return len(self._free)
+
+    @property
+    def busy_count(self) -> int:
+        return len(self.mms) - len(self._free)
+
+    def is_model_loaded(self, model: str, image: bool) -> bool:
+        return any(mm.is_model_loaded(model, image) for mm in self.mms)
+
+    def is_model_free(self, model: str, image: bool) -> bool:
+        return any(mm.is_model_loaded(model, image) for mm in self._free)
+
+    def preload_target(self, model: str, image: bool):
+        # an idle device with room to spare for the model
+        for mm in self._free:
+            if mm.can_preload(model, image):
+                return mm
+
+        return None
+
+    async def wait_free(self):
+        while len(self._free) == 0:
+            await self._released.wait()
+
+    async def wait_all_free(self):
+        while len(self._free) < len(self.mms):
+            await self._released.wait()
+
+    async def wait_release(self):
+        await self._released.wait()
+
+    def acquire(self, model: str, image: bool, loaded_only: bool = False):
+        if len(self._free) == 0:
+            return None
+
+        # prefer a device that already has the model loaded
+        mm = None if loaded_only else self._free[0]
+        for candidate in self._free:
+            if candidate.is_model_loaded(model, image):
+                mm = candidate
+                break
+
+        if mm:
+            self._free.remove(mm)
+
+        return mm
+
+    async def wait_acquire(self, model: str, image: bool, loaded_only: bool = False):
+        while not (mm := self.acquire(model, image, loaded_only=loaded_only)):
+            await self._released.wait()
+
+        return mm
+
+    async def acquire_device(self, mm):
+        while mm not in self._free:
+            await self._released.wait()
+
+        self._free.remove(mm)
+        return mm
+
+    def release(self, mm):
+        self._free.append(mm)
+        self._released.set()
+        self._released = trio.Event()
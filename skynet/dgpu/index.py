@@ -0,0 +1,222 @@
+#!/usr/bin/python
+
+import json
+import random
+import logging
+
+from bisect import bisect_left, insort
+
+from skynet.constants import (
+    MODELS,
+    MIN_STEP,
+    MAX_STEP,
+    MAX_WIDTH,
+    MAX_HEIGHT,
+    MAX_GUIDANCE,
+    MAX_IMAGES
+)
+
+
+MIN_SIZE = 16
+
+
+def convert_reward_to_int(reward_str):
+    int_part, decimal_part = (
+        reward_str.split('.')[0],
+        reward_str.split('.')[1].split(' ')[0]
+    )
+    return int(int_part + decimal_part)
+
+
+def _bounded(params: dict, key: str, cast, low, high) -> str | None:
+    if key not in params:
+        return f'Missing param {key}'
+
+    try:
+        val = cast(params[key])
+
+    except (TypeError, ValueError):
+        return f'Invalid {key} {params[key]!r}'
+
+    if not low <= val <= high:
+        return f'{key} {val} out of bounds [{low}, {high}]'
+
+    return None
+
+
+def validate_params(method: str, params: dict, image: bool) -> str | None:
+    '''
+    Cheap checks on a request body before claiming it, everything
+    `prepare_params_for_diffuse` would trip on after begin_work
+    '''
+    if method not in ('diffuse', 'diffuse_batch'):
+        return f'Unsupported method {method}'
+
+    if not isinstance(params.get('prompt'), str):
+        return 'Missing prompt'
+
+    for key, cast, low, high in (
+        ('step', int, MIN_STEP, MAX_STEP),
+        ('width', int, MIN_SIZE, MAX_WIDTH),
+        ('height', int, MIN_SIZE, MAX_HEIGHT),
+        ('guidance', float, 0, MAX_GUIDANCE)
+    ):
+        reason = _bounded(params, key, cast, low, high)
+        if reason:
+            return reason
+
+    for key in ('width', 'height'):
+        if int(params[key]) % 8 != 0:
+            return f'{key} must be divisible by 8'
+
+    try:
+        int(params['seed'])
+
+    except KeyError:
+        return 'Missing param seed'
+
+    except (TypeError, ValueError):
+        return f'Invalid seed {params["seed"]!r}'
+
+    if image:
+        reason = _bounded(params, 'strength', float, 0, 1)
+        if reason:
+            return reason
+
+    if params.get('upscaler') not in (None, 'x4'):
+        return f'Unknown upscaler {params["upscaler"]}'
+
+    if params.get('output_type', 'png') != 'png':
+        return f'Unknown output_type {params["output_type"]}'
+
+    if method == 'diffuse_batch':
+        reason = _bounded(params, 'num_images', int, 1, MAX_IMAGES)
+        if reason:
+            return reason
+
+        if 'seeds' in params:
+            seeds = params['seeds']
+            if (not isinstance(seeds, list) or
+                len(seeds) != int(params['num_images'])):
+                return 'seeds must be a list with a seed per image'
+
+            try:
+                [int(seed) for seed in seeds]
+
+            except (TypeError, ValueError):
+                return f'Invalid seeds {seeds!r}'
+
+    return None
+
+
+# daemon owned view of the queue, requests are parsed & filtered once when
+# they first show up on a snapshot and kept sorted by reward
+class SkynetRequestIndex:
+
+    def __init__(
+        self,
+        model_whitelist: set[str] = set(),
+        model_blacklist: set[str] = set()
+    ):
+        self.model_whitelist = model_whitelist
+        self.model_blacklist = model_blacklist
+
+        # request ids we already submitted a result for
+        self.my_results = set()
+
+        self._entries = {}
+        self._rejected = {}
+
+        # sorted (-reward, tie breaker, request id) keys, the random tie
+        # breaker spreads workers across same reward requests
+        self._order = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, request_id: int):
+        return request_id in self._entries
+
+    def get(self, request_id: int) -> dict | None:
+        return self._entries.get(request_id)
+
+    def rejection(self, request_id: int) -> str | None:
+        return self._rejected.get(request_id)
+
+    def _filter(self, req: dict, body: dict) -> str | None:
+        model = body['params']['model']
+
+        # if model not known
+        if model not in MODELS:
+            return f'Unknown model {model}'
+
+        # if whitelist enabled and model not in it
+        if (len(self.model_whitelist) > 0 and
+            not model in self.model_whitelist):
+            return f'Model {model} not in whitelist'
+
+        # if blacklist contains model
+        if model in self.model_blacklist:
+            return f'Model {model} in blacklist'
+
+        return validate_params(
+            body['method'], body['params'], req['binary_data'] != '')
+
+    def _add(self, req: dict):
+        rid = req['id']
+        try:
+            body = json.loads(req['body'])
+            reason = self._filter(req, body)
+
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            reason = f'Malformed request body: {e}'
+
+        if reason:
+            logging.warning(f'skipping request {rid}: {reason}')
+            self._rejected[rid] = reason
+            return
+
+        reward = convert_reward_to_int(req['reward'])
+        key = (-reward, random.random(), rid)
+        self._entries[rid] = {
+            'id': rid,
+            'req': req,
+            'body': body,
+            'model': body['params']['model'],
+            'reward': reward,
+            'key': key
+        }
+        insort(self._order, key)
+
+    def remove(self, request_id: int):
+        entry = self._entries.pop(request_id, None)
+        if entry:
+            i = bisect_left(self._order, entry['key'])
+            del self._order[i]
+
+        if request_id in self._rejected:
+            del self._rejected[request_id]
+
+    def update(self, snap: dict):
+        queue_ids = set()
+        for req in snap['queue']:
+            rid = req['id']
+            queue_ids.add(rid)
+            if rid not in self._entries and rid not in self._rejected:
+                self._add(req)
+
+        for rid in [*self._entries.keys(), *self._rejected.keys()]:
+            if rid not in queue_ids:
+                self.remove(rid)
+
+        if snap['my_results'] is not None:
+            self.my_results = set(
+                res['request_id'] for res in snap['my_results'])
+
+    def candidates(self):
+        # iterate over a copy so the index can be updated while the
+        # consumer awaits between candidates
+        for _, _, rid in tuple(self._order):
+            entry = self._entries.get(rid)
+            if entry:
+                yield entry
@@ -0,0 +1,171 @@
+#!/usr/bin/python
+
+import time
+import logging
+
+from typing import TYPE_CHECKING
+from datetime import datetime, timedelta
+
+# only for the annotation, importing the connector pulls in leap
+if TYPE_CHECKING:
+    from skynet.dgpu.network import SkynetGPUConnector
+
+
+DEFAULT_RESYNC_INTERVAL = 60
+
+# how far back to rewind the action cursor after a full resync, covers
+# actions that landed while the snapshot was being built
+CURSOR_REWIND = timedelta(seconds=10)
+
+# hyperion's `after` is exclusive & timestamps have ms resolution, actions
+# landing on the same ms as the last one seen would be skipped, re-read a
+# little overlap & drop what was already applied by global sequence
+CURSOR_OVERLAP = timedelta(seconds=1)
+
+
+# follows telos.gpu queue actions on hyperion and applies them as deltas to
+# an in-memory queue snapshot, a full snapshot is taken on start and then
+# every `resync_interval` seconds to correct any drift
+class SkynetQueueIngester:
+
+    def __init__(
+        self,
+        conn: 'SkynetGPUConnector',
+        resync_interval: int = DEFAULT_RESYNC_INTERVAL
+    ):
+        self.conn = conn
+        self.account = str(conn.account)
+        self.resync_interval = resync_interval
+
+        self.snap = {
+            'queue': [],
+            'requests': {},
+            'my_results': []
+        }
+
+        self._cursor = None
+        self._last_seq = 0
+        # request ids start at 0, rows are read strictly after this one
+        self._last_id = -1
+        self._last_resync = 0
+
+    async def resync(self):
+        logging.info('full queue resync')
+        cursor = (datetime.utcnow() - CURSOR_REWIND).isoformat()
+
+        self.snap = await self.conn.get_full_queue_snapshot()
+
+        self._cursor = cursor
+        self._last_id = max(
+            [req['id'] for req in self.snap['queue']],
+            default=self._last_id
+        )
+        self._last_resync = time.time()
+
+    def _remove_request(self, request_id: int):
+        self.snap['queue'] = [
+            req for req in self.snap['queue'] if req['id'] != request_id]
+
+        if request_id in self.snap['requests']:
+            del self.snap['requests'][request_id]
+
+    def apply_action(self, action: dict):
+        name = action['act']['name']
+        data = action['act']['data']
+
+        if name == 'enqueue':
+            # new rows are read from the queue table in bulk, see `update`
+            return
+
+        request_id = int(data['request_id'])
+
+        # status table changed, next full read must hit the chain
+        self.conn.invalidate_status(request_id)
+
+        match name:
+            case 'workbegin':
+                statuses = self.snap['requests'].get(request_id)
+                if statuses is None:
+                    return
+
+                if data['worker'] not in [s['worker'] for s in statuses]:
+                    statuses.append({
+                        'worker': data['worker'],
+                        'started': action['@timestamp']
+                    })
+
+            case 'workcancel':
+                statuses = self.snap['requests'].get(request_id)
+                if statuses is None:
+                    return
+
+                self.snap['requests'][request_id] = [
+                    s for s in statuses if s['worker'] != data['worker']]
+
+            case 'submit':
+                # my_results is None when the last results read failed, the
+                # next resync fills it in again
+                my_results = self.snap['my_results']
+                if (data['worker'] == self.account and
+                    my_results is not None and
+                    request_id not in [r['request_id'] for r in my_results]):
+                    # the result row id isn't on the action, only ever
+                    # looked up by request id
+                    my_results.append({
+                        'request_id': request_id,
+                        'worker': data['worker'],
+                        'result_hash': data['result_hash'],
+                        'ipfs_hash': data['ipfs_hash']
+                    })
+
+                self._remove_request(request_id)
+
+            case 'dequeue':
+                self._remove_request(request_id)
+
+            case _:
+                logging.warning(f'unexpected queue action {name}')
+
+    async def update(self) -> dict:
+        if (not self._cursor or
+            time.time() - self._last_resync > self.resync_interval):
+            await self.resync()
+            return self.snap
+
+        result = await self.conn.get_queue_actions_after(self._cursor)
+        if not result:
+            return self.snap
+
+        actions = [
+            action
+            for action in result['actions']
+            if int(action['global_sequence']) > self._last_seq
+        ]
+        if len(actions) == 0:
+            return self.snap
+
+        self._last_seq = int(actions[-1]['global_sequence'])
+        self._cursor = (
+            datetime.fromisoformat(actions[-1]['@timestamp']) - CURSOR_OVERLAP
+        ).isoformat()
+
+        # apply enqueues first so that status actions on brand new requests
+        # in this same batch find their request
+        if any(action['act']['name'] == 'enqueue' for action in actions):
+            known = set(req['id'] for req in self.snap['queue'])
+            new_rows = [
+                row
+                for row in await self.conn.get_work_requests_after(self._last_id)
+                if row['id'] not in known
+            ]
+            for row in new_rows:
+                self.snap['queue'].append(row)
+                self.snap['requests'][row['id']] = []
+                self._last_id = max(self._last_id, row['id'])
+
+            logging.info(f'ingested {len(new_rows)} new requests')
+
+        for action in actions:
+            self.apply_action(action)
+
+        return self.snap
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+
+# minimal prometheus text format metrics for the dgpu worker
+
+from math import inf
+
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300
+)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == inf:
+        return '+Inf'
+
+    return repr(float(value))
+
+
+class SkynetMetricsRegistry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.doc}')
+            lines.append(f'# TYPE {metric.name} {metric.typ}')
+            lines += metric.samples()
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = SkynetMetricsRegistry()
+
+
+class _Metric:
+
+    typ = 'untyped'
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: tuple = (),
+        registry: SkynetMetricsRegistry = REGISTRY
+    ):
+        self.name = name
+        self.doc = doc
+        self.label_names = labels
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        return [
+            f'{self.name}{_format_labels(self.label_names, key)} '
+            f'{_format_value(value)}'
+            for key, value in self._values.items()
+        ]
+
+
+class Counter(_Metric):
+
+    typ = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+
+    typ = 'gauge'
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def clear(self):
+        self._values = {}
+
+
+class Histogram(_Metric):
+
+    typ = 'histogram'
+
+    def __init__(self, *args, buckets: tuple = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = (*buckets, inf)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        if key not in self._values:
+            self._values[key] = {
+                'buckets': [0] * len(self.buckets),
+                'sum': 0,
+                'count': 0
+            }
+
+        hist = self._values[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                hist['buckets'][i] += 1
+
+        hist['sum'] += value
+        hist['count'] += 1
+
+    def get(self, **labels) -> dict | None:
+        return self._values.get(self._key(labels))
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, hist in self._values.items():
+            for bound, count in zip(self.buckets, hist['buckets']):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f'{self.name}_bucket'
+                    f'{_format_labels(self.label_names, key, extra=le)} '
+                    f'{_format_value(count)}'
+                )
+
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(hist["sum"])}')
+            lines.append(f'{self.name}_count{labels} {_format_value(hist["count"])}')
+
+        return lines
+
+
+# worker metrics
+
+SNAPSHOT_SECONDS = Histogram(
+    'skynet_dgpu_snapshot_seconds', 'Queue snapshot update latency')
+CHAIN_RPC_SECONDS = Histogram(
+    'skynet_dgpu_chain_rpc_seconds', 'Chain RPC latency', labels=('action',))
+INPUT_FETCH_SECONDS = Histogram(
+    'skynet_dgpu_input_fetch_seconds', 'Request input download & decode time')
+COMPUTE_SECONDS = Histogram(
+    'skynet_dgpu_compute_seconds', 'Compute time per job', labels=('model',))
+ENCODE_SECONDS = Histogram(
+    'skynet_dgpu_encode_seconds', 'Output encode time per job', labels=('model',))
+PUBLISH_SECONDS = Histogram(
+    'skynet_dgpu_publish_seconds', 'IPFS publish time per job')
+SUBMIT_SECONDS = Histogram(
+    'skynet_dgpu_submit_seconds', 'Submit transaction time per job')
+
+CLAIMS = Counter(
+    'skynet_dgpu_claims_total', 'Work claims by result', labels=('result',))
+CANCELLATIONS = Counter(
+    'skynet_dgpu_cancellations_total', 'Jobs cancelled mid compute')
+FAILURES = Counter(
+    'skynet_dgpu_failures_total', 'Failed jobs by stage', labels=('stage',))
+RESULT_CACHE = Counter(
+    'skynet_dgpu_result_cache_total', 'Result cache lookups', labels=('result',))
+PRELOADS = Counter(
+    'skynet_dgpu_preloads_total', 'Background model loads by result', labels=('result',))
+PRELOAD_HITS = Counter(
+    'skynet_dgpu_preload_hits_total', 'Jobs that ran on a preloaded model')
+
+QUEUE_DEPTH = Gauge(
+    'skynet_dgpu_queue_depth', 'Requests on the queue snapshot')
+LOADED_MODELS = Gauge(
+    'skynet_dgpu_loaded_models', 'Models loaded per device', labels=('device',))
+VRAM_USED = Gauge(
+    'skynet_dgpu_vram_used_bytes', 'Device memory in use', labels=('device',))
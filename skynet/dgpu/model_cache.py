@@ -0,0 +1,245 @@
+#!/usr/bin/python
+
+import time
+import logging
+
+from skynet.constants import MODELS
+
+
+# a cache hit counts half as much every this many seconds, blends
+# frequency (LFU) with recency (LRU) into one eviction score
+DEFAULT_HALF_LIFE = 600
+
+
+def model_mem(model: str, image: bool) -> float:
+    return MODELS[model]['mem']
+
+
+def fits_spare(stats: dict, model: str, image: bool, size_of = model_mem) -> bool:
+    '''
+    Whether `(model, image)` can be loaded without evicting anything, going
+    by a `SkynetModelCache.stats()` dict so it also works on the figures a
+    worker process reports back
+    '''
+    if not stats:
+        return False
+
+    if any(
+        (entry['model'], entry['image']) == (model, image)
+        for entry in stats['resident']
+    ):
+        return False
+
+    size = size_of(model, image)
+    for entry in stats['parked']:
+        if (entry['model'], entry['image']) == (model, image):
+            size = entry['size']
+
+    return stats['used'] + size <= stats['budget']
+
+
+# pipelines resident on one device, keyed by (model, image) and kept within
+# a memory budget (GB), evicts the lowest scoring entries to make room for
+# a new one, the loading & sizing is left to callbacks so the policy can be
+# exercised without torch
+#
+# with a `ram_budget` & an `offload` callback evicted pipelines are parked
+# in host memory first and promoted back on the next miss, only the coldest
+# ones past the ram budget get dropped
+class SkynetModelCache:
+
+    def __init__(
+        self,
+        budget: float,
+        load,
+        unload = None,
+        size_of = model_mem,
+        half_life: float = DEFAULT_HALF_LIFE,
+        clock = time.monotonic,
+        ram_budget: float = 0,
+        offload = None,
+        promote = None
+    ):
+        '''
+        `load(model, image)` returns `(pipe, size)`, size in GB or None to
+        fall back to `size_of(model, image)`, `unload(keys)` runs after
+        entries are evicted to release their memory, `offload(pipe)` moves
+        a pipeline to host memory & returns it (None if it can't be moved)
+        and `promote(pipe)` moves it back
+        '''
+        self.budget = budget
+        self.load = load
+        self.unload = unload
+        self.size_of = size_of
+        self.half_life = half_life
+        self.clock = clock
+
+        self.ram_budget = ram_budget
+        self.offload = offload
+        self.promote = promote
+
+        self._entries = {}
+        self._parked = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.swap_seconds = 0
+        self.last_swap_seconds = 0
+
+        self.promotions = 0
+        self.demotions = 0
+        self.drops = 0
+
+    def __contains__(self, key: tuple[str, bool]):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self) -> list[tuple[str, bool]]:
+        return list(self._entries.keys())
+
+    def parked_keys(self) -> list[tuple[str, bool]]:
+        return list(self._parked.keys())
+
+    @property
+    def used(self) -> float:
+        return sum(entry['size'] for entry in self._entries.values())
+
+    @property
+    def ram_used(self) -> float:
+        return sum(entry['size'] for entry in self._parked.values())
+
+    def _score(self, entry: dict) -> float:
+        age = self.clock() - entry['last_used']
+        return (entry['hits'] + 1) * 0.5 ** (age / self.half_life)
+
+    def score(self, key: tuple[str, bool]) -> float:
+        entry = self._entries[key] if key in self._entries else self._parked[key]
+        return self._score(entry)
+
+    def _park(self, key: tuple[str, bool], entry: dict) -> bool:
+        if (not self.offload or
+            entry['size'] > self.ram_budget):
+            return False
+
+        # make room on the ram tier, never for something colder than what
+        # would have to go
+        while self.ram_used + entry['size'] > self.ram_budget:
+            coldest = min(self._parked, key=self.score)
+            if self._score(self._parked[coldest]) > self._score(entry):
+                return False
+
+            logging.info(f'dropping {coldest[0]} (image: {coldest[1]}) from ram')
+            del self._parked[coldest]
+            self.drops += 1
+
+        pipe = self.offload(entry['pipe'])
+        if pipe is None:
+            return False
+
+        self._parked[key] = {**entry, 'pipe': pipe}
+        self.demotions += 1
+        return True
+
+    def _evict_for(
+        self,
+        size: float,
+        keep: tuple[str, bool] | None = None
+    ) -> list[tuple[str, bool]]:
+        evicted = []
+        while self.used + size > self.budget:
+            candidates = [key for key in self._entries if key != keep]
+            if not candidates:
+                break
+
+            victim = min(candidates, key=self.score)
+            logging.info(
+                f'evicting {victim[0]} (image: {victim[1]}), '
+                f'score {self.score(victim):.3f}')
+            entry = self._entries.pop(victim)
+            if not self._park(victim, entry):
+                self.drops += 1
+
+            evicted.append(victim)
+
+        self.evictions += len(evicted)
+        if evicted and self.unload:
+            self.unload(evicted)
+
+        return evicted
+
+    def get(self, model: str, image: bool):
+        key = (model, image)
+        now = self.clock()
+        if key in self._entries:
+            entry = self._entries[key]
+            entry['hits'] += 1
+            entry['last_used'] = now
+            self.hits += 1
+            return entry['pipe']
+
+        self.misses += 1
+
+        parked = self._parked.pop(key, None)
+        estimate = parked['size'] if parked else self.size_of(model, image)
+        if estimate > self.budget:
+            logging.warning(
+                f'{model} needs {estimate} GB, over the {self.budget} GB budget')
+
+        self._evict_for(estimate)
+
+        start = time.time()
+        if parked:
+            pipe, size = self.promote(parked['pipe']), parked['size']
+            self.promotions += 1
+
+        else:
+            pipe, size = self.load(model, image)
+
+        self.last_swap_seconds = time.time() - start
+        self.swap_seconds += self.last_swap_seconds
+
+        self._entries[key] = {
+            'pipe': pipe,
+            'size': size if size else estimate,
+            'hits': parked['hits'] + 1 if parked else 0,
+            'last_used': self.clock()
+        }
+
+        # measured bigger than estimated
+        self._evict_for(0, keep=key)
+        return pipe
+
+    def fits_spare(self, model: str, image: bool) -> bool:
+        return fits_spare(self.stats(), model, image, size_of=self.size_of)
+
+    def _resident(self, entries: dict) -> list[dict]:
+        return [
+            {
+                'model': model,
+                'image': image,
+                'size': entry['size'],
+                'hits': entry['hits']
+            }
+            for (model, image), entry in entries.items()
+        ]
+
+    def stats(self) -> dict:
+        return {
+            'budget': self.budget,
+            'used': self.used,
+            'ram_budget': self.ram_budget,
+            'ram_used': self.ram_used,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'promotions': self.promotions,
+            'demotions': self.demotions,
+            'drops': self.drops,
+            'swap_seconds': self.swap_seconds,
+            'last_swap_seconds': self.last_swap_seconds,
+            'resident': self._resident(self._entries),
+            'parked': self._resident(self._parked)
+        }
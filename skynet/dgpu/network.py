@@ -3,8 +3,10 @@
 import io
 import json
 import time
+import shutil
 import logging
 
+from uuid import uuid4
 from pathlib import Path
 from functools import partial
 
@@ -15,17 +17,44 @@ import anyio
 from PIL import Image, UnidentifiedImageError
 
 from leap.cleos import CLEOS
+from leap.hyperion import HyperionAPI
 from leap.sugar import Checksum256, Name, asset_from_str
 from skynet.constants import DEFAULT_IPFS_DOMAIN
 
 from skynet.ipfs import AsyncIPFSHTTP, get_ipfs_file
 from skynet.dgpu.errors import DGPUComputeError
+from skynet.dgpu.batch import unpack_images
+from skynet.dgpu.metrics import CHAIN_RPC_SECONDS
 
 
 REQUEST_UPDATE_TIME = 3
 
+DEFAULT_MAX_CONCURRENT_READS = 16
+
+# telos.gpu actions that mutate the queue, status & results tables
+QUEUE_ACTIONS = [
+    'enqueue',
+    'workbegin',
+    'workcancel',
+    'submit',
+    'dequeue'
+]
+
+
+def _rpc_action(fn: partial) -> str:
+    match fn.func.__name__:
+        case 'aget_table':
+            return f'get_table:{fn.args[2]}'
+
+        case 'a_push_action':
+            return fn.args[1]
+
+        case name:
+            return name
+
 
 async def failable(fn: partial, ret_fail=None):
+    start = time.time()
     try:
         return await fn()
 
@@ -38,10 +67,16 @@ async def failable(fn: partial, ret_fail=None):
     ):
         return ret_fail
 
+    finally:
+        CHAIN_RPC_SECONDS.observe(
+            time.time() - start, action=_rpc_action(fn))
+
 
 class SkynetGPUConnector:
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, cleos = None, hyperion = None):
+        # `cleos` & `hyperion` override the clients built from the config,
+        # see `skynet.fakechain` for offline ones
         self.account = Name(config['account'])
         self.permission = config['permission']
         self.key = config['key']
@@ -49,8 +84,9 @@ class SkynetGPUConnector:
         self.node_url = config['node_url']
         self.hyperion_url = config['hyperion_url']
 
-        self.cleos = CLEOS(
+        self.cleos = cleos if cleos else CLEOS(
             None, None, self.node_url, remote=self.node_url)
+        self.hyperion = hyperion if hyperion else HyperionAPI(self.hyperion_url)
 
         self.ipfs_gateway_url = None
         if 'ipfs_gateway_url' in config:
@@ -65,6 +101,18 @@ class SkynetGPUConnector:
 
         self._wip_requests = {}
 
+        # cached status table reads, keyed by request id
+        self.status_ttl = REQUEST_UPDATE_TIME
+        if 'status_ttl' in config:
+            self.status_ttl = config['status_ttl']
+
+        max_concurrent_reads = DEFAULT_MAX_CONCURRENT_READS
+        if 'max_concurrent_reads' in config:
+            max_concurrent_reads = config['max_concurrent_reads']
+
+        self._read_limiter = trio.CapacityLimiter(max_concurrent_reads)
+        self._status_cache = {}
+
     # blockchain helpers
 
     async def get_work_requests_last_hour(self):
@@ -78,12 +126,55 @@ class SkynetGPUConnector:
                 lower_bound=int(time.time()) - 3600
             ), ret_fail=[])
 
-    async def get_status_by_request_id(self, request_id: int):
-        logging.info('get_status_by_request_id')
+    async def get_work_requests_after(self, request_id: int):
+        logging.info('get_work_requests_after')
         return await failable(
             partial(
                 self.cleos.aget_table,
-                'telos.gpu', request_id, 'status'), ret_fail=[])
+                'telos.gpu', 'telos.gpu', 'queue',
+                lower_bound=request_id + 1
+            ), ret_fail=[])
+
+    async def get_queue_actions_after(self, after: str):
+        logging.info('get_queue_actions_after')
+        return await failable(
+            partial(
+                self.hyperion.aget_actions,
+                account='telos.gpu',
+                filter=','.join([
+                    f'telos.gpu:{name}' for name in QUEUE_ACTIONS]),
+                sort='asc',
+                after=after,
+                limit=1000
+            ))
+
+    async def _read_status(self, request_id: int):
+        async with self._read_limiter:
+            return await failable(
+                partial(
+                    self.cleos.aget_table,
+                    'telos.gpu', request_id, 'status'))
+
+    async def get_status_by_request_id(self, request_id: int):
+        logging.info('get_status_by_request_id')
+        statuses = await self._read_status(request_id)
+        if statuses is None:
+            return []
+
+        return statuses
+
+    def invalidate_status(self, request_id: int):
+        if request_id in self._status_cache:
+            del self._status_cache[request_id]
+
+    def _cached_status(self, req: dict, now: float):
+        entry = self._status_cache.get(req['id'])
+        if (not entry or
+            entry['row'] != req or
+            now - entry['time'] > self.status_ttl):
+            return None
+
+        return entry['statuses']
 
     async def get_global_config(self):
         logging.info('get_global_config')
@@ -125,7 +216,7 @@ class SkynetGPUConnector:
         return set(competitors)
 
 
-    async def get_full_queue_snapshot(self):
+    async def get_full_queue_snapshot(self, refresh: set[int] = set()):
         snap = {
             'requests': {},
             'my_results': []
@@ -133,14 +224,43 @@ class SkynetGPUConnector:
 
         snap['queue'] = await self.get_work_requests_last_hour()
 
+        now = time.time()
+
+        # forget requests that left the queue
+        queue_ids = set(req['id'] for req in snap['queue'])
+        for request_id in list(self._status_cache.keys()):
+            if request_id not in queue_ids:
+                del self._status_cache[request_id]
+
         async def _run_and_save(d, key: str, fn, *args, **kwargs):
             d[key] = await fn(*args, **kwargs)
 
+        async def _read_and_cache(req: dict):
+            statuses = await self._read_status(req['id'])
+            if statuses is None:
+                # read failed, don't cache it
+                snap['requests'][req['id']] = []
+                return
+
+            self._status_cache[req['id']] = {
+                'row': req,
+                'statuses': statuses,
+                'time': now
+            }
+            snap['requests'][req['id']] = statuses
+
         async with trio.open_nursery() as n:
             n.start_soon(_run_and_save, snap, 'my_results', self.find_my_results)
             for req in snap['queue']:
-                n.start_soon(
-                    _run_and_save, snap['requests'], req['id'], self.get_status_by_request_id, req['id'])
+                statuses = None
+                if req['id'] not in refresh:
+                    statuses = self._cached_status(req, now)
+
+                if statuses is not None:
+                    snap['requests'][req['id']] = statuses
+
+                else:
+                    n.start_soon(_read_and_cache, req)
 
         return snap
 
@@ -239,20 +359,38 @@ class SkynetGPUConnector:
         )
 
     # IPFS helpers
-    async def publish_on_ipfs(self, raw, typ: str = 'png'):
+    async def publish_on_ipfs(self, raw: bytes, typ: str = 'png'):
         Path('ipfs-staging').mkdir(exist_ok=True)
         logging.info('publish_on_ipfs')
 
+        # several publishes can be in flight, give each its own staging file
         target_file = ''
         match typ:
             case 'png':
-                raw: Image
-                target_file = 'ipfs-staging/image.png'
-                raw.save(target_file)
+                target_file = f'ipfs-staging/{uuid4().hex}.png'
+                await trio.Path(target_file).write_bytes(raw)
+
+            case 'zip':
+                # published as a directory, one file per image
+                target_file = f'ipfs-staging/{uuid4().hex}'
+                Path(target_file).mkdir()
+                for name, image in unpack_images(raw).items():
+                    await trio.Path(target_file, name).write_bytes(image)
 
             case _:
                 raise ValueError(f'Unsupported output type: {typ}')
 
+        try:
+            return await self._add_and_pin(Path(target_file))
+
+        finally:
+            if Path(target_file).is_dir():
+                shutil.rmtree(target_file, ignore_errors=True)
+
+            else:
+                Path(target_file).unlink(missing_ok=True)
+
+    async def _add_and_pin(self, target_file: Path):
         if self.ipfs_gateway_url:
             # check peer connections, reconnect to skynet gateway if not
             gateway_id = Path(self.ipfs_gateway_url).name
@@ -260,7 +398,13 @@ class SkynetGPUConnector:
             if gateway_id not in [p['Peer'] for p in peers]:
                 await self.ipfs_client.connect(self.ipfs_gateway_url)
 
-        file_info = await self.ipfs_client.add(Path(target_file))
+        if target_file.is_dir():
+            file_info = await self.ipfs_client.add_directory(
+                sorted(target_file.iterdir()))
+
+        else:
+            file_info = await self.ipfs_client.add(target_file)
+
         file_cid = file_info['Hash']
 
         await self.ipfs_client.pin(file_cid)
@@ -279,6 +423,7 @@ class SkynetGPUConnector:
 
         async with trio.open_nursery() as n:
             async def get_and_set_results(link: str):
+                nonlocal input_type
                 res = await get_ipfs_file(link, timeout=1)
                 logging.info(f'got response from {link}')
                 if not res or res.status_code != 200:
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+import time
+import sqlite3
+import logging
+import threading
+
+
+DEFAULT_OUTBOX_PATH = 'outbox.db'
+
+# seconds between retries of a failed action, doubles up to the max
+DEFAULT_OUTBOX_BACKOFF = 2
+DEFAULT_OUTBOX_MAX_BACKOFF = 300
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    rid INTEGER PRIMARY KEY,
+    action TEXT NOT NULL,
+    request_hash TEXT,
+    output_hash TEXT,
+    output_type TEXT,
+    output BLOB,
+    ipfs_hash TEXT,
+    reason TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+)
+'''
+
+
+# journal of the chain actions we owe for requests we worked on, a row is
+# written as soon as a job finishes computing (or fails) and only deleted
+# once the chain confirms it, so results survive failed submits & restarts
+#
+# writes can carry multi MB outputs, the daemon runs them on worker threads
+# so the connection is shared across threads behind a lock
+#
+#   'submit': output waiting to be published and/or submitted
+#   'cancel': workcancel waiting to go through
+class SkynetOutbox:
+
+    def __init__(
+        self,
+        path: str = DEFAULT_OUTBOX_PATH,
+        backoff: float = DEFAULT_OUTBOX_BACKOFF,
+        max_backoff: float = DEFAULT_OUTBOX_MAX_BACKOFF
+    ):
+        self.path = path
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute(_SCHEMA)
+
+        # membership is checked on every claim, keep it off the db
+        self._rids = set(
+            row['rid'] for row in self._db.execute('SELECT rid FROM outbox'))
+
+        if self._rids:
+            logging.info(f'outbox has {len(self._rids)} pending actions')
+
+    def __len__(self):
+        return len(self._rids)
+
+    def __contains__(self, request_id: int):
+        return request_id in self._rids
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add_submit(
+        self,
+        request_id: int,
+        request_hash: str,
+        output_hash: str,
+        output_type: str,
+        output: bytes
+    ):
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO outbox '
+                '(rid, action, request_hash, output_hash, output_type, output, created) '
+                'VALUES (?, \'submit\', ?, ?, ?, ?, ?)',
+                (request_id, request_hash, output_hash, output_type, output, time.time())
+            )
+
+        self._rids.add(request_id)
+
+    def add_cancel(self, request_id: int, reason: str):
+        # supersedes a pending submit, keeps the original creation time and
+        # the backoff of a cancel being retried
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT INTO outbox (rid, action, reason, created) '
+                'VALUES (?, \'cancel\', ?, ?) '
+                'ON CONFLICT(rid) DO UPDATE SET '
+                'action = \'cancel\', reason = excluded.reason, output = NULL, '
+                'attempts = CASE WHEN action = \'cancel\' THEN attempts ELSE 0 END, '
+                'next_attempt = CASE WHEN action = \'cancel\' THEN next_attempt ELSE 0 END',
+                (request_id, reason, time.time())
+            )
+
+        self._rids.add(request_id)
+
+    def set_ipfs_hash(self, request_id: int, ipfs_hash: str):
+        # output is pinned, no need to keep a copy around
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE outbox SET ipfs_hash = ?, output = NULL WHERE rid = ?',
+                (ipfs_hash, request_id)
+            )
+
+    def retry_later(self, request_id: int, now: float | None = None):
+        now = now if now else time.time()
+        with self._lock:
+            row = self.get(request_id)
+            if not row:
+                return
+
+            delay = min(self.backoff * (2 ** row['attempts']), self.max_backoff)
+            with self._db:
+                self._db.execute(
+                    'UPDATE outbox SET attempts = attempts + 1, next_attempt = ? '
+                    'WHERE rid = ?',
+                    (now + delay, request_id)
+                )
+
+    def remove(self, request_id: int):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM outbox WHERE rid = ?', (request_id,))
+
+        self._rids.discard(request_id)
+
+    def get(self, request_id: int) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT * FROM outbox WHERE rid = ?', (request_id,)).fetchone()
+
+        return dict(row) if row else None
+
+    def pending(self) -> list[dict]:
+        with self._lock:
+            return [
+                dict(row)
+                for row in self._db.execute('SELECT * FROM outbox ORDER BY rid')
+            ]
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+import time
+import logging
+
+from typing import TYPE_CHECKING
+from collections import OrderedDict
+
+import trio
+
+from skynet.utils import crop_image
+from skynet.dgpu.errors import DGPUComputeError
+from skynet.dgpu.metrics import INPUT_FETCH_SECONDS
+
+# only for the annotation, importing the connector pulls in leap
+if TYPE_CHECKING:
+    from skynet.dgpu.network import SkynetGPUConnector
+
+
+DEFAULT_PREFETCH_SIZE = 4
+
+
+# bounded cache of downloaded, decoded & cropped request inputs, filled in
+# the background for the most likely next img2img candidates so a claimed
+# job can start computing without waiting on ipfs
+class SkynetInputPrefetcher:
+
+    def __init__(
+        self,
+        conn: 'SkynetGPUConnector',
+        size: int = DEFAULT_PREFETCH_SIZE
+    ):
+        self.conn = conn
+        self.size = size
+
+        self._cache = OrderedDict()
+        self._pending = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, ipfs_hash: str, params: dict):
+        return (ipfs_hash, int(params['width']), int(params['height']))
+
+    async def _load(self, ipfs_hash: str, params: dict):
+        start = time.time()
+        binary, input_type = await self.conn.get_input_data(ipfs_hash)
+        if input_type == 'png':
+            # force decode & crop off the event loop
+            binary = await trio.to_thread.run_sync(
+                crop_image, binary, int(params['width']), int(params['height']))
+
+        INPUT_FETCH_SECONDS.observe(time.time() - start)
+        return binary, input_type
+
+    async def _prefetch_one(self, ipfs_hash: str, params: dict):
+        key = self._key(ipfs_hash, params)
+        if key in self._cache or key in self._pending:
+            return
+
+        done = trio.Event()
+        self._pending[key] = done
+        try:
+            self._cache[key] = await self._load(ipfs_hash, params)
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+
+            logging.info(f'prefetched input {ipfs_hash}')
+
+        except (Exception, DGPUComputeError) as e:
+            logging.warning(f'couldn\'t prefetch input {ipfs_hash}: {e}')
+
+        finally:
+            del self._pending[key]
+            done.set()
+
+    async def prefetch(self, bodies: list[tuple[str, dict]]):
+        async with trio.open_nursery() as n:
+            for ipfs_hash, params in bodies[:self.size]:
+                n.start_soon(self._prefetch_one, ipfs_hash, params)
+
+    async def get(self, ipfs_hash: str, params: dict):
+        if ipfs_hash == '':
+            return b'', 'none'
+
+        key = self._key(ipfs_hash, params)
+        if key in self._pending:
+            await self._pending[key].wait()
+
+        if key in self._cache:
+            self.hits += 1
+            return self._cache.pop(key)
+
+        self.misses += 1
+        try:
+            return await self._load(ipfs_hash, params)
+
+        except DGPUComputeError:
+            raise
+
+        except Exception as e:
+            # truncated or corrupt images only fail once decoded
+            raise DGPUComputeError(f'bad input {ipfs_hash}: {e}')
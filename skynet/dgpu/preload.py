@@ -0,0 +1,94 @@
+#!/usr/bin/python
+
+import logging
+
+from collections import Counter
+
+
+# weight kept by the enqueue rate on every update, the rate is the number of
+# new requests per snapshot update smoothed exponentially
+DEFAULT_RATE_DECAY = 0.9
+
+
+def entry_key(entry: dict) -> tuple[str, bool]:
+    return (entry['model'], entry['req']['binary_data'] != '')
+
+
+# guesses which (model, image) pipeline the next claim will need from the
+# model mix currently on the queue plus how fast new requests for each one
+# have been showing up, keeps track of how many of its guesses paid off
+class SkynetModelPreloader:
+
+    def __init__(self, rate_decay: float = DEFAULT_RATE_DECAY):
+        self.rate_decay = rate_decay
+
+        self._known = set()
+        self._demand = Counter()
+        self._rates = {}
+
+        # preloaded & not claimed yet
+        self._pending = set()
+
+        self.preloads = 0
+        self.hits = 0
+
+    def update(self, entries):
+        demand = Counter()
+        new = Counter()
+        known = set()
+        for entry in entries:
+            key = entry_key(entry)
+            demand[key] += 1
+            known.add(entry['id'])
+            if entry['id'] not in self._known:
+                new[key] += 1
+
+        for key in set(self._rates) | set(new):
+            self._rates[key] = self._rates.get(key, 0) * self.rate_decay + new[key]
+
+        self._known = known
+        self._demand = demand
+
+    def scores(self) -> dict[tuple[str, bool], float]:
+        return {
+            key: self._demand.get(key, 0) + self._rates.get(key, 0)
+            for key in set(self._demand) | set(self._rates)
+        }
+
+    def choose(self, skip) -> tuple[str, bool] | None:
+        '''
+        Best scoring key `skip(key)` doesn't rule out, usually the ones
+        already loaded somewhere
+        '''
+        ranked = sorted(
+            self.scores().items(), key=lambda item: item[1], reverse=True)
+        for key, score in ranked:
+            if score <= 0:
+                break
+
+            if not skip(key):
+                logging.info(
+                    f'preload candidate {key[0]} (image: {key[1]}), '
+                    f'score {score:.2f}')
+                return key
+
+        return None
+
+    def preloaded(self, key: tuple[str, bool]):
+        self._pending.add(key)
+        self.preloads += 1
+
+    def claimed(self, key: tuple[str, bool]) -> bool:
+        if key not in self._pending:
+            return False
+
+        self._pending.discard(key)
+        self.hits += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'preloads': self.preloads,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.preloads if self.preloads else 0
+        }
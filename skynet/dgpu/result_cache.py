@@ -0,0 +1,155 @@
+#!/usr/bin/python
+
+import os
+import json
+import logging
+import threading
+
+from hashlib import sha256
+from pathlib import Path
+from collections import OrderedDict
+
+
+DEFAULT_RESULT_CACHE_PATH = 'result-cache'
+DEFAULT_RESULT_CACHE_SIZE = 1024 ** 3
+
+
+def result_key(method: str, params: dict, input_cid: str) -> str:
+    # pipelines run deterministic, same inputs same output
+    canonical = json.dumps(
+        {'method': method, 'params': params, 'input': input_cid},
+        sort_keys=True,
+        separators=(',', ':')
+    )
+    return sha256(canonical.encode()).hexdigest()
+
+
+# on disk LRU of encoded outputs keyed by `result_key`, each entry is an
+# output file plus a small json with its hashes, recency is the file mtime
+# so it survives restarts, the daemon does the file io on worker threads so
+# the index is guarded by a lock
+class SkynetResultCache:
+
+    def __init__(
+        self,
+        path: str = DEFAULT_RESULT_CACHE_PATH,
+        max_bytes: int = DEFAULT_RESULT_CACHE_SIZE
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        # key -> output size, least recently used first
+        self._entries = OrderedDict()
+        self.size = 0
+
+        self._lock = threading.Lock()
+
+        if self.max_bytes > 0:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    def _output_path(self, key: str) -> Path:
+        return self.path / f'{key}.out'
+
+    def _meta_path(self, key: str) -> Path:
+        return self.path / f'{key}.json'
+
+    def _load(self):
+        outputs = sorted(
+            self.path.glob('*.out'), key=lambda p: p.stat().st_mtime)
+        for output in outputs:
+            key = output.stem
+            if not self._meta_path(key).is_file():
+                output.unlink()
+                continue
+
+            size = output.stat().st_size
+            self._entries[key] = size
+            self.size += size
+
+        self._evict()
+        logging.info(
+            f'result cache has {len(self._entries)} entries, {self.size} bytes')
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def __contains__(self, key: str):
+        return key in self._entries
+
+    def _drop(self, key: str):
+        self.size -= self._entries.pop(key)
+        self._output_path(key).unlink(missing_ok=True)
+        self._meta_path(key).unlink(missing_ok=True)
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+
+    def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+
+            try:
+                meta = json.loads(self._meta_path(key).read_text())
+                output = self._output_path(key).read_bytes()
+
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f'dropping broken result cache entry {key}: {e}')
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            os.utime(self._output_path(key))
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return {**meta, 'output': output}
+
+    def put(
+        self,
+        key: str,
+        output: bytes,
+        output_hash: str,
+        output_type: str,
+        ipfs_hash: str | None = None
+    ):
+        if not self.enabled or len(output) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+            self._output_path(key).write_bytes(output)
+            self._meta_path(key).write_text(json.dumps({
+                'output_hash': output_hash,
+                'output_type': output_type,
+                'ipfs_hash': ipfs_hash
+            }))
+
+            self._entries[key] = len(output)
+            self.size += len(output)
+            self._evict()
+
+    def set_ipfs_hash(self, key: str, ipfs_hash: str):
+        with self._lock:
+            if key not in self._entries:
+                return
+
+            meta_path = self._meta_path(key)
+            meta = json.loads(meta_path.read_text())
+            meta['ipfs_hash'] = ipfs_hash
+            meta_path.write_text(json.dumps(meta))
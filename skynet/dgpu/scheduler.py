@@ -0,0 +1,277 @@
+#!/usr/bin/python
+
+import json
+import time
+import logging
+
+from bisect import bisect_left, insort
+from pathlib import Path
+from datetime import datetime, timezone
+
+
+# requests older than this fall out of the worker queue view
+QUEUE_WINDOW = 3600
+
+# uncalibrated defaults, refined from our own job timings as they complete
+DEFAULT_STEP_SECONDS = 0.1      # per step per megapixel
+DEFAULT_UPSCALE_SECONDS = 1.5   # per input megapixel
+DEFAULT_SWAP_SECONDS = 20
+
+# weight of a new observation on the running estimates
+DEFAULT_LEARNING_RATE = 0.2
+
+# min seconds between cost model writes, observations land on the event loop
+# after every job
+DEFAULT_SAVE_INTERVAL = 60
+
+
+def request_timestamp(req: dict) -> float | None:
+    try:
+        ts = datetime.fromisoformat(req['timestamp'])
+        if not ts.tzinfo:
+            ts = ts.replace(tzinfo=timezone.utc)
+
+        return ts.timestamp()
+
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def job_shape(params: dict, image: bool) -> tuple[float, float]:
+    # 'diffuse_batch' requests run & upscale every image, count the
+    # megapixels of all of them
+    megapixels = (
+        int(params['width']) * int(params['height']) / (10 ** 6) *
+        int(params.get('num_images', 1))
+    )
+    steps = int(params['step'])
+    if image and 'strength' in params:
+        # img2img only runs the noised part of the schedule
+        steps = max(int(steps * float(params['strength'])), 1)
+
+    return steps, megapixels
+
+
+# estimates gpu seconds per request from model, size, steps & upscaler,
+# calibrated with exponential moving averages of observed job timings
+class SkynetCostModel:
+
+    def __init__(
+        self,
+        path: str | None = None,
+        learning_rate: float = DEFAULT_LEARNING_RATE,
+        save_interval: float = DEFAULT_SAVE_INTERVAL
+    ):
+        self.path = path
+        self.learning_rate = learning_rate
+        self.save_interval = save_interval
+        self._last_save = time.time()
+
+        self.step_seconds = {}
+        self.swap_seconds = {}
+        self.upscale_seconds = DEFAULT_UPSCALE_SECONDS
+
+        # bumped on every change to the estimates, lets schedulers cache
+        self.version = 0
+
+        if path and Path(path).is_file():
+            self.load()
+
+    def load(self):
+        with open(self.path, 'r') as cost_file:
+            state = json.load(cost_file)
+
+        self.step_seconds = state.get('step_seconds', {})
+        self.swap_seconds = state.get('swap_seconds', {})
+        self.upscale_seconds = state.get(
+            'upscale_seconds', DEFAULT_UPSCALE_SECONDS)
+        self.version += 1
+
+    def save(self):
+        if not self.path:
+            return
+
+        with open(self.path, 'w') as cost_file:
+            json.dump({
+                'step_seconds': self.step_seconds,
+                'swap_seconds': self.swap_seconds,
+                'upscale_seconds': self.upscale_seconds
+            }, cost_file, indent=4)
+
+        self._last_save = time.time()
+
+    def maybe_save(self):
+        if time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def _update(self, current: float, observed: float) -> float:
+        return current + self.learning_rate * (observed - current)
+
+    def compute_estimate(self, model: str, params: dict, image: bool) -> float:
+        steps, megapixels = job_shape(params, image)
+        estimate = (
+            steps * megapixels *
+            self.step_seconds.get(model, DEFAULT_STEP_SECONDS)
+        )
+        if params.get('upscaler') == 'x4':
+            estimate += megapixels * self.upscale_seconds
+
+        return estimate
+
+    def estimate(
+        self,
+        model: str,
+        params: dict,
+        image: bool,
+        loaded: bool = True
+    ) -> float:
+        estimate = self.compute_estimate(model, params, image)
+        if not loaded:
+            estimate += self.swap_seconds.get(model, DEFAULT_SWAP_SECONDS)
+
+        return estimate
+
+    def observe(
+        self,
+        model: str,
+        params: dict,
+        image: bool,
+        elapsed: float,
+        loaded: bool = True
+    ):
+        steps, megapixels = job_shape(params, image)
+        diffuse = (
+            steps * megapixels *
+            self.step_seconds.get(model, DEFAULT_STEP_SECONDS)
+        )
+
+        if not loaded:
+            # attribute what the compute estimate doesn't explain to the swap
+            swap = elapsed - self.compute_estimate(model, params, image)
+            self.swap_seconds[model] = self._update(
+                self.swap_seconds.get(model, DEFAULT_SWAP_SECONDS),
+                max(swap, 0)
+            )
+
+        elif params.get('upscaler') == 'x4':
+            # step figures come from plain jobs, what they don't explain on
+            # an upscaled one is the upscaler's
+            self.upscale_seconds = self._update(
+                self.upscale_seconds,
+                max(elapsed - diffuse, 0) / megapixels
+            )
+
+        else:
+            step_seconds = elapsed / (steps * megapixels)
+            self.step_seconds[model] = self._update(
+                self.step_seconds.get(model, DEFAULT_STEP_SECONDS),
+                step_seconds
+            )
+
+        self.version += 1
+        self.maybe_save()
+
+
+# original policy: highest reward first
+class SkynetRewardScheduler:
+
+    def rank(self, entries):
+        return entries
+
+    def observe(self, entry: dict, elapsed: float, loaded: bool):
+        ...
+
+    def save(self):
+        ...
+
+
+# ranks requests by reward per estimated gpu second, skipping the ones that
+# wouldn't finish before leaving the queue window
+class SkynetProfitScheduler:
+
+    def __init__(
+        self,
+        cost_model: SkynetCostModel,
+        is_model_loaded
+    ):
+        self.cost_model = cost_model
+        self.is_model_loaded = is_model_loaded
+
+        # request id -> (cost model version, loaded, order key, latest start),
+        # a score only changes with the estimates or its model getting
+        # loaded or evicted
+        self._scores = {}
+
+        # sorted (-reward per second, request id) keys of scored requests
+        self._order = []
+
+    def estimate(self, entry: dict) -> float:
+        image = entry['req']['binary_data'] != ''
+        return self.cost_model.estimate(
+            entry['model'],
+            entry['body']['params'],
+            image,
+            loaded=self.is_model_loaded(entry['model'], image)
+        )
+
+    def _forget(self, request_id: int):
+        cached = self._scores.pop(request_id, None)
+        if cached and cached[2]:
+            del self._order[bisect_left(self._order, cached[2])]
+
+    def _score(self, entry: dict):
+        rid = entry['id']
+        loaded = self.is_model_loaded(
+            entry['model'], entry['req']['binary_data'] != '')
+        cached = self._scores.get(rid)
+        if cached and cached[:2] == (self.cost_model.version, loaded):
+            return
+
+        self._forget(rid)
+
+        key = None
+        latest_start = None
+        try:
+            estimate = self.estimate(entry)
+            key = (-entry['reward'] / max(estimate, 0.001), rid)
+            insort(self._order, key)
+
+            enqueued = request_timestamp(entry['req'])
+            if enqueued:
+                latest_start = enqueued + QUEUE_WINDOW - estimate
+
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f'can\'t estimate request {rid}: {e}')
+
+        self._scores[rid] = (self.cost_model.version, loaded, key, latest_start)
+
+    def rank(self, entries):
+        live = {}
+        for entry in entries:
+            live[entry['id']] = entry
+            self._score(entry)
+
+        for rid in [rid for rid in self._scores if rid not in live]:
+            self._forget(rid)
+
+        # skip the ones that wouldn't finish before leaving the queue window
+        now = time.time()
+        ranked = []
+        for _, rid in self._order:
+            latest_start = self._scores[rid][3]
+            if latest_start is None or now <= latest_start:
+                ranked.append(live[rid])
+
+        return ranked
+
+    def observe(self, entry: dict, elapsed: float, loaded: bool):
+        self.cost_model.observe(
+            entry['model'],
+            entry['body']['params'],
+            entry['req']['binary_data'] != '',
+            elapsed,
+            loaded=loaded
+        )
+
+    def save(self):
+        self.cost_model.save()
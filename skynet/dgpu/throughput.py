@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+from array import array
+
+
+# jobs remembered per (model, width, height, upscaler) key
+DEFAULT_THROUGHPUT_WINDOW = 64
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+def throughput_key(model: str, params: dict) -> tuple:
+    return (
+        model,
+        int(params['width']),
+        int(params['height']),
+        params.get('upscaler')
+    )
+
+
+def steps_per_second(timings) -> float:
+    # first timestamp is taken right before the pipeline starts, the rest at
+    # the end of each step
+    if len(timings) < 2:
+        return 0
+
+    elapsed = timings[-1] - timings[0]
+    if elapsed <= 0:
+        return 0
+
+    return (len(timings) - 1) / elapsed
+
+
+def percentile(values, pct: float) -> float:
+    # nearest rank
+    if not values:
+        return 0
+
+    values = sorted(values)
+    rank = max(int(round(pct / 100 * len(values))), 1)
+    return values[min(rank, len(values)) - 1]
+
+
+# fixed size ring buffer of floats
+class _Window:
+
+    def __init__(self, size: int):
+        self._values = array('d', bytes(8 * size))
+        self._pos = 0
+        self.count = 0
+
+    def push(self, value: float):
+        self._values[self._pos] = value
+        self._pos = (self._pos + 1) % len(self._values)
+        self.count += 1
+
+    def values(self) -> array:
+        if self.count < len(self._values):
+            return self._values[:self.count]
+
+        return self._values
+
+    @property
+    def last(self) -> float:
+        if not self.count:
+            return 0
+
+        return self._values[self._pos - 1]
+
+
+# keeps the last `window` completed jobs per (model, width, height,
+# upscaler), memory is bounded by the number of keys seen
+class SkynetThroughputEstimator:
+
+    def __init__(
+        self,
+        window: int = DEFAULT_THROUGHPUT_WINDOW,
+        percentiles: tuple = DEFAULT_PERCENTILES
+    ):
+        self.window = window
+        self.percentiles = percentiles
+
+        self._speeds = {}
+        self._seconds = {}
+
+        self.last_speed = 0
+
+    def observe(self, model: str, params: dict, timings, elapsed: float):
+        key = throughput_key(model, params)
+        if key not in self._speeds:
+            self._speeds[key] = _Window(self.window)
+            self._seconds[key] = _Window(self.window)
+
+        speed = steps_per_second(timings)
+        if speed > 0:
+            self._speeds[key].push(speed)
+            self.last_speed = speed
+
+        self._seconds[key].push(elapsed)
+
+    def _window_stats(self, window: _Window) -> dict:
+        values = window.values()
+        stats = {
+            'mean': sum(values) / len(values) if values else 0
+        }
+        for pct in self.percentiles:
+            stats[f'p{pct}'] = percentile(values, pct)
+
+        return stats
+
+    def _key_stats(self, key: tuple) -> dict:
+        return {
+            'jobs': self._seconds[key].count,
+            'steps_per_second': self._window_stats(self._speeds[key]),
+            'job_seconds': self._window_stats(self._seconds[key])
+        }
+
+    def stats(self, model: str, params: dict) -> dict | None:
+        key = throughput_key(model, params)
+        if key not in self._seconds:
+            return None
+
+        return self._key_stats(key)
+
+    def job_seconds(self, model: str, params: dict, pct: float = 50) -> float | None:
+        key = throughput_key(model, params)
+        if key not in self._seconds:
+            return None
+
+        return percentile(self._seconds[key].values(), pct)
+
+    def summary(self) -> list[dict]:
+        summary = []
+        for key in self._seconds:
+            model, width, height, upscaler = key
+            summary.append({
+                'model': model,
+                'width': width,
+                'height': height,
+                'upscaler': upscaler,
+                **self._key_stats(key)
+            })
+
+        return summary
@@ -0,0 +1,459 @@
+#!/usr/bin/python
+
+# in-process stand in for a nodeos running the telos.gpu contract, only
+# covers what the workers & frontends use: `aget_table`, `a_push_action` &
+# hyperion's `aget_actions`, no docker needed
+
+import random
+import logging
+
+from uuid import uuid4
+from hashlib import sha256
+from datetime import datetime, timezone
+
+import trio
+
+
+GPU_PRECISION = 4
+GPU_SYMBOL = 'GPU'
+
+
+def asset_to_int(asset) -> int:
+    amount, _ = str(asset).split(' ')
+    int_part, _, dec_part = amount.partition('.')
+    return int(int_part + dec_part.ljust(GPU_PRECISION, '0'))
+
+
+def int_to_asset(amount: int) -> str:
+    return f'{amount / (10 ** GPU_PRECISION):.{GPU_PRECISION}f} {GPU_SYMBOL}'
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _time_point_sec(ts: datetime) -> str:
+    return ts.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class FakeChainAssertion(Exception):
+    ...
+
+
+def _check(condition: bool, msg: str):
+    if not condition:
+        raise FakeChainAssertion(msg)
+
+
+# contract state & action semantics, shared by every client
+class FakeTelosGPU:
+
+    def __init__(self, token_contract: str = 'eosio.token'):
+        self.config = {
+            'token_contract': token_contract,
+            'token_symbol': f'{GPU_PRECISION},{GPU_SYMBOL}'
+        }
+
+        self.queue = {}     # request id -> row
+        self.status = {}    # request id -> list of rows
+        self.results = {}   # result id -> row
+        self.users = {}     # account -> row
+
+        self.actions = []   # hyperion style action log
+
+        self._next_request_id = 0
+        self._next_result_id = 0
+        self._global_sequence = 0
+
+    # helpers for test setups, no token contract to transfer from
+
+    def deposit(self, user: str, quantity: str):
+        user = str(user)
+        row = self.users.setdefault(
+            user, {'user': user, 'balance': int_to_asset(0), 'nonce': 0})
+        row['balance'] = int_to_asset(
+            asset_to_int(row['balance']) + asset_to_int(quantity))
+
+    def balance(self, user: str) -> str:
+        return self.users[str(user)]['balance']
+
+    # tables
+
+    def table_rows(self, scope, table: str) -> list[dict]:
+        match table:
+            case 'queue':
+                return list(self.queue.values())
+
+            case 'status':
+                return list(self.status.get(int(scope), []))
+
+            case 'results':
+                return list(self.results.values())
+
+            case 'users':
+                return list(self.users.values())
+
+            case 'config':
+                return [self.config]
+
+            case _:
+                raise FakeChainAssertion(f'unknown table {table}')
+
+    def _index_key(self, table: str, row: dict, index_position: int):
+        # secondary indexes of the real contract
+        match (table, index_position):
+            case ('queue', 2):
+                return datetime.fromisoformat(
+                    row['timestamp']).replace(tzinfo=timezone.utc).timestamp()
+
+            case ('results', 2):
+                return row['request_id']
+
+            case ('results', 3):
+                return row['user']
+
+            case ('results', 4):
+                return row['worker']
+
+            case ('users', _):
+                return row['user']
+
+            case ('status', _):
+                return row['worker']
+
+            case ('config', _):
+                return 0
+
+            case _:
+                return row['id']
+
+    def get_table(
+        self,
+        code: str,
+        scope,
+        table: str,
+        index_position: int = 1,
+        key_type: str = 'i64',
+        lower_bound = None,
+        upper_bound = None,
+        limit: int = 1000
+    ) -> list[dict]:
+        _check(str(code) == 'telos.gpu', f'unknown contract {code}')
+
+        rows = []
+        for row in self.table_rows(scope, table):
+            key = self._index_key(table, row, index_position)
+            if key_type == 'name':
+                lower = str(lower_bound) if lower_bound is not None else None
+                upper = str(upper_bound) if upper_bound is not None else None
+
+            else:
+                lower, upper = lower_bound, upper_bound
+
+            if lower is not None and key < lower:
+                continue
+
+            if upper is not None and key > upper:
+                continue
+
+            rows.append(dict(row))
+
+        rows.sort(key=lambda row: self._index_key(table, row, index_position))
+        return rows[:limit]
+
+    # actions
+
+    def _log(self, name: str, actor: str, data: dict, notified: set[str]) -> str:
+        self._global_sequence += 1
+        trx_id = uuid4().hex + uuid4().hex
+        timestamp = _now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+        self.actions.append({
+            '@timestamp': timestamp,
+            'timestamp': timestamp,
+            'global_sequence': self._global_sequence,
+            'trx_id': trx_id,
+            'act': {
+                'account': 'telos.gpu',
+                'name': name,
+                'authorization': [{'actor': actor, 'permission': 'active'}],
+                'data': data
+            },
+            'notified': ['telos.gpu', actor, *notified]
+        })
+        return trx_id
+
+    def _get_request(self, request_id: int) -> dict:
+        request_id = int(request_id)
+        _check(request_id in self.queue, 'request not found')
+        return self.queue[request_id]
+
+    def _erase_request(self, request_id: int):
+        del self.queue[request_id]
+        if request_id in self.status:
+            del self.status[request_id]
+
+    def apply(self, name: str, data: dict, actor: str) -> tuple[str, str]:
+        '''
+        Run an action, returns its console output & transaction id, raises
+        `FakeChainAssertion` like the contract would abort
+        '''
+        data = {key: value if isinstance(value, (int, float)) else str(value)
+                for key, value in data.items()}
+        console = ''
+        notified = set()
+
+        match name:
+            case 'config':
+                _check(actor == 'telos.gpu', 'missing authority of telos.gpu')
+                self.config = {
+                    'token_contract': data['token_contract'],
+                    'token_symbol': data['token_symbol']
+                }
+
+            case 'enqueue':
+                user = data['user']
+                _check(actor == user, f'missing authority of {user}')
+                _check(user in self.users, 'user not found')
+
+                reward = asset_to_int(data['reward'])
+                account = self.users[user]
+                balance = asset_to_int(account['balance'])
+                _check(balance >= reward, 'insufficient balance')
+                account['balance'] = int_to_asset(balance - reward)
+
+                request_id = self._next_request_id
+                self._next_request_id += 1
+
+                nonce = account['nonce']
+                account['nonce'] += 1
+
+                self.queue[request_id] = {
+                    'id': request_id,
+                    'user': user,
+                    'reward': data['reward'],
+                    'min_verification': int(data['min_verification']),
+                    'nonce': nonce,
+                    'body': data['request_body'],
+                    'binary_data': data['binary_data'],
+                    'timestamp': _time_point_sec(_now())
+                }
+                self.status[request_id] = []
+                console = f'{request_id}:{nonce}'
+
+            case 'dequeue':
+                user = data['user']
+                _check(actor == user, f'missing authority of {user}')
+                req = self._get_request(data['request_id'])
+                _check(req['user'] == user, 'not your request')
+
+                self.deposit(user, req['reward'])
+                self._erase_request(req['id'])
+
+            case 'workbegin':
+                worker = data['worker']
+                _check(actor == worker, f'missing authority of {worker}')
+                req = self._get_request(data['request_id'])
+
+                statuses = self.status[req['id']]
+                _check(
+                    worker not in [s['worker'] for s in statuses],
+                    'request already started')
+                _check(
+                    len(statuses) < int(data['max_workers']),
+                    'too many workers')
+
+                statuses.append({
+                    'worker': worker,
+                    'status': 'started',
+                    'started': _time_point_sec(_now())
+                })
+                notified.add(req['user'])
+
+            case 'workcancel':
+                worker = data['worker']
+                _check(actor == worker, f'missing authority of {worker}')
+                req = self._get_request(data['request_id'])
+
+                statuses = self.status[req['id']]
+                _check(
+                    worker in [s['worker'] for s in statuses],
+                    'request not started by worker')
+                self.status[req['id']] = [
+                    s for s in statuses if s['worker'] != worker]
+                notified.add(req['user'])
+
+            case 'submit':
+                worker = data['worker']
+                _check(actor == worker, f'missing authority of {worker}')
+                req = self._get_request(data['request_id'])
+
+                _check(
+                    worker in [s['worker'] for s in self.status[req['id']]],
+                    'request not started by worker')
+
+                request_hash = sha256(
+                    (str(req['nonce']) + req['body'] + req['binary_data']).encode()
+                ).hexdigest()
+                _check(
+                    data['request_hash'].lower() == request_hash,
+                    'request hash mismatch')
+
+                result_id = self._next_result_id
+                self._next_result_id += 1
+                self.results[result_id] = {
+                    'id': result_id,
+                    'request_id': req['id'],
+                    'user': req['user'],
+                    'worker': worker,
+                    'result_hash': data['result_hash'],
+                    'ipfs_hash': data['ipfs_hash'],
+                    'submited': _time_point_sec(_now())
+                }
+
+                self.deposit(worker, req['reward'])
+                self._erase_request(req['id'])
+                notified.add(req['user'])
+
+            case 'withdraw':
+                user = data['user']
+                _check(actor == user, f'missing authority of {user}')
+                _check(user in self.users, 'user not found')
+
+                quantity = asset_to_int(data['quantity'])
+                account = self.users[user]
+                balance = asset_to_int(account['balance'])
+                _check(quantity <= balance, 'insufficient balance')
+                account['balance'] = int_to_asset(balance - quantity)
+
+            case 'clean':
+                _check(actor == 'telos.gpu', 'missing authority of telos.gpu')
+                self.queue = {}
+                self.status = {}
+                self.results = {}
+
+            case _:
+                raise FakeChainAssertion(f'unknown action {name}')
+
+        trx_id = self._log(name, actor, data, notified)
+        return console, trx_id
+
+    def get_actions(
+        self,
+        account: str | None = None,
+        filter: str | None = None,
+        sort: str = 'desc',
+        after: str | None = None,
+        limit: int = 1000
+    ) -> dict:
+        names = None
+        if filter:
+            names = set(
+                f.split(':')[1] for f in filter.split(',') if ':' in f)
+
+        actions = []
+        for action in self.actions:
+            if names and action['act']['name'] not in names:
+                continue
+
+            if account and str(account) not in action['notified']:
+                continue
+
+            if after and action['@timestamp'] <= after:
+                continue
+
+            actions.append(action)
+
+        if sort == 'desc':
+            actions.reverse()
+
+        return {'actions': actions[:limit]}
+
+
+# the `leap.cleos.CLEOS` async surface backed by a `FakeTelosGPU`, each
+# client gets its own latency & failure settings, failures are raised as
+# connection errors so they look like a flaky node to the caller
+class FakeCLEOS:
+
+    def __init__(
+        self,
+        chain: FakeTelosGPU,
+        latency: float = 0,
+        failure_rate: float = 0,
+        seed: int | None = None
+    ):
+        self.chain = chain
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+        self.calls = 0
+        self.failures = 0
+
+    async def _round_trip(self):
+        self.calls += 1
+        if self.latency > 0:
+            await trio.sleep(self.latency)
+
+        if self._random.random() < self.failure_rate:
+            self.failures += 1
+            raise ConnectionError('injected node failure')
+
+    async def aget_table(self, code: str, scope, table: str, **kwargs) -> list[dict]:
+        await self._round_trip()
+        return self.chain.get_table(code, scope, table, **kwargs)
+
+    async def a_push_action(
+        self,
+        account: str,
+        action: str,
+        data: dict,
+        actor: str,
+        key: str,
+        permission: str = 'active'
+    ) -> dict:
+        # state changes land at the end of the round trip, concurrent
+        # pushes from different clients race like they would on a node
+        await self._round_trip()
+        try:
+            _check(str(account) == 'telos.gpu', f'unknown contract {account}')
+            console, trx_id = self.chain.apply(action, data, str(actor))
+
+        except FakeChainAssertion as e:
+            logging.info(f'{actor} {action} failed: {e}')
+            return {
+                'code': 500,
+                'message': 'Internal Service Error',
+                'error': {
+                    'code': 3050003,
+                    'name': 'eosio_assert_message_exception',
+                    'what': 'eosio_assert_message assertion failure',
+                    'details': [{
+                        'message': f'assertion failure with message: {e}'
+                    }]
+                }
+            }
+
+        return {
+            'transaction_id': trx_id,
+            'processed': {
+                'id': trx_id,
+                'action_traces': [{
+                    'act': {'account': 'telos.gpu', 'name': action},
+                    'console': console
+                }]
+            }
+        }
+
+
+# hyperion `aget_actions` over the fake chain's action log
+class FakeHyperion:
+
+    def __init__(self, chain: FakeTelosGPU, latency: float = 0):
+        self.chain = chain
+        self.latency = latency
+
+    async def aget_actions(self, **kwargs) -> dict:
+        if self.latency > 0:
+            await trio.sleep(self.latency)
+
+        return self.chain.get_actions(**kwargs)
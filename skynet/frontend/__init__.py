@@ -3,6 +3,7 @@
 import random
 
 from ..constants import *
+from ..dgpu.batch import image_name
 
 
 class ConfigRequestFormatError(BaseException):
@@ -84,6 +85,9 @@ def validate_user_config_request(req: str):
                         raise ConfigUnknownUpscaler(
                             f'\"{val}\" is not a valid upscaler')
 
+                case 'images':
+                    val = max(min(int(params[2]), MAX_IMAGES), 1)
+
                 case 'autoconf':
                     val = params[2]
                     if val == 'on':
@@ -129,3 +133,32 @@ def perform_auto_conf(config: dict) -> dict:
     config['height'] = prefered_size_h
 
     return config
+
+
+def diffuse_request_body(params: dict) -> dict:
+    '''
+    Request body for a user's params, more than one image asks for a single
+    'diffuse_batch' request with a seed per image
+    '''
+    params = dict(params)
+    images = params.pop('images', None) or DEFAULT_IMAGES
+    if images <= 1:
+        return {'method': 'diffuse', 'params': params}
+
+    return {
+        'method': 'diffuse_batch',
+        'params': {
+            **params,
+            'num_images': images,
+            'seeds': [int(params['seed']) + i for i in range(images)]
+        }
+    }
+
+
+def result_image_links(ipfs_link: str, params: dict) -> list[str]:
+    # batch results are published as a directory with one file per image
+    images = params.get('images') or DEFAULT_IMAGES
+    if images <= 1:
+        return [ipfs_link]
+
+    return [f'{ipfs_link}/{image_name(i)}' for i in range(images)]
@@ -22,6 +22,7 @@ import io
 from skynet.db import open_database_connection
 from skynet.ipfs import get_ipfs_file, AsyncIPFSHTTP
 from skynet.constants import *
+from skynet.frontend import diffuse_request_body, result_image_links
 
 from . import *
 from .bot import DiscordBot
@@ -136,10 +137,7 @@ class SkynetDiscordFrontend:
 
             sanitized_params[key] = val
 
-        body = json.dumps({
-            'method': 'diffuse',
-            'params': sanitized_params
-        })
+        body = json.dumps(diffuse_request_body(sanitized_params))
         request_time = datetime.now().isoformat()
 
         await status_msg.delete()
@@ -266,20 +264,16 @@ class SkynetDiscordFrontend:
                 except UnidentifiedImageError:
                     logging.warning(f'couldn\'t get ipfs binary data at {link}!')
 
-        tasks = [
-            get_and_set_results(ipfs_link),
-            get_and_set_results(ipfs_link_legacy)
-        ]
-        await asyncio.gather(*tasks)
+        # batch results are published as a directory, one file per image
+        image_links = result_image_links(ipfs_link, params)
+        links = image_links
+        if len(image_links) == 1:
+            links = [ipfs_link, ipfs_link_legacy]
 
-        png_img = None
-        if ipfs_link_legacy in results:
-            png_img = results[ipfs_link_legacy]
+        await asyncio.gather(*[get_and_set_results(link) for link in links])
 
-        if ipfs_link in results:
-            png_img = results[ipfs_link]
-
-        if not png_img:
+        png_imgs = [results[link] for link in links if link in results]
+        if not png_imgs:
             await self.update_status_message(
                 status_msg,
                 caption,
@@ -302,10 +296,17 @@ class SkynetDiscordFrontend:
             if file_id:  # img2img
                 embed.set_thumbnail(
                     url='https://ipfs.skygpu.net/ipfs/' + binary_data + '/image.png')
-                embed.set_image(url=ipfs_link)
-                await send(embed=embed, view=SkynetView(self))
-            else:  # txt2img
-                embed.set_image(url=ipfs_link)
-                await send(embed=embed, view=SkynetView(self))
+
+            embed.set_image(url=image_links[0])
+            if len(image_links) > 1:
+                embed.add_field(
+                    name='Images',
+                    value=' '.join(
+                        f'[**{i}**]({link})'
+                        for i, link in enumerate(image_links)
+                    )
+                )
+
+            await send(embed=embed, view=SkynetView(self))
 
         return True
@@ -23,6 +23,7 @@ from telebot.async_telebot import AsyncTeleBot
 from skynet.db import open_database_connection
 from skynet.ipfs import get_ipfs_file, AsyncIPFSHTTP
 from skynet.constants import *
+from skynet.frontend import diffuse_request_body, result_image_links
 
 from . import *
 
@@ -128,10 +129,7 @@ class SkynetTelegramFrontend:
 
             sanitized_params[key] = val
 
-        body = json.dumps({
-            'method': 'diffuse',
-            'params': sanitized_params
-        })
+        body = json.dumps(diffuse_request_body(sanitized_params))
         request_time = datetime.now().isoformat()
 
         await self.update_status_message(
@@ -269,6 +267,37 @@ class SkynetTelegramFrontend:
                 except UnidentifiedImageError:
                     logging.warning(f'couldn\'t get ipfs binary data at {link}!')
 
+        image_links = result_image_links(ipfs_link, params)
+        if len(image_links) > 1:
+            await asyncio.gather(
+                *[get_and_set_results(link) for link in image_links])
+
+            png_imgs = [results[link] for link in image_links if link in results]
+            if not png_imgs:
+                await self.update_status_message(
+                    status_msg,
+                    caption,
+                    reply_markup=build_redo_menu(),
+                    parse_mode='HTML'
+                )
+                return True
+
+            logging.info(f'success! sending {len(png_imgs)} generated images')
+            await self.bot.delete_message(
+                chat_id=status_msg.chat.id, message_id=status_msg.id)
+            await self.bot.send_media_group(
+                status_msg.chat.id,
+                media=[
+                    InputMediaPhoto(
+                        png_img,
+                        caption=caption if i == 0 else None,
+                        parse_mode='HTML'
+                    )
+                    for i, png_img in enumerate(png_imgs)
+                ]
+            )
+            return True
+
         tasks = [
             get_and_set_results(ipfs_link),
             get_and_set_results(ipfs_link_legacy)
@@ -1,5 +1,6 @@
 #!/usr/bin/python
 
+import json
 import logging
 from pathlib import Path
 
@@ -36,6 +37,25 @@ class AsyncIPFSHTTP:
             params=kwargs
         )
 
+    async def add_directory(self, file_paths: list[Path], **kwargs):
+        # wraps the files on a directory, the node answers with one json
+        # line per file plus the directory itself, which has no name
+        resp = await asks.post(
+            self.endpoint + '/api/v0/add',
+            files={f'file{i}': path for i, path in enumerate(file_paths)},
+            params={**kwargs, 'wrap-with-directory': 'true'}
+        )
+
+        if resp.status_code != 200:
+            raise IPFSClientException(resp.text)
+
+        for line in resp.text.splitlines():
+            entry = json.loads(line)
+            if entry['Name'] == '':
+                return entry
+
+        raise IPFSClientException(f'no directory on add response: {resp.text}')
+
     async def pin(self, cid: str):
         return (await self._post(
             '/api/v0/pin/add',
@@ -61,6 +81,7 @@ async def get_ipfs_file(ipfs_link: str, timeout: int = 60):
     for i in range(timeout):
         try:
             resp = await asks.get(ipfs_link, timeout=3)
+            break
 
         except asks.errors.RequestTimeout:
             logging.warning('timeout...')
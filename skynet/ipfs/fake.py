@@ -0,0 +1,446 @@
+#!/usr/bin/python
+
+# local stand in for a go-ipfs node, serves the bits of the kubo http api
+# `AsyncIPFSHTTP` uses plus a `/ipfs/<cid>` gateway route, CIDs are the same
+# CIDv0s `ipfs add` gives with default settings so they can be checked
+# against a real node
+
+import json
+import logging
+
+from hashlib import sha256
+from urllib.parse import urlsplit, parse_qs
+from contextlib import asynccontextmanager as acm
+
+import trio
+
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+# max links per node of the balanced dag layout
+DEFAULT_LINKS_PER_NODE = 174
+
+UNIXFS_DIRECTORY = 1
+UNIXFS_FILE = 2
+
+FAKE_PEER_ID = '12D3KooWFakeSkynetNode1111111111111111111111111111111'
+
+_B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+def b58encode(raw: bytes) -> str:
+    num = int.from_bytes(raw, 'big')
+    out = ''
+    while num > 0:
+        num, rem = divmod(num, 58)
+        out = _B58_ALPHABET[rem] + out
+
+    pad = len(raw) - len(raw.lstrip(b'\0'))
+    return '1' * pad + out
+
+
+def b58decode(encoded: str) -> bytes:
+    num = 0
+    for char in encoded:
+        num = num * 58 + _B58_ALPHABET.index(char)
+
+    pad = len(encoded) - len(encoded.lstrip('1'))
+    return b'\0' * pad + num.to_bytes((num.bit_length() + 7) // 8, 'big')
+
+
+# protobuf wire format, just what dag-pb & unixfs need
+
+def _varint(num: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = num & 0x7f
+        num >>= 7
+        if num:
+            out.append(byte | 0x80)
+
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _pb_varint(field: int, num: int) -> bytes:
+    return _varint(field << 3) + _varint(num)
+
+
+def _pb_bytes(field: int, raw: bytes) -> bytes:
+    return _varint((field << 3) | 2) + _varint(len(raw)) + raw
+
+
+def _unixfs_file(data: bytes, filesize: int, blocksizes: list[int] = []) -> bytes:
+    msg = _pb_varint(1, UNIXFS_FILE)
+    if data:
+        msg += _pb_bytes(2, data)
+
+    msg += _pb_varint(3, filesize)
+    for size in blocksizes:
+        msg += _pb_varint(4, size)
+
+    return msg
+
+
+def _dag_pb(data: bytes, links: list[tuple] = []) -> bytes:
+    # links go before data on the canonical encoding, (multihash, tsize) or
+    # (multihash, tsize, name)
+    node = b''
+    for multihash, tsize, *name in links:
+        name = name[0].encode() if name else b''
+        node += _pb_bytes(
+            2,
+            _pb_bytes(1, multihash) + _pb_bytes(2, name) + _pb_varint(3, tsize)
+        )
+
+    return node + _pb_bytes(1, data)
+
+
+def _multihash(block: bytes) -> bytes:
+    return b'\x12\x20' + sha256(block).digest()
+
+
+def unixfs_blocks(
+    data: bytes,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    links_per_node: int = DEFAULT_LINKS_PER_NODE
+) -> tuple[str, int, dict[str, bytes]]:
+    '''
+    Chunk `data` into a balanced unixfs dag like `ipfs add` does without raw
+    leaves, returns the root CIDv0, the cumulative dag size & every block
+    keyed by its CID
+    '''
+    blocks = {}
+
+    def _store(block: bytes) -> bytes:
+        multihash = _multihash(block)
+        blocks[b58encode(multihash)] = block
+        return multihash
+
+    # (multihash, file bytes under it, cumulative dag size)
+    level = []
+    chunks = [
+        data[i:i + chunk_size] for i in range(0, len(data), chunk_size)
+    ] or [b'']
+    for chunk in chunks:
+        block = _dag_pb(_unixfs_file(chunk, len(chunk)))
+        level.append((_store(block), len(chunk), len(block)))
+
+    while len(level) > 1:
+        parents = []
+        for i in range(0, len(level), links_per_node):
+            children = level[i:i + links_per_node]
+            filesize = sum(child[1] for child in children)
+            block = _dag_pb(
+                _unixfs_file(
+                    b'', filesize, [child[1] for child in children]),
+                [(child[0], child[2]) for child in children]
+            )
+            parents.append((
+                _store(block),
+                filesize,
+                len(block) + sum(child[2] for child in children)
+            ))
+
+        level = parents
+
+    root, _, size = level[0]
+    return b58encode(root), size, blocks
+
+
+def cid_v0(data: bytes) -> str:
+    cid, _, _ = unixfs_blocks(data)
+    return cid
+
+
+def unixfs_directory(entries: dict[str, tuple[str, int]]) -> tuple[str, int, bytes]:
+    '''
+    Directory node over `name -> (cid, cumulative size)` entries like
+    `ipfs add --wrap-with-directory` builds, returns its CIDv0, cumulative
+    size & block
+    '''
+    links = [
+        (b58decode(cid), size, name)
+        for name, (cid, size) in sorted(entries.items())
+    ]
+    block = _dag_pb(_pb_varint(1, UNIXFS_DIRECTORY), links)
+    return (
+        b58encode(_multihash(block)),
+        len(block) + sum(size for _, size, _ in links),
+        block
+    )
+
+
+def _parse_multipart(content_type: str, body: bytes) -> list[tuple[str, bytes]]:
+    boundary = None
+    for param in content_type.split(';'):
+        key, _, value = param.strip().partition('=')
+        if key == 'boundary':
+            boundary = value.strip('"').encode()
+
+    if not boundary:
+        return []
+
+    files = []
+    for part in body.split(b'--' + boundary)[1:]:
+        if part.startswith(b'--'):
+            break
+
+        head, _, content = part.partition(b'\r\n\r\n')
+        name = ''
+        for line in head.decode(errors='replace').split('\r\n'):
+            if 'filename=' in line:
+                name = line.split('filename=')[1].split(';')[0].strip('"')
+
+        files.append((name, content.removesuffix(b'\r\n')))
+
+    return files
+
+
+# http server over trio sockets, one `FakeIPFSNode` holds blocks, pins &
+# peers, `latency` is added to every request & `bandwidth` (bytes per
+# second, 0 is unlimited) throttles request & response bodies
+class FakeIPFSNode:
+
+    def __init__(
+        self,
+        latency: float = 0,
+        bandwidth: int = 0,
+        peer_id: str = FAKE_PEER_ID
+    ):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.peer_id = peer_id
+
+        self.blocks = {}
+        self.files = {}     # root cid -> file contents
+        self.dirs = {}      # directory cid -> {name: file cid}
+        self.pins = set()
+        self.peers = {}     # peer id -> multi address
+
+        self.requests = 0
+        self.url = None
+
+    def add_bytes(self, data: bytes) -> tuple[str, int]:
+        cid, size, blocks = unixfs_blocks(data)
+        self.blocks.update(blocks)
+        self.files[cid] = data
+        return cid, size
+
+    def add_directory(self, files: dict[str, bytes]) -> tuple[str, int]:
+        entries = {name: self.add_bytes(data) for name, data in files.items()}
+        cid, size, block = unixfs_directory(entries)
+        self.blocks[cid] = block
+        self.dirs[cid] = {name: entry[0] for name, entry in entries.items()}
+        return cid, size
+
+    async def _throttle(self, size: int):
+        if self.bandwidth > 0:
+            await trio.sleep(size / self.bandwidth)
+
+    # api routes
+
+    def _route(self, method: str, path: str, args: dict, headers: dict, body: bytes):
+        arg = args.get('arg', [None])[0]
+
+        match path.rstrip('/').split('/'):
+            case ['', 'api', 'v0', 'add']:
+                pin = args.get('pin', ['true'])[0] == 'true'
+                files = _parse_multipart(headers.get('content-type', ''), body)
+                if not files:
+                    return 400, 'application/json', self._error('file argument required')
+
+                entries = []
+                for name, data in files:
+                    cid, size = self.add_bytes(data)
+                    if pin:
+                        self.pins.add(cid)
+
+                    entries.append({'Name': name, 'Hash': cid, 'Size': str(size)})
+
+                if args.get('wrap-with-directory', ['false'])[0] == 'true':
+                    cid, size = self.add_directory(dict(files))
+                    if pin:
+                        self.pins.add(cid)
+
+                    entries.append({'Name': '', 'Hash': cid, 'Size': str(size)})
+
+                return 200, 'application/json', '\n'.join(
+                    json.dumps(entry) for entry in entries).encode()
+
+            case ['', 'api', 'v0', 'pin', 'add']:
+                if arg not in self.files and arg not in self.dirs:
+                    return 500, 'application/json', self._error(
+                        f'block {arg} not found')
+
+                self.pins.add(arg)
+                return 200, 'application/json', json.dumps({'Pins': [arg]}).encode()
+
+            case ['', 'api', 'v0', 'swarm', 'connect']:
+                if not arg or '/p2p/' not in arg:
+                    return 500, 'application/json', self._error(
+                        f'invalid peer address {arg}')
+
+                addr, _, peer = arg.rpartition('/p2p/')
+                self.peers[peer] = addr
+                return 200, 'application/json', json.dumps(
+                    {'Strings': [f'connect {peer} success']}).encode()
+
+            case ['', 'api', 'v0', 'swarm', 'peers']:
+                return 200, 'application/json', json.dumps({
+                    'Peers': [
+                        {'Addr': addr, 'Peer': peer}
+                        for peer, addr in self.peers.items()
+                    ]
+                }).encode()
+
+            case ['', 'api', 'v0', 'cat']:
+                if arg not in self.files:
+                    return 500, 'application/json', self._error(
+                        f'block {arg} not found')
+
+                return 200, 'application/octet-stream', self.files[arg]
+
+            case ['', 'ipfs', cid] if method in ('GET', 'HEAD'):
+                if cid not in self.files:
+                    return 404, 'text/plain', b'not found'
+
+                return 200, 'application/octet-stream', self.files[cid]
+
+            case ['', 'ipfs', cid, name] if method in ('GET', 'HEAD'):
+                if name not in self.dirs.get(cid, {}):
+                    return 404, 'text/plain', b'not found'
+
+                return 200, 'application/octet-stream', self.files[
+                    self.dirs[cid][name]]
+
+            case _:
+                return 404, 'text/plain', b'404 page not found'
+
+    def _error(self, msg: str) -> bytes:
+        return json.dumps({'Message': msg, 'Code': 0, 'Type': 'error'}).encode()
+
+    # http plumbing
+
+    async def _read_request(self, stream, buf: bytearray):
+        while b'\r\n\r\n' not in buf:
+            data = await stream.receive_some(65536)
+            if not data:
+                return None
+
+            buf += data
+
+        head, _, rest = bytes(buf).partition(b'\r\n\r\n')
+        buf[:] = rest
+
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = request_line.split(' ', 2)
+        headers = {}
+        for line in header_lines:
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        body = b''
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                while b'\r\n' not in buf:
+                    buf += await stream.receive_some(65536)
+
+                size_line, _, rest = bytes(buf).partition(b'\r\n')
+                size = int(size_line.split(b';')[0], 16)
+                while len(rest) < size + 2:
+                    rest += await stream.receive_some(65536)
+
+                body += rest[:size]
+                buf[:] = rest[size + 2:]
+                if size == 0:
+                    break
+
+        else:
+            length = int(headers.get('content-length', 0))
+            while len(buf) < length:
+                data = await stream.receive_some(65536)
+                if not data:
+                    return None
+
+                buf += data
+
+            body = bytes(buf[:length])
+            buf[:] = buf[length:]
+
+        return method, target, headers, body
+
+    async def _handle(self, stream):
+        buf = bytearray()
+        async with stream:
+            while True:
+                try:
+                    request = await self._read_request(stream, buf)
+
+                except (trio.BrokenResourceError, ValueError):
+                    return
+
+                if not request:
+                    return
+
+                method, target, headers, body = request
+                self.requests += 1
+
+                if self.latency > 0:
+                    await trio.sleep(self.latency)
+
+                await self._throttle(len(body))
+
+                url = urlsplit(target)
+                status, content_type, payload = self._route(
+                    method, url.path, parse_qs(url.query), headers, body)
+
+                logging.debug(f'fake ipfs {method} {target} -> {status}')
+
+                head = (
+                    f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                    f'Content-Type: {content_type}\r\n'
+                    f'Content-Length: {len(payload)}\r\n'
+                    f'\r\n'
+                ).encode()
+
+                try:
+                    await stream.send_all(head)
+                    if method != 'HEAD':
+                        for i in range(0, len(payload), 65536):
+                            chunk = payload[i:i + 65536]
+                            await self._throttle(len(chunk))
+                            await stream.send_all(chunk)
+
+                except trio.BrokenResourceError:
+                    return
+
+                if headers.get('connection', '').lower() == 'close':
+                    return
+
+    async def serve(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        task_status = trio.TASK_STATUS_IGNORED
+    ):
+        listeners = await trio.open_tcp_listeners(port, host=host)
+        bound_host, bound_port = listeners[0].socket.getsockname()[:2]
+        self.url = f'http://{bound_host}:{bound_port}'
+        task_status.started(self.url)
+
+        await trio.serve_listeners(self._handle, listeners)
+
+
+@acm
+async def open_fake_ipfs_node(
+    latency: float = 0,
+    bandwidth: int = 0,
+    port: int = 0
+):
+    node = FakeIPFSNode(latency=latency, bandwidth=bandwidth)
+    async with trio.open_nursery() as n:
+        await n.start(node.serve, '127.0.0.1', port)
+        yield node
+        n.cancel_scope.cancel()
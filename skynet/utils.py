@@ -24,7 +24,7 @@ from realesrgan import RealESRGANer
 from huggingface_hub import login
 import trio
 
-from .constants import MODELS
+from .constants import MODELS, DEFAULT_SINGLE_CARD_MAP
 
 
 def time_ms():
@@ -63,7 +63,8 @@ def pipeline_for(
     model: str,
     mem_fraction: float = 1.0,
     image: bool = False,
-    cache_dir: str | None = None
+    cache_dir: str | None = None,
+    device: str = DEFAULT_SINGLE_CARD_MAP
 ) -> DiffusionPipeline:
 
     assert torch.cuda.is_available()
@@ -81,7 +82,7 @@ def pipeline_for(
     model_info = MODELS[model]
 
     req_mem = model_info['mem']
-    mem_gb = torch.cuda.mem_get_info()[1] / (10**9)
+    mem_gb = torch.cuda.mem_get_info(device)[1] / (10**9)
     mem_gb *= mem_fraction
     over_mem = mem_gb < req_mem
     if over_mem:
@@ -100,7 +101,7 @@ def pipeline_for(
         case 'stable':
             params['revision'] = 'fp16'
 
-    torch.cuda.set_per_process_memory_fraction(mem_fraction)
+    torch.cuda.set_per_process_memory_fraction(mem_fraction, device)
 
     pipe = DiffusionPipeline.from_pretrained(
         model, **params)
@@ -115,7 +116,8 @@ def pipeline_for(
             pipe.enable_vae_slicing()
             pipe.enable_vae_tiling()
 
-        pipe.enable_model_cpu_offload()
+        pipe.enable_model_cpu_offload(
+            gpu_id=torch.device(device).index or 0)
 
     else:
         if sys.version_info[1] < 11:
@@ -123,7 +125,7 @@ def pipeline_for(
             pipe.unet = torch.compile(
                 pipe.unet, mode='reduce-overhead', fullgraph=True)
 
-        pipe = pipe.to('cuda')
+        pipe = pipe.to(device)
 
     return pipe
 
@@ -184,7 +186,10 @@ def img2img(
     image.save(output)
 
 
-def init_upscaler(model_path: str = 'weights/RealESRGAN_x4plus.pth'):
+def init_upscaler(
+    model_path: str = 'weights/RealESRGAN_x4plus.pth',
+    device: str = DEFAULT_SINGLE_CARD_MAP
+):
     return RealESRGANer(
         scale=4,
         model_path=model_path,
@@ -197,7 +202,8 @@ def init_upscaler(model_path: str = 'weights/RealESRGAN_x4plus.pth'):
             num_grow_ch=32,
             scale=4
         ),
-        half=True
+        half=True,
+        device=torch.device(device)
     )
 
 def upscale(
@@ -0,0 +1,242 @@
+#!/usr/bin/python
+
+# fakes & factories shared by the dgpu & fake chain tests
+
+import json
+import time
+
+from array import array
+from pathlib import Path
+from hashlib import sha256
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+
+import trio
+
+from skynet.fakechain import FakeTelosGPU, FakeCLEOS, FakeHyperion
+from skynet.dgpu.batch import verify_batch_sizes
+from skynet.dgpu.errors import DGPUComputeError, DGPUInferenceCancelled
+
+
+PARAMS = {
+    'model': 'prompthero/openjourney',
+    'prompt': 'skynet terminator dystopic',
+    'width': 512,
+    'height': 512,
+    'guidance': 10,
+    'step': 28,
+    'seed': 420,
+    'upscaler': None
+}
+
+BODY = json.dumps({'method': 'diffuse', 'params': PARAMS})
+
+
+def make_chain() -> FakeTelosGPU:
+    chain = FakeTelosGPU()
+    chain.deposit('telegram', '100.0000 GPU')
+    return chain
+
+
+async def enqueue(
+    cleos: FakeCLEOS,
+    reward: str = '20.0000 GPU',
+    body: str = BODY,
+    binary_data: str = ''
+) -> int:
+    res = await cleos.a_push_action(
+        'telos.gpu',
+        'enqueue',
+        {
+            'user': 'telegram',
+            'request_body': body,
+            'binary_data': binary_data,
+            'reward': reward,
+            'min_verification': 1
+        },
+        'telegram', 'key'
+    )
+    request_id, _ = res['processed']['action_traces'][0]['console'].split(':')
+    return int(request_id)
+
+
+def make_entry(
+    rid: int,
+    model: str = 'midj',
+    image: bool = False,
+    reward: int = 20,
+    age: float = 0,
+    method: str = 'diffuse',
+    **params
+) -> dict:
+    '''
+    A request index entry, `params` override the defaults, seed defaults to
+    the request id
+    '''
+    params = {**PARAMS, 'model': model, 'seed': rid, **params}
+    body = {'method': method, 'params': params}
+    enqueued = datetime.fromtimestamp(time.time() - age, tz=timezone.utc)
+    return {
+        'id': rid,
+        'model': model,
+        'reward': reward,
+        'req': {
+            'id': rid,
+            'nonce': 0,
+            'body': json.dumps(body),
+            'binary_data': 'Qm...' if image else '',
+            'reward': f'{reward / 10000:.4f} GPU',
+            'timestamp': enqueued.isoformat()
+        },
+        'body': body
+    }
+
+
+# cpu stand in for SkynetMM, outputs only depend on model, prompt & seed,
+# `drift` makes the outputs of multi sample pipeline calls differ, batches
+# past `max_batch` run out of memory, every call waits on `barrier` if set,
+# to tell calls overlapped, and on `hold` (a threading.Event) if set, like
+# a long job that can be cancelled while it runs
+class FakeMM:
+
+    def __init__(
+        self,
+        device: str = 'cpu',
+        models: list[str] = [],
+        drift: bool = False,
+        max_batch: int | None = None,
+        barrier = None,
+        hold = None
+    ):
+        self.device = device
+        self.models = set(models)
+        self.drift = drift
+        self.max_batch = max_batch
+        self.barrier = barrier
+        self.hold = hold
+        self.batch_sizes = {}
+
+        self.calls = []
+        self.computed = []
+
+        self.last_timings = array('d')
+        self.last_encode_time = 0
+
+    def is_model_loaded(self, model: str, image: bool) -> bool:
+        return model in self.models
+
+    def loaded_models(self) -> list[tuple[str, bool]]:
+        return [(model, False) for model in self.models]
+
+    def load_model(self, model: str, image: bool):
+        self.models.add(model)
+
+    def verify_batching(self, model: str, max_size: int) -> list[int]:
+        self.batch_sizes[model] = verify_batch_sizes(self, model, max_size)
+        return self.batch_sizes[model]
+
+    def _output(self, params: dict, batched: bool) -> tuple[str, bytes]:
+        output = f'{params["model"]}:{params["prompt"]}:{params["seed"]}'.encode()
+        if batched and self.drift:
+            output += b'!'
+
+        return sha256(output).hexdigest(), output
+
+    def compute_one(
+        self,
+        request_id: int,
+        method: str,
+        params: dict,
+        input_type: str = 'png',
+        binary = None,
+        cancel_event = None
+    ):
+        self.calls.append(('one', method, input_type, binary))
+        if self.barrier:
+            self.barrier.wait()
+
+        if self.hold:
+            while not self.hold.wait(0.01):
+                if cancel_event and cancel_event.is_set():
+                    raise DGPUInferenceCancelled()
+
+        self.models.add(params['model'])
+        self.computed.append(request_id)
+        return self._output(params, False)
+
+    def compute_batch(self, jobs: list, cancel_event = None, **kwargs):
+        self.calls.append(('batch', len(jobs)))
+        if self.max_batch and len(jobs) > self.max_batch:
+            raise DGPUComputeError('out of memory')
+
+        if self.barrier:
+            self.barrier.wait()
+
+        self.models.add(jobs[0][1]['model'])
+        self.computed += [request_id for request_id, _ in jobs]
+        return [self._output(params, len(jobs) > 1) for _, params in jobs]
+
+
+def make_daemon(
+    chain: FakeTelosGPU,
+    path: Path,
+    mms: list,
+    account: str = 'testworker',
+    cleos: FakeCLEOS | None = None,
+    **config
+):
+    '''
+    A SkynetDGPUDaemon for `account` on `chain` through the real connector,
+    state files under `path`, `config` overrides the test defaults
+    '''
+    # heavy imports here, the daemon pulls in the cuda stack & leap
+    from skynet.dgpu.daemon import SkynetDGPUDaemon
+    from skynet.dgpu.network import SkynetGPUConnector
+
+    config = {
+        'account': account,
+        'permission': 'active',
+        'key': 'key',
+        'node_url': 'http://127.0.0.1:1',
+        'hyperion_url': 'http://127.0.0.1:1',
+        'ipfs_url': 'http://127.0.0.1:1',
+        'initial_models': [PARAMS['model']],
+        'outbox_path': str(path / f'{account}-outbox.db'),
+        'result_cache_size': 0,
+        'preload': False,
+        'poll_min_interval': 0.05,
+        'poll_max_interval': 0.4,
+        'publish_retries': 0,
+        **config
+    }
+    conn = SkynetGPUConnector(
+        config,
+        cleos=cleos if cleos else FakeCLEOS(chain),
+        hyperion=FakeHyperion(chain)
+    )
+    return SkynetDGPUDaemon(mms, conn, config)
+
+
+@asynccontextmanager
+async def run_daemon(daemon):
+    '''
+    Run every `daemon` task like `open_dgpu_node` does, cancelled on exit
+    '''
+    async with trio.open_nursery() as n:
+        n.start_soon(daemon.warmup_task)
+        n.start_soon(daemon.snap_updater_task)
+        n.start_soon(daemon.prefetch_task)
+        n.start_soon(daemon.preload_task)
+        n.start_soon(daemon.publish_task)
+        n.start_soon(daemon.outbox_task)
+        n.start_soon(daemon.serve_forever)
+
+        yield daemon
+
+        n.cancel_scope.cancel()
+
+
+async def wait_for(condition, timeout: float = 5):
+    with trio.fail_after(timeout):
+        while not condition():
+            await trio.sleep(0.01)
@@ -8,7 +8,6 @@ from functools import partial
 
 import trio
 import requests
-from skynet.constants import DEFAULT_IPFS_REMOTE
 
 from skynet.dgpu import open_dgpu_node
 
@@ -20,7 +19,7 @@ def test_enqueue_work(cleos):
     req = json.dumps({
         'method': 'diffuse',
         'params': {
-            'algo': 'midj',
+            'model': 'prompthero/openjourney',
             'prompt': 'skynet terminator dystopic',
             'width': 512,
             'height': 512,
@@ -48,17 +47,29 @@ def test_enqueue_work(cleos):
     assert req_on_chain['body'] == req
     assert req_on_chain['binary_data'] == binary
 
-    trio.run(
-        partial(
-            open_dgpu_node,
-            f'testworker1',
-            'active',
-            cleos,
-            DEFAULT_IPFS_REMOTE,
-            cleos.private_keys['testworker1'],
-            initial_algos=['midj']
-        )
-    )
+    async def _work_until_empty():
+        async with trio.open_nursery() as n:
+            n.start_soon(
+                open_dgpu_node,
+                {
+                    'account': 'testworker1',
+                    'permission': 'active',
+                    'key': cleos.private_keys['testworker1'],
+                    'node_url': cleos.url,
+                    'hyperion_url': cleos.url,
+                    'ipfs_url': 'http://127.0.0.1:5001',
+                    'initial_models': ['prompthero/openjourney']
+                }
+            )
+
+            with trio.fail_after(600):
+                while len(await cleos.aget_table(
+                    'telos.gpu', 'telos.gpu', 'queue')) > 0:
+                    await trio.sleep(1)
+
+            n.cancel_scope.cancel()
+
+    trio.run(_work_until_empty)
 
     queue = cleos.get_table('telos.gpu', 'telos.gpu', 'queue')
 
@@ -70,7 +81,7 @@ def test_enqueue_dequeue(cleos):
     req = json.dumps({
         'method': 'diffuse',
         'params': {
-            'algo': 'midj',
+            'model': 'prompthero/openjourney',
             'prompt': 'skynet terminator dystopic',
             'width': 512,
             'height': 512,
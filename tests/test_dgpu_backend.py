@@ -0,0 +1,175 @@
+#!/usr/bin/python
+
+import os
+import time
+
+from hashlib import sha256
+
+import trio
+import pytest
+
+from skynet.dgpu.backend import SkynetProcessBackend
+from skynet.dgpu.errors import DGPUComputeError, DGPUInferenceCancelled
+
+
+# stub pipeline that runs on cpu inside the worker process
+class StubMM:
+
+    def __init__(self, config: dict, device: str = 'cpu'):
+        self.device = device
+        self.models = set(config['initial_models'])
+
+    def is_model_loaded(self, model: str, image: bool):
+        return not image and model in self.models
+
+    def load_model(self, model_name: str, image: bool):
+        if model_name == 'broken':
+            raise OSError('no such model')
+
+        self.models.add(model_name)
+
+    def compute_one(
+        self,
+        request_id: int,
+        method: str,
+        params: dict,
+        input_type: str = 'png',
+        binary = None,
+        cancel_event = None
+    ):
+        match method:
+            case 'crash':
+                os._exit(1)
+
+            case 'slow':
+                for step in range(100):
+                    if cancel_event.is_set():
+                        raise DGPUInferenceCancelled()
+
+                    time.sleep(0.05)
+
+            case 'fail':
+                raise DGPUComputeError('bad params')
+
+        self.models.add(params['model'])
+        output = (params['prompt'] * 1000).encode()
+        return sha256(output).hexdigest(), output
+
+    def verify_batching(self, model_name: str, max_size: int) -> list[int]:
+        return list(range(2, max_size + 1))
+
+    def compute_batch(self, jobs: list, cancel_event = None):
+        return [
+            self.compute_one(request_id, 'diffuse', params)
+            for request_id, params in jobs
+        ]
+
+
+@pytest.fixture
+def backend():
+    backend = SkynetProcessBackend(
+        {'initial_models': ['prompthero/openjourney']},
+        device='cpu',
+        mm_factory=StubMM
+    )
+    backend.start()
+    yield backend
+    backend.close()
+
+
+def test_compute_through_shared_memory(backend):
+    params = {'model': 'runwayml/stable-diffusion-v1-5', 'prompt': 'skynet'}
+    output_hash, output = backend.compute_one(1, 'diffuse', params)
+
+    assert output == b'skynet' * 1000
+    assert output_hash == sha256(output).hexdigest()
+    assert backend.is_model_loaded('prompthero/openjourney', False)
+    assert backend.is_model_loaded('runwayml/stable-diffusion-v1-5', False)
+
+
+def test_compute_batch(backend):
+    outputs = backend.compute_batch([
+        (1, {'model': 'prompthero/openjourney', 'prompt': 'sky'}),
+        (2, {'model': 'prompthero/openjourney', 'prompt': 'net'})
+    ])
+
+    assert [output for _, output in outputs] == [b'sky' * 1000, b'net' * 1000]
+    assert all(
+        output_hash == sha256(output).hexdigest()
+        for output_hash, output in outputs
+    )
+
+
+def test_verify_batching(backend):
+    assert backend.verify_batching('prompthero/openjourney', 3) == [2, 3]
+    assert backend.batch_sizes == {'prompthero/openjourney': [2, 3]}
+
+    # a fresh worker hasn't verified anything
+    backend.restart()
+    assert backend.batch_sizes == {}
+
+
+def test_load_model(backend):
+    backend.warmup()
+    backend.load_model('stabilityai/stable-diffusion-2-1-base', False)
+    assert backend.is_model_loaded('stabilityai/stable-diffusion-2-1-base', False)
+
+    with pytest.raises(DGPUComputeError):
+        backend.load_model('broken', False)
+
+
+def test_errors_and_crash_restart(backend):
+    params = {'model': 'prompthero/openjourney', 'prompt': 'skynet'}
+
+    with pytest.raises(DGPUComputeError):
+        backend.compute_one(1, 'fail', params)
+
+    with pytest.raises(DGPUComputeError):
+        backend.compute_one(2, 'crash', params)
+
+    assert backend.restarts == 1
+
+    # a fresh worker picks up the next job
+    _, output = backend.compute_one(3, 'diffuse', params)
+    assert output == b'skynet' * 1000
+
+
+async def test_cancel(backend):
+    params = {'model': 'prompthero/openjourney', 'prompt': 'skynet'}
+
+    async def _cancel_soon():
+        await trio.sleep(0.5)
+        backend.cancel()
+
+    start = time.time()
+    with pytest.raises(DGPUInferenceCancelled):
+        async with trio.open_nursery() as n:
+            n.start_soon(_cancel_soon)
+            await trio.to_thread.run_sync(
+                backend.compute_one, 1, 'slow', params)
+
+    assert time.time() - start < 5
+
+
+def test_unknown_command(backend):
+    with pytest.raises(DGPUComputeError, match='Unknown command'):
+        backend._call('upscale')
+
+    # the worker is still the same one & still serving
+    params = {'model': 'prompthero/openjourney', 'prompt': 'skynet'}
+    _, output = backend.compute_one(1, 'diffuse', params)
+    assert output == b'skynet' * 1000
+    assert backend.restarts == 0
+
+
+def test_cancel_before_start(backend):
+    params = {'model': 'prompthero/openjourney', 'prompt': 'skynet'}
+
+    # a cancel landing before the job reaches the worker isn't lost
+    backend.cancel()
+    with pytest.raises(DGPUInferenceCancelled):
+        backend.compute_one(1, 'slow', params)
+
+    # & doesn't outlive the job it was meant for
+    _, output = backend.compute_one(2, 'diffuse', params)
+    assert output == b'skynet' * 1000
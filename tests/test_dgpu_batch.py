@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+from skynet.dgpu.batch import (
+    batch_key,
+    batch_chunks,
+    pick_batch,
+    verify_batch_sizes,
+    batch_seeds,
+    pack_images,
+    unpack_images,
+    output_type_for
+)
+
+from fakes import make_entry, FakeMM
+
+
+def test_batch_key():
+    # only prompt & seed may differ
+    assert batch_key(make_entry(0)) == batch_key(make_entry(1, prompt='other'))
+    assert batch_key(make_entry(0)) != batch_key(make_entry(1, step=30))
+    assert batch_key(make_entry(0)) != batch_key(make_entry(1, upscaler='x4'))
+
+    assert batch_key(make_entry(0, image=True)) is None
+    assert batch_key(make_entry(0, width='wide')) is None
+
+
+def test_pick_batch():
+    first = make_entry(0)
+    candidates = [
+        first,
+        make_entry(1),
+        make_entry(2, width=768),
+        make_entry(3, image=True),
+        make_entry(4),
+        make_entry(5),
+        make_entry(6)
+    ]
+
+    picked = pick_batch(first, candidates, 4, lambda entry: entry['id'] != 4)
+    assert [entry['id'] for entry in picked] == [1, 5, 6]
+
+    assert pick_batch(first, candidates, 1, lambda entry: True) == []
+    assert pick_batch(candidates[3], candidates, 4, lambda entry: True) == []
+
+
+def test_batch_chunks():
+    # unverified sizes never get used, neither do sizes past the limit
+    assert batch_chunks(3, [], 8) == [1, 1, 1]
+    assert batch_chunks(7, [2, 4], 8) == [4, 2, 1]
+    assert batch_chunks(7, [2, 4], 3) == [2, 2, 2, 1]
+    assert batch_chunks(3, [4], 8) == [1, 1, 1]
+    assert batch_chunks(0, [2], 8) == []
+
+
+def test_batch_seeds():
+    assert batch_seeds({'seed': 420, 'num_images': 3}) == [420, 421, 422]
+    assert batch_seeds({'seed': 420, 'num_images': 2, 'seeds': ['7', 9]}) == [7, 9]
+
+
+def test_pack_images():
+    images = [b'sky' * 100, b'net' * 100]
+    packed = pack_images(images)
+
+    # same images same bytes, the output hash depends on it
+    assert packed == pack_images(list(images))
+    assert unpack_images(packed) == {
+        'image-0.png': images[0],
+        'image-1.png': images[1]
+    }
+
+    assert output_type_for('diffuse_batch', {'output_type': 'png'}) == 'zip'
+    assert output_type_for('diffuse', {}) == 'png'
+
+
+def test_verify_batch_sizes():
+    mm = FakeMM()
+    assert verify_batch_sizes(mm, 'midj', 3) == [2, 3]
+    assert mm.calls == [
+        ('one', 'diffuse', 'none', b''),
+        ('one', 'diffuse', 'none', b''),
+        ('one', 'diffuse', 'none', b''),
+        ('batch', 2),
+        ('batch', 3)
+    ]
+
+    # sizes that don't match or don't fit are left out
+    assert verify_batch_sizes(FakeMM(drift=True), 'midj', 3) == []
+    assert verify_batch_sizes(FakeMM(max_batch=2), 'midj', 4) == [2]
+
+    # kept per model, the rest runs unbatched
+    mm = FakeMM()
+    mm.verify_batching('midj', 2)
+    assert mm.batch_sizes == {'midj': [2]}
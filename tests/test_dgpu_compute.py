@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+from contextlib import nullcontext
+
+import pytest
+
+from PIL import Image
+
+# SkynetMM needs torch & diffusers installed, the pipelines are stubbed
+torch = pytest.importorskip('torch')
+
+from skynet.dgpu import compute
+from skynet.dgpu.compute import SkynetMM
+
+
+MODEL = 'prompthero/openjourney'
+OTHER = 'runwayml/stable-diffusion-v1-5'
+
+
+class StubVAE:
+
+    def __init__(self, tiled: bool):
+        self.use_slicing = tiled
+        self.use_tiling = tiled
+
+    def enable_slicing(self):
+        self.use_slicing = True
+
+    def disable_slicing(self):
+        self.use_slicing = False
+
+    def enable_tiling(self):
+        self.use_tiling = True
+
+    def disable_tiling(self):
+        self.use_tiling = False
+
+
+class StubPipe:
+
+    def __init__(self, model: str, tiled: bool = False):
+        self.model = model
+        self.vae = StubVAE(tiled)
+        self.calls = []
+
+    # a plain image per prompt, records how prompts were grouped on calls
+    def __call__(self, prompt, **kwargs):
+        self.calls.append(prompt)
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        return StubOutput([
+            Image.new('RGB', (8, 8), (len(p), 0, 0)) for p in prompts])
+
+
+class StubOutput:
+
+    def __init__(self, images: list):
+        self.images = images
+
+
+class StubImg2Img:
+
+    @classmethod
+    def from_pipe(cls, pipe: StubPipe):
+        derived = cls()
+        derived.base = pipe
+        derived.vae = pipe.vae
+        return derived
+
+
+@pytest.fixture
+def loads(monkeypatch) -> list:
+    loads = []
+
+    # over mem cards get vae slicing & tiling on txt2img pipelines
+    def _pipeline_for(model, image=False, cache_dir=None, device=None):
+        loads.append((model, image))
+        return StubPipe(model, tiled=model == OTHER)
+
+    monkeypatch.setattr(compute, 'pipeline_for', _pipeline_for)
+    monkeypatch.setattr(compute, 'AutoPipelineForImage2Image', StubImg2Img)
+    monkeypatch.setattr(torch.cuda, 'memory_allocated', lambda device=None: 0)
+    monkeypatch.setattr(torch.cuda, 'empty_cache', lambda: None)
+    monkeypatch.setattr(torch.cuda, 'device', lambda device: nullcontext())
+    return loads
+
+
+def test_img2img_shares_weights(loads):
+    # room for a single model
+    mm = SkynetMM({'vram_budget': 6}, device='cuda:0')
+
+    pipe = mm.get_model(MODEL, False)
+    img2img = mm.get_model(MODEL, True)
+    assert img2img.base is pipe
+    assert mm.get_model(MODEL, True) is img2img
+    assert loads == [(MODEL, False)]
+
+    # loaded either way, only the txt2img weights take up room
+    assert mm.is_model_loaded(MODEL, False)
+    assert mm.is_model_loaded(MODEL, True)
+    assert mm.loaded_models() == [(MODEL, False)]
+
+    # the derived pipe goes out with the weights it was derived from
+    mm.get_model(OTHER, False)
+    assert MODEL not in mm._img2img
+    assert not mm.is_model_loaded(MODEL, True)
+
+    reloaded = mm.get_model(MODEL, True)
+    assert reloaded is not img2img
+    assert reloaded.base is mm.get_model(MODEL, False)
+    assert loads == [(MODEL, False), (OTHER, False), (MODEL, False)]
+
+
+def test_img2img_untiled_vae(loads):
+    mm = SkynetMM({'vram_budget': 6}, device='cuda:0')
+
+    # img2img never ran with a sliced & tiled vae, the shared vae gets
+    # switched on every call
+    pipe = mm.get_model(OTHER, False)
+    assert pipe.vae.use_tiling and pipe.vae.use_slicing
+
+    img2img = mm.get_model(OTHER, True)
+    assert not img2img.vae.use_tiling and not img2img.vae.use_slicing
+
+    mm.get_model(OTHER, False)
+    assert pipe.vae.use_tiling and pipe.vae.use_slicing
+
+    # cards with enough memory are left alone
+    mm.get_model(MODEL, True)
+    assert not mm.get_model(MODEL, False).vae.use_tiling
+
+
+def test_diffuse_batch_chunks(loads, monkeypatch):
+    mm = SkynetMM({'vram_budget': 6}, device='cuda:0')
+    monkeypatch.setattr(mm, 'max_batch_size', lambda width, height: 2)
+    params = {
+        'model': MODEL,
+        'prompt': 'skynet',
+        'width': 512,
+        'height': 512,
+        'guidance': 7.5,
+        'step': 4,
+        'seed': 0,
+        'num_images': 3
+    }
+
+    # nothing verified, one unbatched call per sample
+    sequential = mm.compute_one(
+        0, 'diffuse_batch', params, input_type='none', binary=b'')
+    pipe = mm.get_model(MODEL, False)
+    assert pipe.calls == ['skynet'] * 3
+
+    # verified sizes only, capped by free vram, same packed output
+    mm.batch_sizes[MODEL] = [2, 3]
+    pipe.calls.clear()
+    assert mm.compute_one(
+        0, 'diffuse_batch', params, input_type='none', binary=b'') == sequential
+    assert pipe.calls == [['skynet', 'skynet'], 'skynet']
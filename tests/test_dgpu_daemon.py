@@ -0,0 +1,224 @@
+#!/usr/bin/python
+
+import json
+import threading
+
+import trio
+import pytest
+
+# the daemon needs the cuda stack & the connector leap, the model manager &
+# the chain are faked
+pytest.importorskip('torch')
+pytest.importorskip('leap')
+
+from skynet.fakechain import FakeCLEOS
+from skynet.ipfs.fake import cid_v0
+from skynet.dgpu.errors import DGPUComputeError
+
+from fakes import (
+    PARAMS,
+    FakeMM,
+    make_chain,
+    enqueue,
+    make_daemon,
+    run_daemon,
+    wait_for
+)
+
+
+def daemon_for(chain, path, mms: list, **config):
+    # publishes land nowhere, the cid is all the chain sees
+    daemon = make_daemon(chain, path, mms, **config)
+    daemon.published = []
+
+    async def _publish_on_ipfs(raw: bytes, typ: str = 'png') -> str:
+        daemon.published.append(raw)
+        return cid_v0(raw)
+
+    daemon.conn.publish_on_ipfs = _publish_on_ipfs
+    return daemon
+
+
+def workers(chain, request_id: int) -> list[str]:
+    return [status['worker'] for status in chain.status.get(request_id, [])]
+
+
+def actions(chain, name: str) -> list[dict]:
+    return [
+        action['act']['data']
+        for action in chain.actions
+        if action['act']['name'] == name
+    ]
+
+
+async def test_claim_lost(tmp_path):
+    chain = make_chain()
+    mm = FakeMM()
+    daemon = daemon_for(chain, tmp_path, [mm])
+
+    # two other workers fill the request up right before our workbegin
+    begin_work = daemon.conn.begin_work
+
+    async def _begin_work(request_id: int):
+        for worker in ('other1', 'other2'):
+            chain.apply(
+                'workbegin',
+                {'worker': worker, 'request_id': request_id, 'max_workers': 2},
+                worker
+            )
+
+        return await begin_work(request_id)
+
+    daemon.conn.begin_work = _begin_work
+
+    async with run_daemon(daemon):
+        rid = await enqueue(daemon.conn.cleos)
+        await wait_for(lambda: actions(chain, 'workbegin'))
+        await wait_for(lambda: daemon.devices.free_count == 1)
+
+        # the loop keeps going, nothing computed & the device is free
+        daemon.conn.begin_work = begin_work
+        assert workers(chain, rid) == ['other1', 'other2']
+        assert rid not in daemon._in_progress
+        assert mm.computed == []
+
+        second = await enqueue(daemon.conn.cleos)
+        await wait_for(lambda: second in daemon._index.my_results)
+        assert mm.computed == [second]
+
+
+async def test_bad_input_cancel(tmp_path):
+    chain = make_chain()
+    mm = FakeMM()
+    daemon = daemon_for(chain, tmp_path, [mm])
+
+    async def _get_input_data(ipfs_hash: str):
+        raise DGPUComputeError(f'couldn\'t fetch {ipfs_hash}')
+
+    daemon.conn.get_input_data = _get_input_data
+
+    async with run_daemon(daemon):
+        rid = await enqueue(
+            daemon.conn.cleos,
+            body=json.dumps({
+                'method': 'diffuse',
+                'params': {**PARAMS, 'strength': 0.5}
+            }),
+            binary_data='QmBroken'
+        )
+
+        # claimed, then given back with the reason
+        await wait_for(lambda: actions(chain, 'workcancel'))
+        cancel = actions(chain, 'workcancel')[0]
+        assert cancel['request_id'] == rid
+        assert 'QmBroken' in cancel['reason']
+        assert mm.computed == []
+
+        # stop it from getting claimed over & over, the node stays up
+        chain.apply('dequeue', {'user': 'telegram', 'request_id': rid}, 'telegram')
+        await wait_for(lambda: daemon.devices.free_count == 1)
+
+        second = await enqueue(daemon.conn.cleos)
+        await wait_for(lambda: second in daemon._index.my_results)
+        assert mm.computed == [second]
+
+
+async def test_publish_failure_retried(tmp_path, monkeypatch):
+    from skynet.dgpu import daemon as daemon_module
+    monkeypatch.setattr(daemon_module, 'DEFAULT_OUTBOX_INTERVAL', 0.05)
+
+    chain = make_chain()
+    mm = FakeMM()
+    daemon = daemon_for(chain, tmp_path, [mm])
+    daemon.outbox.backoff = 0.05
+
+    # ipfs is down for the first two publishes
+    publish_on_ipfs = daemon.conn.publish_on_ipfs
+    failures = []
+
+    async def _publish_on_ipfs(raw: bytes, typ: str = 'png') -> str:
+        if len(failures) < 2:
+            failures.append(raw)
+            raise OSError('ipfs unreachable')
+
+        return await publish_on_ipfs(raw, typ=typ)
+
+    daemon.conn.publish_on_ipfs = _publish_on_ipfs
+
+    async with run_daemon(daemon):
+        rid = await enqueue(daemon.conn.cleos)
+
+        # the output waits on the outbox after the publish stage gave up
+        await wait_for(lambda: failures)
+        assert rid in daemon.outbox
+
+        await wait_for(lambda: rid in daemon._index.my_results)
+        await wait_for(lambda: len(daemon.outbox) == 0)
+
+    # computed once, the outbox retried the same output
+    assert mm.computed == [rid]
+    assert failures[0] == daemon.published[0]
+
+    result, = chain.results.values()
+    assert result['request_id'] == rid
+    assert result['ipfs_hash'] == cid_v0(daemon.published[0])
+    assert daemon._publish_stats['submitted'] == 1
+
+
+async def test_cancel_mid_compute(tmp_path):
+    chain = make_chain()
+    hold = threading.Event()
+    mm = FakeMM(hold=hold)
+    daemon = daemon_for(chain, tmp_path, [mm], non_compete=['rival'])
+
+    async with run_daemon(daemon):
+        rid = await enqueue(daemon.conn.cleos)
+        await wait_for(lambda: rid in daemon._cancel_tokens)
+
+        # a non compete worker shows up while we are computing, the next
+        # snapshot stops the job & gives the request back
+        chain.apply(
+            'workbegin',
+            {'worker': 'rival', 'request_id': rid, 'max_workers': 2},
+            'rival'
+        )
+        await wait_for(lambda: actions(chain, 'workcancel'))
+        await wait_for(lambda: daemon.devices.free_count == 1)
+
+        assert workers(chain, rid) == ['rival']
+        assert rid not in daemon._in_progress
+        assert not hold.is_set()
+
+    assert mm.computed == []
+    assert actions(chain, 'submit') == []
+    assert daemon.published == []
+
+
+async def test_poll_backoff(tmp_path):
+    chain = make_chain()
+    cleos = FakeCLEOS(chain)
+    hold = threading.Event()
+    mm = FakeMM(hold=hold)
+    daemon = daemon_for(chain, tmp_path, [mm], cleos=cleos)
+
+    async with run_daemon(daemon):
+        # nothing queued, backs off to the max & stays there
+        await wait_for(lambda: daemon.poll_interval == 0.4)
+        calls = cleos.calls
+        await trio.sleep(1)
+
+        # a queue & a results read per poll, ~40 reads at the min interval
+        assert cleos.calls - calls <= 8
+
+        # new work shows up on the next poll & tightens it again
+        rid = await enqueue(FakeCLEOS(chain))
+        await wait_for(lambda: daemon.poll_interval == 0.05)
+
+        # our only device is busy on a long job, nothing else to do
+        await wait_for(lambda: rid in daemon._cancel_tokens)
+        await wait_for(lambda: daemon.poll_interval == 0.4)
+
+        # the device freeing up polls right away
+        hold.set()
+        await wait_for(lambda: rid in daemon._index.my_results)
+        assert daemon.poll_interval <= 0.1
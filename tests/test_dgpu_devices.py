@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+import threading
+
+from functools import partial
+
+import trio
+
+from skynet.dgpu.devices import SkynetDevicePool
+
+from fakes import FakeMM, PARAMS
+
+
+def test_acquire_prefers_loaded_device():
+    mms = [
+        FakeMM('cpu:0', ['midj']),
+        FakeMM('cpu:1', ['stable'])
+    ]
+    pool = SkynetDevicePool(mms)
+
+    assert pool.acquire('stable', False) == mms[1]
+    assert pool.acquire('stable', False) == mms[0]
+    assert pool.acquire('stable', False) == None
+    assert pool.busy_count == 2
+
+    pool.release(mms[1])
+    assert pool.free_count == 1
+    assert pool.is_model_loaded('midj', False)
+
+    # while warming up only devices with the model are handed out
+    assert pool.acquire('midj', False, loaded_only=True) == None
+    assert pool.is_model_free('stable', False)
+    assert pool.acquire('stable', False, loaded_only=True) == mms[1]
+
+
+async def test_concurrent_dispatch():
+    # every job waits for four to be running, dispatching them one after
+    # the other would break the barrier instead of getting past it
+    barrier = threading.Barrier(4, timeout=5)
+    mms = [FakeMM(f'cpu:{i}', barrier=barrier) for i in range(4)]
+    pool = SkynetDevicePool(mms)
+
+    max_busy = 0
+
+    async def _compute(mm, request_id: int):
+        nonlocal max_busy
+        max_busy = max(max_busy, pool.busy_count)
+        try:
+            await trio.to_thread.run_sync(
+                partial(
+                    mm.compute_one,
+                    request_id, 'diffuse', {**PARAMS, 'model': 'midj'}
+                )
+            )
+
+        finally:
+            pool.release(mm)
+
+    async with trio.open_nursery() as n:
+        for request_id in range(8):
+            await pool.wait_free()
+            mm = pool.acquire('midj', False)
+            n.start_soon(_compute, mm, request_id)
+
+    assert max_busy == 4
+    assert pool.free_count == 4
+    assert sorted(sum([mm.computed for mm in mms], [])) == list(range(8))
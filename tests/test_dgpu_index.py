@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+import json
+
+from skynet.dgpu.index import SkynetRequestIndex, validate_params
+
+
+PARAMS = {
+    'model': 'prompthero/openjourney',
+    'prompt': 'skynet',
+    'step': 28,
+    'width': 512,
+    'height': 512,
+    'guidance': 7.5,
+    'seed': 420,
+    'upscaler': None
+}
+
+
+def make_req(rid: int, params: dict, binary_data: str = '') -> dict:
+    return {
+        'id': rid,
+        'nonce': 0,
+        'body': json.dumps({'method': 'diffuse', 'params': params}),
+        'binary_data': binary_data,
+        'reward': '20.0000 GPU'
+    }
+
+
+def test_validate_params():
+    assert validate_params('diffuse', PARAMS, False) == None
+    assert validate_params('upscale', PARAMS, False) == 'Unsupported method upscale'
+
+    assert 'divisible by 8' in validate_params(
+        'diffuse', {**PARAMS, 'width': 516}, False)
+    assert 'out of bounds' in validate_params(
+        'diffuse', {**PARAMS, 'step': 10000}, False)
+    assert 'Invalid' in validate_params(
+        'diffuse', {**PARAMS, 'height': 'big'}, False)
+
+    params = dict(PARAMS)
+    del params['seed']
+    assert validate_params('diffuse', params, False) == 'Missing param seed'
+
+    # img2img needs a strength
+    assert validate_params('diffuse', PARAMS, True) == 'Missing param strength'
+    assert validate_params('diffuse', {**PARAMS, 'strength': '0.5'}, True) == None
+
+
+def test_validate_batch_params():
+    params = {**PARAMS, 'num_images': 3}
+    assert validate_params('diffuse_batch', params, False) is None
+
+    params['seeds'] = [1, 2, 3]
+    assert validate_params('diffuse_batch', params, False) is None
+
+    params['seeds'] = [1, 2]
+    assert 'seed per image' in validate_params('diffuse_batch', params, False)
+
+    params['seeds'] = [1, 2, 'three']
+    assert validate_params('diffuse_batch', params, False).startswith('Invalid seeds')
+
+    assert 'out of bounds' in validate_params(
+        'diffuse_batch', {**PARAMS, 'num_images': 64}, False)
+    assert validate_params(
+        'diffuse_batch', PARAMS, False) == 'Missing param num_images'
+
+
+def test_invalid_requests_rejected_once():
+    index = SkynetRequestIndex()
+    snap = {
+        'queue': [
+            make_req(0, PARAMS),
+            make_req(1, {**PARAMS, 'width': 4096})
+        ],
+        'my_results': []
+    }
+    index.update(snap)
+
+    assert [entry['id'] for entry in index.candidates()] == [0]
+    assert 'out of bounds' in index.rejection(1)
+
+    # leaves the queue, rejection is forgotten
+    index.update({**snap, 'queue': snap['queue'][:1]})
+    assert index.rejection(1) == None
+
+
+def test_my_results_by_request_id():
+    index = SkynetRequestIndex()
+    snap = {
+        'queue': [make_req(3, PARAMS)],
+        'my_results': [
+            {'id': 0, 'request_id': 3, 'worker': 'testworker1'},
+            {'id': 1, 'request_id': 5, 'worker': 'testworker1'}
+        ]
+    }
+    index.update(snap)
+    assert index.my_results == {3, 5}
+
+    # a failed results read keeps the last known ones
+    index.update({**snap, 'my_results': None})
+    assert index.my_results == {3, 5}
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+
+from hashlib import sha256
+
+from skynet.fakechain import FakeTelosGPU, FakeCLEOS
+from skynet.dgpu.ingest import SkynetQueueIngester
+
+from fakes import make_chain, enqueue
+
+
+QUEUE_ACTIONS = ('enqueue', 'dequeue', 'workbegin', 'workcancel', 'submit')
+
+
+# the bits of SkynetGPUConnector the ingester uses, straight on the fake
+# chain's tables & action log
+class ChainConnector:
+
+    def __init__(self, chain: FakeTelosGPU, account: str = 'worker'):
+        self.chain = chain
+        self.account = account
+        self.results_fail = False
+        self.invalidated = set()
+
+    async def get_full_queue_snapshot(self) -> dict:
+        queue = self.chain.get_table('telos.gpu', 'telos.gpu', 'queue')
+        my_results = None
+        if not self.results_fail:
+            my_results = self.chain.get_table(
+                'telos.gpu', 'telos.gpu', 'results',
+                index_position=4, key_type='name',
+                lower_bound=self.account, upper_bound=self.account)
+
+        return {
+            'queue': queue,
+            'requests': {
+                req['id']: self.chain.get_table('telos.gpu', req['id'], 'status')
+                for req in queue
+            },
+            'my_results': my_results
+        }
+
+    async def get_queue_actions_after(self, after: str) -> dict:
+        return self.chain.get_actions(
+            account='telos.gpu',
+            filter=','.join(f'telos.gpu:{name}' for name in QUEUE_ACTIONS),
+            sort='asc',
+            after=after
+        )
+
+    async def get_work_requests_after(self, request_id: int) -> list[dict]:
+        return self.chain.get_table(
+            'telos.gpu', 'telos.gpu', 'queue', lower_bound=request_id + 1)
+
+    def invalidate_status(self, request_id: int):
+        self.invalidated.add(request_id)
+
+
+def submit(chain: FakeTelosGPU, request_id: int, worker: str):
+    req = chain.queue[request_id]
+    chain.apply(
+        'workbegin',
+        {'worker': worker, 'request_id': request_id, 'max_workers': 2},
+        worker
+    )
+    chain.apply('submit', {
+        'worker': worker,
+        'request_id': request_id,
+        'request_hash': sha256(
+            (str(req['nonce']) + req['body'] + req['binary_data']).encode()
+        ).hexdigest(),
+        'result_hash': 'ff' * 32,
+        'ipfs_hash': 'Qm...'
+    }, worker)
+
+
+def queue_ids(snap: dict) -> list[int]:
+    return [req['id'] for req in snap['queue']]
+
+
+async def test_action_replay():
+    chain = make_chain()
+    conn = ChainConnector(chain)
+    ingester = SkynetQueueIngester(conn, resync_interval=3600)
+
+    # first update is a full resync
+    snap = await ingester.update()
+    assert snap['queue'] == []
+
+    rids = [await enqueue(FakeCLEOS(chain)) for _ in range(4)]
+    snap = await ingester.update()
+    assert queue_ids(snap) == rids
+    assert all(snap['requests'][rid] == [] for rid in rids)
+
+    chain.apply(
+        'workbegin',
+        {'worker': 'other', 'request_id': rids[0], 'max_workers': 2},
+        'other'
+    )
+    snap = await ingester.update()
+    assert [s['worker'] for s in snap['requests'][rids[0]]] == ['other']
+    assert rids[0] in conn.invalidated
+
+    chain.apply('workcancel', {
+        'worker': 'other', 'request_id': rids[0], 'reason': 'bored'}, 'other')
+    snap = await ingester.update()
+    assert snap['requests'][rids[0]] == []
+
+    # a competitor's result first so result row ids & request ids differ
+    submit(chain, rids[1], 'other')
+    submit(chain, rids[2], 'worker')
+    chain.apply(
+        'dequeue', {'user': 'telegram', 'request_id': rids[3]}, 'telegram')
+
+    snap = await ingester.update()
+    assert queue_ids(snap) == [rids[0]]
+    assert [r['request_id'] for r in snap['my_results']] == [rids[2]]
+
+    # nothing new, nothing applied twice
+    assert await ingester.update() == snap
+
+    # a resync reads the real result rows, same request ids
+    await ingester.resync()
+    assert [
+        (r['id'], r['request_id']) for r in ingester.snap['my_results']
+    ] == [(1, rids[2])]
+
+
+async def test_resync():
+    chain = make_chain()
+    conn = ChainConnector(chain)
+    ingester = SkynetQueueIngester(conn, resync_interval=3600)
+
+    rids = [await enqueue(FakeCLEOS(chain)) for _ in range(2)]
+    await ingester.update()
+
+    # drift gets corrected by the next full resync
+    ingester.snap['queue'] = []
+    ingester.resync_interval = 0
+    snap = await ingester.update()
+    assert queue_ids(snap) == rids
+
+    # failed results read, own submits must not break the updater
+    conn.results_fail = True
+    await ingester.resync()
+    assert ingester.snap['my_results'] is None
+
+    ingester.resync_interval = 3600
+    submit(chain, rids[0], 'other')
+    submit(chain, rids[1], 'worker')
+    snap = await ingester.update()
+    assert snap['queue'] == []
+    assert snap['my_results'] is None
+
+    conn.results_fail = False
+    await ingester.resync()
+    assert [r['request_id'] for r in ingester.snap['my_results']] == [rids[1]]
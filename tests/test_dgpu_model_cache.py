@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+from skynet.dgpu.model_cache import SkynetModelCache, fits_spare
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePipe:
+
+    def __init__(self, model: str, image: bool):
+        self.model = model
+        self.image = image
+
+
+SIZES = {'midj': 6, 'stable': 6, 'stablexl': 8.3, 'tiny': 2}
+
+
+def make_cache(budget: float, measured: dict = {}):
+    clock = FakeClock()
+    unloaded = []
+
+    def _load(model: str, image: bool):
+        return FakePipe(model, image), measured.get(model)
+
+    cache = SkynetModelCache(
+        budget,
+        load=_load,
+        unload=unloaded.extend,
+        size_of=lambda model, image: SIZES[model],
+        clock=clock
+    )
+    return cache, clock, unloaded
+
+
+def test_keeps_what_fits():
+    cache, _, unloaded = make_cache(14)
+
+    cache.get('midj', False)
+    cache.get('tiny', False)
+    cache.get('stable', False)
+
+    # 6 + 2 + 6 fits the 14 GB budget
+    assert len(cache) == 3
+    assert unloaded == []
+
+    pipe = cache.get('midj', False)
+    assert pipe.model == 'midj'
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_evicts_lowest_score():
+    cache, clock, unloaded = make_cache(12)
+
+    cache.get('midj', False)
+    for _ in range(5):
+        cache.get('midj', False)
+
+    clock.now = 10
+    cache.get('stable', False)
+
+    # midj is used more, stable goes out first
+    clock.now = 20
+    cache.get('tiny', False)
+    assert unloaded == [('stable', False)]
+    assert ('midj', False) in cache
+
+    # frequency decays, after a long idle time recency wins
+    clock.now = 20 + 600 * 5
+    cache.get('tiny', False)
+    cache.get('stablexl', False)
+    assert ('midj', False) not in cache
+    assert ('tiny', False) in cache
+    assert cache.evictions == 2
+
+
+def test_measured_size_over_estimate():
+    cache, _, unloaded = make_cache(12, measured={'stable': 9})
+
+    cache.get('midj', False)
+    cache.get('stable', False)
+
+    # estimated 6 + 6 fit, the measured 9 doesn't
+    assert cache.keys() == [('stable', False)]
+    assert cache.used == 9
+    assert unloaded == [('midj', False)]
+
+    stats = cache.stats()
+    assert stats['resident'][0]['size'] == 9
+    assert stats['misses'] == 2
+
+
+def test_ram_tier():
+    clock = FakeClock()
+    loads = []
+    moves = []
+
+    def _load(model: str, image: bool):
+        loads.append(model)
+        return FakePipe(model, image), None
+
+    def _offload(pipe):
+        moves.append(('ram', pipe.model))
+        return pipe
+
+    def _promote(pipe):
+        moves.append(('device', pipe.model))
+        return pipe
+
+    cache = SkynetModelCache(
+        6,
+        load=_load,
+        size_of=lambda model, image: SIZES[model],
+        clock=clock,
+        ram_budget=12,
+        offload=_offload,
+        promote=_promote
+    )
+
+    for model in ('midj', 'stable', 'midj', 'stable'):
+        clock.now += 1
+        cache.get(model, False)
+
+    # loaded from disk once each, the rest are ram <-> device moves
+    assert loads == ['midj', 'stable']
+    assert cache.promotions == 2
+    assert moves[-1] == ('device', 'stable')
+    assert cache.parked_keys() == [('midj', False)]
+
+    # ram tier full, a pipeline colder than everything parked is dropped
+    # instead of pushing out a hotter one
+    clock.now += 1
+    cache.get('tiny', False)
+    clock.now += 1
+    cache.get('stablexl', False)
+    assert cache.ram_used == 12
+    assert cache.parked_keys() == [('midj', False), ('stable', False)]
+    assert cache.drops == 1
+
+    # once idle for long enough the parked ones lose out to a hot one
+    for _ in range(3):
+        cache.get('stablexl', False)
+
+    clock.now += 600 * 5
+    cache.get('tiny', False)
+    assert ('stablexl', False) in cache.parked_keys()
+    assert cache.ram_used <= 12
+
+
+def test_fits_spare():
+    cache, _, _ = make_cache(14)
+
+    assert cache.fits_spare('stablexl', False)
+    cache.get('stablexl', False)
+
+    assert not cache.fits_spare('stablexl', False)
+    assert not cache.fits_spare('stable', False)
+    assert cache.fits_spare('tiny', False)
+
+    assert not fits_spare({}, 'tiny', False)
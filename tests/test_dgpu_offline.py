@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+# several daemons racing for one queue on the fake chain, publishing to the
+# fake ipfs node, no docker or network needed
+
+import json
+import time
+import logging
+
+from hashlib import sha256
+
+import trio
+import pytest
+
+# the daemon needs the cuda stack & the connector leap, the model manager &
+# the chain are faked
+pytest.importorskip('torch')
+pytest.importorskip('leap')
+
+from skynet.fakechain import FakeCLEOS
+from skynet.ipfs.fake import open_fake_ipfs_node
+
+from fakes import (
+    PARAMS,
+    FakeMM,
+    make_chain,
+    enqueue,
+    make_daemon,
+    run_daemon,
+    wait_for
+)
+
+
+REQUESTS = 12
+
+
+async def test_daemons_race(tmp_path, monkeypatch):
+    from skynet.dgpu import daemon as daemon_module
+    monkeypatch.setattr(daemon_module, 'DEFAULT_OUTBOX_INTERVAL', 0.05)
+
+    # the connector stages publishes on the working dir
+    monkeypatch.chdir(tmp_path)
+
+    chain = make_chain()
+    async with open_fake_ipfs_node(latency=0.01) as node:
+        daemons = []
+        for i in range(3):
+            # a flaky node per worker, failed submits go through the outbox
+            daemon = make_daemon(
+                chain, tmp_path, [FakeMM()],
+                account=f'testworker{i + 1}',
+                cleos=FakeCLEOS(chain, latency=0.01, failure_rate=0.1, seed=i),
+                ipfs_url=node.url,
+                ingest='actions' if i == 0 else 'snapshot'
+            )
+            daemon.outbox.backoff = 0.05
+            daemons.append(daemon)
+
+        start = time.time()
+        async with (
+            run_daemon(daemons[0]),
+            run_daemon(daemons[1]),
+            run_daemon(daemons[2])
+        ):
+            cleos = FakeCLEOS(chain)
+            rids = [
+                await enqueue(
+                    cleos,
+                    reward='5.0000 GPU',
+                    body=json.dumps({
+                        'method': 'diffuse',
+                        'params': {**PARAMS, 'seed': seed}
+                    })
+                )
+                for seed in range(REQUESTS)
+            ]
+
+            await wait_for(lambda: not chain.queue, timeout=20)
+            await wait_for(
+                lambda: all(len(daemon.outbox) == 0 for daemon in daemons),
+                timeout=20
+            )
+
+        elapsed = time.time() - start
+        logging.info(f'{REQUESTS} requests in {elapsed:.2f}s')
+
+        # one result per request, the output it points at is pinned
+        results = {
+            result['request_id']: result for result in chain.results.values()}
+        assert sorted(results) == rids
+
+        for seed, rid in enumerate(rids):
+            result = results[rid]
+            output = f'{PARAMS["model"]}:{PARAMS["prompt"]}:{seed}'.encode()
+            assert result['result_hash'] == sha256(output).hexdigest()
+            assert node.files[result['ipfs_hash']] == output
+            assert result['ipfs_hash'] in node.pins
+
+        # rewards went to whoever submitted
+        assert sum(
+            float(chain.balance(f'testworker{i + 1}').split(' ')[0])
+            for i in range(3)
+        ) == 5 * REQUESTS
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+
+import trio
+
+from skynet.dgpu.outbox import SkynetOutbox
+
+
+def test_replay_after_restart(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+
+    outbox = SkynetOutbox(path)
+    outbox.add_submit(1, 'a' * 64, 'b' * 64, 'png', b'image')
+    outbox.add_submit(2, 'c' * 64, 'd' * 64, 'png', b'image')
+    outbox.set_ipfs_hash(2, 'QmHash')
+    outbox.add_cancel(3, 'out of memory')
+    outbox.remove(1)
+    outbox.close()
+
+    outbox = SkynetOutbox(path)
+    assert len(outbox) == 2
+    assert 1 not in outbox
+
+    submit, cancel = outbox.pending()
+    assert submit['action'] == 'submit'
+    assert submit['ipfs_hash'] == 'QmHash'
+    assert submit['output'] == None
+    assert cancel['action'] == 'cancel'
+    assert cancel['reason'] == 'out of memory'
+
+
+def test_backoff():
+    outbox = SkynetOutbox(':memory:', backoff=2, max_backoff=10)
+    outbox.add_submit(1, 'a' * 64, 'b' * 64, 'png', b'image')
+
+    delays = []
+    for _ in range(5):
+        outbox.retry_later(1, now=100)
+        delays.append(outbox.get(1)['next_attempt'] - 100)
+
+    assert delays == [2, 4, 8, 10, 10]
+
+    # giving up on the submit resets the backoff for the cancel, retrying
+    # the cancel keeps it
+    outbox.add_cancel(1, 'failed to submit')
+    assert outbox.get(1)['attempts'] == 0
+
+    outbox.retry_later(1, now=100)
+    outbox.add_cancel(1, 'failed to submit')
+    assert outbox.get(1)['attempts'] == 1
+
+
+async def test_writes_off_loop(tmp_path):
+    outbox = SkynetOutbox(str(tmp_path / 'outbox.db'))
+
+    async def _journal(rid: int):
+        await trio.to_thread.run_sync(
+            outbox.add_submit, rid, 'a' * 64, 'b' * 64, 'png', b'x' * 2 ** 20)
+        await trio.to_thread.run_sync(outbox.retry_later, rid)
+        await trio.to_thread.run_sync(outbox.set_ipfs_hash, rid, f'Qm{rid}')
+
+    # workers share the connection, nothing is lost or interleaved
+    async with trio.open_nursery() as n:
+        for rid in range(16):
+            n.start_soon(_journal, rid)
+
+    rows = await trio.to_thread.run_sync(outbox.pending)
+    assert [row['rid'] for row in rows] == list(range(16))
+    assert all(
+        row['ipfs_hash'] == f'Qm{row["rid"]}' and
+        row['attempts'] == 1 and
+        row['output'] == None
+        for row in rows
+    )
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+
+import io
+
+import pytest
+
+from PIL import Image
+
+# inputs are cropped with skynet.utils, which needs the cuda dependencies
+pytest.importorskip('torch')
+
+from skynet.dgpu.errors import DGPUComputeError
+from skynet.dgpu.prefetch import SkynetInputPrefetcher
+
+
+PARAMS = {'width': 512, 'height': 512}
+
+
+def png_bytes(size: tuple[int, int] = (640, 640)) -> bytes:
+    buf = io.BytesIO()
+    Image.new('RGB', size, color='red').save(buf, format='PNG')
+    return buf.getvalue()
+
+
+# serves `get_input_data` from a dict of raw files
+class InputConnector:
+
+    def __init__(self, files: dict[str, bytes]):
+        self.files = files
+        self.reads = []
+
+    async def get_input_data(self, ipfs_hash: str):
+        self.reads.append(ipfs_hash)
+        if ipfs_hash not in self.files:
+            raise DGPUComputeError('Couldn\'t gather input data from ipfs')
+
+        # like the connector, decoding is lazy
+        return Image.open(io.BytesIO(self.files[ipfs_hash])), 'png'
+
+
+async def test_prefetch_hit():
+    conn = InputConnector({'QmGood': png_bytes()})
+    prefetcher = SkynetInputPrefetcher(conn)
+
+    await prefetcher.prefetch([('QmGood', PARAMS)])
+    image, input_type = await prefetcher.get('QmGood', PARAMS)
+
+    assert input_type == 'png'
+    assert image.size == (512, 512)
+    assert conn.reads == ['QmGood']
+    assert (prefetcher.hits, prefetcher.misses) == (1, 0)
+
+    assert await prefetcher.get('', PARAMS) == (b'', 'none')
+
+
+async def test_bad_inputs():
+    conn = InputConnector({'QmTruncated': png_bytes()[:-64]})
+    prefetcher = SkynetInputPrefetcher(conn)
+
+    # background failures are only logged
+    await prefetcher.prefetch([('QmTruncated', PARAMS), ('QmMissing', PARAMS)])
+
+    # a claim gets a compute error for corrupt & unreachable inputs alike
+    with pytest.raises(DGPUComputeError, match='truncated'):
+        await prefetcher.get('QmTruncated', PARAMS)
+
+    with pytest.raises(DGPUComputeError):
+        await prefetcher.get('QmMissing', PARAMS)
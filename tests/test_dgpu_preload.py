@@ -0,0 +1,55 @@
+#!/usr/bin/python
+
+from skynet.dgpu.preload import SkynetModelPreloader
+
+from fakes import make_entry
+
+
+def test_choose_by_queue_mix_and_rate():
+    preloader = SkynetModelPreloader(rate_decay=0.5)
+
+    assert preloader.choose(lambda key: False) is None
+
+    preloader.update([
+        make_entry(0, 'midj'),
+        make_entry(1, 'stable'),
+        make_entry(2, 'stable')
+    ])
+    assert preloader.choose(lambda key: False) == ('stable', False)
+
+    # already loaded somewhere, next best
+    assert preloader.choose(
+        lambda key: key == ('stable', False)) == ('midj', False)
+
+    # stable requests got served, midj keeps coming in
+    for rid in range(3, 6):
+        preloader.update([make_entry(rid, 'midj')])
+
+    scores = preloader.scores()
+    assert scores[('midj', False)] > scores[('stable', False)]
+    assert preloader.choose(lambda key: False) == ('midj', False)
+
+    # rates decay once nothing new shows up
+    for _ in range(16):
+        preloader.update([])
+
+    assert preloader.choose(lambda key: False) == ('midj', False)
+    assert preloader.scores()[('stable', False)] < 0.01
+
+    # image requests need a different pipeline
+    preloader.update([make_entry(6, 'midj', image=True)] * 2)
+    assert ('midj', True) in preloader.scores()
+
+
+def test_hit_rate():
+    preloader = SkynetModelPreloader()
+
+    preloader.preloaded(('midj', False))
+    preloader.preloaded(('stable', False))
+
+    assert preloader.claimed(('midj', False))
+    # only the first job on a preloaded model counts
+    assert not preloader.claimed(('midj', False))
+    assert not preloader.claimed(('stablexl', False))
+
+    assert preloader.stats() == {'preloads': 2, 'hits': 1, 'hit_rate': 0.5}
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+import os
+
+import trio
+
+from skynet.dgpu.result_cache import SkynetResultCache, result_key
+
+
+PARAMS = {'prompt': 'skynet', 'seed': 420, 'step': 28}
+
+
+def test_key_is_canonical():
+    a = result_key('diffuse', PARAMS, '')
+    b = result_key('diffuse', dict(reversed(PARAMS.items())), '')
+    assert a == b
+    assert a != result_key('diffuse', {**PARAMS, 'seed': 421}, '')
+    assert a != result_key('diffuse', PARAMS, 'QmInput')
+
+
+def test_lru_eviction_and_reload(tmp_path):
+    cache = SkynetResultCache(str(tmp_path), max_bytes=250)
+
+    for i in range(3):
+        cache.put(f'k{i}', bytes(100), f'hash{i}', 'png')
+        # mtime resolution, make recency explicit
+        os.utime(tmp_path / f'k{i}.out', (i, i))
+
+    # two fit, the oldest went out
+    assert len(cache) == 2
+    assert cache.get('k0') == None
+
+    # touching k1 makes k2 the next one out
+    cached = cache.get('k1')
+    assert cached['output_hash'] == 'hash1'
+    assert cached['output'] == bytes(100)
+
+    cache.set_ipfs_hash('k1', 'QmOutput')
+    cache.put('k3', bytes(100), 'hash3', 'png')
+    assert 'k2' not in cache
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache = SkynetResultCache(str(tmp_path), max_bytes=250)
+    assert len(cache) == 2
+    assert cache.get('k1')['ipfs_hash'] == 'QmOutput'
+
+
+def test_disabled(tmp_path):
+    cache = SkynetResultCache(str(tmp_path / 'cache'), max_bytes=0)
+    cache.put('k', b'out', 'hash', 'png')
+    assert cache.get('k') == None
+    assert not (tmp_path / 'cache').exists()
+
+
+async def test_threaded_puts(tmp_path):
+    cache = SkynetResultCache(str(tmp_path), max_bytes=1000)
+
+    async def _put(i: int):
+        await trio.to_thread.run_sync(
+            cache.put, f'k{i}', bytes(100), f'hash{i}', 'png')
+        await trio.to_thread.run_sync(cache.set_ipfs_hash, f'k{i}', f'Qm{i}')
+
+    async with trio.open_nursery() as n:
+        for i in range(32):
+            n.start_soon(_put, i)
+
+    # eviction bookkeeping stays in step with the files on disk
+    assert len(cache) == 10
+    assert cache.size == 1000
+    assert len(list(tmp_path.glob('*.out'))) == 10
+    for key in list(cache._entries):
+        assert cache.get(key)['ipfs_hash'] == f'Qm{key[1:]}'
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+import json
+
+from pytest import approx
+
+from skynet.dgpu.scheduler import (
+    QUEUE_WINDOW,
+    SkynetCostModel,
+    SkynetProfitScheduler
+)
+
+from fakes import make_entry
+
+
+# one megapixel, 20 steps
+PARAMS = {
+    'width': 1000,
+    'height': 1000,
+    'step': 20,
+    'upscaler': None
+}
+
+
+def test_estimate():
+    model = SkynetCostModel()
+
+    assert model.estimate('midj', PARAMS, False) == approx(2.0)
+    assert model.estimate(
+        'midj', {**PARAMS, 'upscaler': 'x4'}, False) == approx(3.5)
+    assert model.estimate('midj', PARAMS, False, loaded=False) == approx(22.0)
+
+    # img2img only runs the noised part of the schedule
+    assert model.estimate(
+        'midj', {**PARAMS, 'strength': 0.5}, True) == approx(1.0)
+
+    # every image of a batch request is computed & upscaled
+    assert model.estimate(
+        'midj', {**PARAMS, 'num_images': 4, 'upscaler': 'x4'}, False
+    ) == approx(14.0)
+
+
+def test_observe():
+    model = SkynetCostModel(learning_rate=0.5)
+
+    # 0.2s per step per megapixel, moves halfway from the 0.1 default
+    model.observe('midj', PARAMS, False, 4.0)
+    assert model.step_seconds['midj'] == approx(0.15)
+    assert model.estimate('midj', PARAMS, False) == approx(3.0)
+
+    # on a cold model the time not explained by compute goes to the swap
+    model.observe('midj', PARAMS, False, 13.0, loaded=False)
+    assert model.step_seconds['midj'] == approx(0.15)
+    assert model.swap_seconds['midj'] == approx(15.0)
+
+    assert 'sd' not in model.step_seconds
+
+    # the same per image speed on a 4 image request leaves it unchanged
+    model.observe('midj', {**PARAMS, 'num_images': 4}, False, 12.0)
+    assert model.step_seconds['midj'] == approx(0.15)
+
+
+def test_observe_upscaler():
+    model = SkynetCostModel(learning_rate=0.5)
+    upscaled = {**PARAMS, 'upscaler': 'x4'}
+
+    # 2s of diffusion at the default step figure, the other 4.5s are the
+    # upscaler's, moves halfway from the 1.5 default
+    model.observe('midj', upscaled, False, 6.5)
+    assert model.upscale_seconds == approx(3.0)
+    assert 'midj' not in model.step_seconds
+    assert model.estimate('midj', upscaled, False) == approx(5.0)
+
+
+def test_save_throttled(tmp_path):
+    path = tmp_path / 'cost.json'
+    model = SkynetCostModel(path=str(path), save_interval=3600)
+
+    model.observe('midj', PARAMS, False, 4.0)
+    assert not path.exists()
+
+    model.save()
+    model.observe('midj', PARAMS, False, 4.0)
+    saved = json.loads(path.read_text())
+    assert saved['step_seconds']['midj'] != model.step_seconds['midj']
+
+    model.save_interval = 0
+    model.observe('midj', PARAMS, False, 4.0)
+    assert SkynetCostModel(path=str(path)).step_seconds == model.step_seconds
+
+
+def test_rank():
+    loaded = {'midj'}
+    scheduler = SkynetProfitScheduler(
+        SkynetCostModel(), lambda model, image: model in loaded)
+
+    entries = [
+        # 2s, 10 per second
+        make_entry(0, reward=20, **PARAMS),
+        # 4s, 15 per second
+        make_entry(1, reward=60, **{**PARAMS, 'step': 40}),
+        # 22s with the swap, ~4.5 per second
+        make_entry(2, model='sd', reward=100, **PARAMS),
+        # can't be estimated
+        make_entry(3, reward=1000, **{**PARAMS, 'step': 'many'}),
+        # would finish after leaving the queue
+        make_entry(4, reward=1000, age=QUEUE_WINDOW - 1, **PARAMS),
+        # 8s for all 4 images, 7.5 per second
+        make_entry(5, reward=60, num_images=4, **PARAMS)
+    ]
+    assert [entry['id'] for entry in scheduler.rank(entries)] == [1, 0, 5, 2]
+
+    loaded.add('sd')
+    assert [entry['id'] for entry in scheduler.rank(entries)] == [2, 1, 0, 5]
+
+
+def test_rank_cached():
+    loaded = {'midj'}
+    scheduler = SkynetProfitScheduler(
+        SkynetCostModel(), lambda model, image: model in loaded)
+
+    estimates = []
+    estimate = scheduler.estimate
+
+    def _counted(entry: dict) -> float:
+        estimates.append(entry['id'])
+        return estimate(entry)
+
+    scheduler.estimate = _counted
+
+    entries = [
+        make_entry(0, reward=20, **PARAMS),
+        make_entry(1, model='sd', reward=100, **PARAMS)
+    ]
+    assert [entry['id'] for entry in scheduler.rank(entries)] == [0, 1]
+    assert estimates == [0, 1]
+
+    # nothing changed, nothing re-estimated
+    scheduler.rank(entries)
+    assert estimates == [0, 1]
+
+    # only the request whose model got loaded is
+    loaded.add('sd')
+    assert [entry['id'] for entry in scheduler.rank(entries)] == [1, 0]
+    assert estimates == [0, 1, 1]
+
+    # new figures re-estimate everything, gone requests are dropped
+    scheduler.observe(entries[0], 4.0, True)
+    assert [entry['id'] for entry in scheduler.rank(entries[:1])] == [0]
+    assert estimates == [0, 1, 1, 0]
+    assert list(scheduler._scores) == [0]
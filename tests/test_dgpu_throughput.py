@@ -0,0 +1,42 @@
+#!/usr/bin/python
+
+from array import array
+
+from skynet.dgpu.throughput import SkynetThroughputEstimator, percentile
+
+
+PARAMS = {'width': 512, 'height': 512, 'upscaler': None}
+
+
+def test_window_is_bounded():
+    estimator = SkynetThroughputEstimator(window=4)
+
+    # 10 steps per job, at 1..8 steps per second
+    for speed in range(1, 9):
+        timings = array('d', [i / speed for i in range(11)])
+        estimator.observe('midj', PARAMS, timings, 10 / speed)
+
+    stats = estimator.stats('midj', PARAMS)
+    assert stats['jobs'] == 8
+    assert stats['steps_per_second']['p50'] == 6
+    assert stats['steps_per_second']['p99'] == 8
+    assert estimator.last_speed == 8
+
+    assert estimator.stats('midj', {**PARAMS, 'width': 1024}) == None
+
+
+def test_cancelled_job_timings():
+    estimator = SkynetThroughputEstimator()
+
+    # a job cancelled before its first step has no speed to report
+    estimator.observe('midj', PARAMS, array('d', [0.]), 0.5)
+
+    assert estimator.last_speed == 0
+    assert estimator.summary()[0]['steps_per_second']['mean'] == 0
+    assert estimator.job_seconds('midj', PARAMS) == 0.5
+
+
+def test_percentile():
+    assert percentile([], 50) == 0
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(range(1, 101), 90) == 90
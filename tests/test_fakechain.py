@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+from hashlib import sha256
+
+import trio
+
+from skynet.fakechain import FakeCLEOS, FakeHyperion
+
+from fakes import make_chain, enqueue
+
+
+async def test_request_lifecycle():
+    chain = make_chain()
+    cleos = FakeCLEOS(chain)
+
+    request_id = await enqueue(cleos)
+    assert chain.balance('telegram') == '80.0000 GPU'
+
+    queue = await cleos.aget_table('telos.gpu', 'telos.gpu', 'queue')
+    assert len(queue) == 1
+    req = queue[0]
+
+    res = await cleos.a_push_action(
+        'telos.gpu', 'workbegin',
+        {'worker': 'testworker1', 'request_id': request_id, 'max_workers': 2},
+        'testworker1', 'key'
+    )
+    assert 'code' not in res
+
+    statuses = await cleos.aget_table('telos.gpu', request_id, 'status')
+    assert [s['worker'] for s in statuses] == ['testworker1']
+
+    # a wrong request hash is refused
+    submit = {
+        'worker': 'testworker1',
+        'request_id': request_id,
+        'request_hash': 'ff' * 32,
+        'result_hash': 'aa' * 32,
+        'ipfs_hash': 'QmResult'
+    }
+    res = await cleos.a_push_action(
+        'telos.gpu', 'submit', submit, 'testworker1', 'key')
+    assert res['code'] == 500
+
+    submit['request_hash'] = sha256(
+        (str(req['nonce']) + req['body'] + req['binary_data']).encode()
+    ).hexdigest()
+    res = await cleos.a_push_action(
+        'telos.gpu', 'submit', submit, 'testworker1', 'key')
+    assert 'code' not in res
+
+    assert await cleos.aget_table('telos.gpu', 'telos.gpu', 'queue') == []
+    assert chain.balance('testworker1') == '20.0000 GPU'
+
+    results = await cleos.aget_table(
+        'telos.gpu', 'telos.gpu', 'results',
+        index_position=4,
+        key_type='name',
+        lower_bound='testworker1',
+        upper_bound='testworker1'
+    )
+    assert [r['request_id'] for r in results] == [request_id]
+
+    actions = await FakeHyperion(chain).aget_actions(
+        account='telegram', filter='telos.gpu:submit', sort='desc')
+    assert actions['actions'][0]['act']['data']['ipfs_hash'] == 'QmResult'
+
+
+async def test_dequeue_refunds():
+    chain = make_chain()
+    cleos = FakeCLEOS(chain)
+
+    request_id = await enqueue(cleos)
+    res = await cleos.a_push_action(
+        'telos.gpu', 'dequeue',
+        {'user': 'telegram', 'request_id': request_id},
+        'telegram', 'key'
+    )
+    assert 'code' not in res
+    assert chain.balance('telegram') == '100.0000 GPU'
+    assert chain.queue == {}
+
+
+async def test_max_workers_race():
+    chain = make_chain()
+    request_id = await enqueue(FakeCLEOS(chain))
+
+    won = []
+
+    async def _claim(worker: str):
+        cleos = FakeCLEOS(chain, latency=0.05)
+        res = await cleos.a_push_action(
+            'telos.gpu', 'workbegin',
+            {'worker': worker, 'request_id': request_id, 'max_workers': 2},
+            worker, 'key'
+        )
+        if 'code' not in res:
+            won.append(worker)
+
+    async with trio.open_nursery() as n:
+        for i in range(5):
+            n.start_soon(_claim, f'testworker{i}')
+
+    assert len(won) == 2
+    assert len(chain.status[request_id]) == 2
+
+
+async def test_failure_injection():
+    chain = make_chain()
+    cleos = FakeCLEOS(chain, failure_rate=0.5, seed=1)
+
+    failures = 0
+    for _ in range(100):
+        try:
+            await cleos.aget_table('telos.gpu', 'telos.gpu', 'config')
+
+        except OSError:
+            failures += 1
+
+    assert failures == cleos.failures
+    assert 30 < failures < 70
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+import time
+
+from skynet.ipfs import AsyncIPFSHTTP, get_ipfs_file
+from skynet.ipfs.fake import open_fake_ipfs_node, cid_v0, unixfs_directory
+
+
+def test_cid_v0():
+    # `echo 'hello world' | ipfs add`
+    assert cid_v0(b'hello world\n') == 'QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o'
+    assert cid_v0(b'') == 'QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH'
+
+
+async def test_add_pin_and_gateway(tmp_path):
+    test_file = tmp_path / 'hello_world.txt'
+    test_file.write_text('hello world\n')
+
+    async with open_fake_ipfs_node() as node:
+        client = AsyncIPFSHTTP(node.url)
+
+        file_info = await client.add(test_file)
+        file_cid = file_info['Hash']
+        assert file_cid == 'QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o'
+        assert file_info['Name'] == 'hello_world.txt'
+
+        assert file_cid in await client.pin(file_cid)
+
+        resp = await get_ipfs_file(f'{node.url}/ipfs/{file_cid}', timeout=1)
+        assert resp.status_code == 200
+        assert resp.raw == b'hello world\n'
+
+        resp = await get_ipfs_file(f'{node.url}/ipfs/{cid_v0(b"nope")}', timeout=1)
+        assert resp.status_code == 404
+
+
+async def test_add_directory(tmp_path):
+    # `ipfs add -w` of an empty dir
+    assert unixfs_directory({})[0] == 'QmUNLLsPACCz1vLxQVkXqqLX5R1X345qqfHbsf67hvA3Nn'
+
+    paths = []
+    for i in range(2):
+        path = tmp_path / f'image-{i}.png'
+        path.write_bytes(f'image {i}'.encode())
+        paths.append(path)
+
+    async with open_fake_ipfs_node() as node:
+        client = AsyncIPFSHTTP(node.url)
+
+        dir_info = await client.add_directory(paths)
+        dir_cid = dir_info['Hash']
+        assert dir_info['Name'] == ''
+        assert dir_cid in await client.pin(dir_cid)
+
+        for i in range(2):
+            resp = await get_ipfs_file(
+                f'{node.url}/ipfs/{dir_cid}/image-{i}.png', timeout=1)
+            assert resp.status_code == 200
+            assert resp.raw == f'image {i}'.encode()
+
+        resp = await get_ipfs_file(
+            f'{node.url}/ipfs/{dir_cid}/image-2.png', timeout=1)
+        assert resp.status_code == 404
+
+
+async def test_swarm():
+    peer = '12D3KooWKWogLFNEcNNMKnzU7Snrnuj84RZdMBg3sLiQSQc51oEv'
+    async with open_fake_ipfs_node() as node:
+        client = AsyncIPFSHTTP(node.url)
+        await client.connect(f'/ip4/169.197.140.154/tcp/4001/p2p/{peer}')
+        assert peer in [p['Peer'] for p in await client.peers()]
+
+
+async def test_bandwidth():
+    async with open_fake_ipfs_node(bandwidth=1024 * 1024) as node:
+        cid, _ = node.add_bytes(bytes(512 * 1024))
+
+        start = time.time()
+        resp = await get_ipfs_file(f'{node.url}/ipfs/{cid}', timeout=1)
+        elapsed = time.time() - start
+
+        assert len(resp.raw) == 512 * 1024
+        assert elapsed >= 0.45